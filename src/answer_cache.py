@@ -0,0 +1,143 @@
+'''
+시맨틱 답변 캐시 (Streamlit 채팅용)
+들어온 질문을 임베딩해서 이전에 답변한 질문과 코사인 유사도가 threshold 이상이면
+저장된 답변과 참고 문서를 그대로 반환합니다. (검색 → self-check → rewrite → 생성 전체 생략)
+- TTL이 지난 항목은 사용하지 않음
+- max_entries 초과 시 가장 오래 사용하지 않은 항목부터 제거 (LRU)
+- 인덱스(벡터스토어) 버전이 바뀌면 전체 무효화
+'''
+
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from cache_utils import CacheStats, normalize_query
+
+
+class SemanticAnswerCache:
+    """질문 임베딩 유사도 기반 답변 캐시"""
+
+    def __init__(self, embeddings, threshold: float = 0.95, max_entries: int = 500,
+                 ttl: Optional[float] = 24 * 3600, index_version: Optional[str] = None):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.index_version = index_version
+
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._matrix = None          # 저장된 질문 벡터 (정규화, 행 = 항목)
+        self._matrix_keys: List[str] = []
+        self._lock = threading.Lock()
+        self.stats = CacheStats("hits", "misses", "invalidations")
+        self.saved_seconds = 0.0
+
+    # ---------------------------
+    # 내부 유틸
+    # ---------------------------
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(normalize_query(question)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _rebuild_matrix(self):
+        """항목이 바뀌었을 때만 유사도 계산용 행렬 재생성 (lock 안에서 호출)"""
+        self._matrix_keys = list(self._entries.keys())
+        self._matrix = np.stack([self._entries[k]["vector"] for k in self._matrix_keys]) if self._matrix_keys else None
+
+    def _is_expired(self, entry: dict) -> bool:
+        return self.ttl is not None and time.time() - entry["created_at"] > self.ttl
+
+    # ---------------------------
+    # 공개 API
+    # ---------------------------
+    def set_index_version(self, version: Optional[str]):
+        """인덱스 버전이 바뀌면 저장된 답변 전체 무효화"""
+        with self._lock:
+            if version != self.index_version:
+                if self._entries:
+                    self.stats.incr("invalidations")
+                self._entries.clear()
+                self._matrix = None
+                self._matrix_keys = []
+                self.index_version = version
+
+    def lookup(self, question: str, threshold: Optional[float] = None) -> Optional[dict]:
+        """
+        유사한 질문의 답변이 있으면 {'answer', 'docs', 'similarity', 'question'} 반환, 없으면 None
+        threshold: 이번 조회에만 쓸 유사도 기준 (마감 시간이 지나 대체 답변을 찾을 때 더 낮게)
+        """
+        start = time.perf_counter()
+        vector = self._embed(question)
+
+        with self._lock:
+            if self._matrix is None:
+                self.stats.incr("misses")
+                return None
+
+            similarities = self._matrix @ vector
+            best = int(np.argmax(similarities))
+            key = self._matrix_keys[best]
+            entry = self._entries.get(key)
+
+            if entry is None or similarities[best] < (self.threshold if threshold is None else threshold):
+                self.stats.incr("misses")
+                return None
+
+            if self._is_expired(entry):
+                del self._entries[key]
+                self._rebuild_matrix()
+                self.stats.incr("misses")
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats.incr("hits")
+            # 캐시로 절약한 시간 = 원래 파이프라인 시간 - 조회 시간
+            self.saved_seconds += max(0.0, entry["latency"] - (time.perf_counter() - start))
+
+            return {
+                "answer": entry["answer"],
+                "docs": list(entry["docs"]),
+                "similarity": float(similarities[best]),
+                "question": entry["question"],
+            }
+
+    def put(self, question: str, answer: str, docs: List[Document], latency: float = 0.0):
+        """파이프라인으로 생성한 답변 저장 (latency: 생성에 걸린 시간, 절약 시간 계산용)"""
+        vector = self._embed(question)
+        key = normalize_query(question)
+
+        with self._lock:
+            self._entries[key] = {
+                "question": question,
+                "vector": vector,
+                "answer": answer,
+                "docs": list(docs),
+                "latency": latency,
+                "created_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._rebuild_matrix()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._rebuild_matrix()
+
+    def metrics(self) -> dict:
+        """적중률 / 절약한 시간 지표"""
+        counts = self.stats.as_dict()
+        lookups = counts["hits"] + counts["misses"]
+        return {
+            **counts,
+            "hit_rate": counts["hits"] / lookups if lookups else 0.0,
+            "saved_seconds": self.saved_seconds,
+            "entries": len(self._entries),
+            "index_version": self.index_version,
+        }
@@ -0,0 +1,368 @@
+'''
+RAG 파이프라인 비동기 HTTP API (FastAPI)
+- 모델/인덱스/그래프는 서버 시작 시 한 번만 로드하고 모든 요청이 공유 (rag_service.py와 같은 구성)
+- POST /ask          : 질문 -> 답변 + 참고 문서 + 단계별 소요 시간 (JSON)
+- POST /ask/stream   : 답변을 토큰 단위로 스트리밍 (Server-Sent Events: token / done / error 이벤트)
+- GET  /ready        : 로드 완료 여부 (준비 전 503), GET /health: 프로세스 생존 확인
+- GET  /metrics      : 로컬 계측 Prometheus 텍스트 (instrumentation.py)
+- 질문 임베딩 마이크로 배칭 (query_batcher.py): 동시에 들어온 질문을 모아 한 번에 인코딩
+  (API_QUERY_BATCH=0이면 끄기, API_BATCH_MAX_SIZE / API_BATCH_MAX_WAIT_MS)
+- POST /ingest       : 새 상담기록 증분 반영 (임베딩 -> Chroma upsert -> BM25 / 질병명 인덱스 교체, 재시작 없음, index_updater.py)
+  다른 프로세스(ingest_records.py)가 추가한 상담기록은 INDEX_SYNC_INTERVAL초마다 확인해서 반영
+- 자주 묻는 질문은 미리 만든 답변(faq_answers.py, FAQ_ANSWERS=1)을 답변 캐시보다 먼저 확인 (use_cache=false면 둘 다 생략)
+
+동시 처리 제한: 파이프라인(검색/LLM 호출)은 스레드에서 실행하고, 동시에 실행 중인 요청은 API_MAX_CONCURRENCY개까지.
+자리가 API_QUEUE_TIMEOUT초 안에 나지 않으면 503.
+요청별 제한 시간: deadline_s (기본 API_DEADLINE_S) 안에 끝나지 않으면 504. (스트리밍은 error 이벤트 후 종료, 생성 중단)
+제한 시간이 지나도 이미 시작한 스레드 작업은 끝날 때까지 동시 처리 자리를 차지합니다. (실제 부하 기준으로 제한)
+OpenAI 호출은 프로세스 공용 조절기(llm_governor.py)를 거치고, 재시도 후에도 사용량 한도(429)면 429 응답. (/ready의 openai)
+파이프라인에는 제한 시간보다 API_DEADLINE_MARGIN_S(기본 1초) 앞선 마감 시간을 주어, 504 전에
+self-check / rewrite 생략, context 축소, 대체 답변(캐시 / 검색 문서)으로 응답합니다. (적용 항목: 응답의 degraded)
+
+실행: uvicorn api_server:app --host 0.0.0.0 --port 8000
+      (또는 python api_server.py)
+'''
+
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, suppress
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from langchain_core.output_parsers import StrOutputParser
+from pydantic import BaseModel
+
+from answer_cache import SemanticAnswerCache
+from deadline import Deadline
+from instrumentation import METRICS, configure_metrics, stage, trace_request
+from llm_governor import get_governor, is_rate_limit_error
+from metadata_filter import detect_filters
+from prompt_module import filter_docs_by_response, get_rag_prompt, initialize_rag_system
+from query_batcher import enable_query_batching
+from rag_components import setup_langsmith, warm_up
+from rag_graph import NO_DOCS_ANSWER, run_rag_graph
+from rag_service import (INDEX_SYNC_INTERVAL, attach_index_updater, build_service_graph, load_faq_answers,
+                         make_fallback_answer, retrieval_options, stream_generation)
+
+load_dotenv()
+
+VECTORSTORE_PATH = os.getenv("VECTORSTORE_PATH", r"..\data\ChromaDB_bge_m3")
+COLLECTION_NAME = os.getenv("COLLECTION_NAME", "pet_health_qa_system_bge_m3")
+MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "8"))
+QUEUE_TIMEOUT = float(os.getenv("API_QUEUE_TIMEOUT", "5"))
+DEFAULT_DEADLINE = float(os.getenv("API_DEADLINE_S", "60"))
+DEADLINE_MARGIN = float(os.getenv("API_DEADLINE_MARGIN_S", "1"))
+QUERY_BATCH = os.getenv("API_QUERY_BATCH", "1") == "1"
+BATCH_MAX_SIZE = int(os.getenv("API_BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.getenv("API_BATCH_MAX_WAIT_MS", "5"))
+RATE_LIMIT_DETAIL = "OpenAI 사용량 한도에 걸렸습니다. 잠시 후 다시 시도해주세요."
+
+
+class AskRequest(BaseModel):
+    question: str
+    # 메타데이터 필터 (metadata_filter.py 형식). None이면 질문에서 자동 감지
+    filters: Optional[dict] = None
+    deadline_s: Optional[float] = None
+    use_cache: bool = True
+
+
+class IngestRequest(BaseModel):
+    # 상담기록 리스트 (preprocessing.py와 같은 {"meta": {...}, "qa": {"input", "output"}} 형식, "id" 선택)
+    records: List[dict]
+
+
+class AskResponse(BaseModel):
+    answer: str
+    docs: list
+    transformed: Optional[str] = None
+    timings: dict = {}
+    cached: bool = False
+    degraded: list = []
+
+
+# ---------------------------
+# 공유 자원 (서버 시작 시 1회 로드)
+# ---------------------------
+class RAGServer:
+    def __init__(self):
+        self.ready = False
+        self.load_error: Optional[str] = None   # 시작 시 로드 실패 (/ready에 표시)
+        self.rag_system = None
+        self.graph = None
+        self.rag_chain = None
+        self.answer_cache = None
+        self.faq_answers = None
+        self.index_updater = None
+        self.query_encoder = None
+        self.semaphore: Optional[asyncio.Semaphore] = None  # 서버 이벤트 루프에서 생성 (lifespan)
+        self.in_flight = 0
+
+    def load(self, rag_system: Optional[dict] = None, vectorstore_path: str = VECTORSTORE_PATH):
+        """rag_system을 주면 그 구성 요소를 그대로 사용 (부하 테스트의 가짜 모델 등)"""
+        if rag_system is None:
+            setup_langsmith()
+            configure_metrics(log_path=os.getenv("RAG_METRICS_LOG", r"..\output\request_metrics.jsonl"))
+            rag_system = initialize_rag_system(vectorstore_path=vectorstore_path, collection_name=COLLECTION_NAME,
+                                               **retrieval_options())
+        self.rag_system = rag_system
+        if QUERY_BATCH:
+            self.query_encoder = enable_query_batching(self.rag_system['embeddings'], max_batch_size=BATCH_MAX_SIZE,
+                                                       max_wait_ms=BATCH_MAX_WAIT_MS)
+        warm_up(self.rag_system)
+        self.answer_cache = SemanticAnswerCache(self.rag_system['embeddings'], threshold=0.95,
+                                                max_entries=500, ttl=24 * 3600)
+        self.answer_cache.set_index_version(self.rag_system['index_version'])
+        self.graph = build_service_graph(self.rag_system, vectorstore_path, answer_cache=self.answer_cache)
+        self.faq_answers = load_faq_answers(self.rag_system, vectorstore_path, COLLECTION_NAME, self.graph)
+        self.index_updater = attach_index_updater(self.rag_system, self.graph, self.answer_cache, self.faq_answers)
+        self.rag_chain = get_rag_prompt() | self.rag_system['llm'] | StrOutputParser()
+        self.ready = True
+
+    async def acquire(self):
+        """동시 처리 자리 확보 (QUEUE_TIMEOUT 안에 못 얻으면 503)"""
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="서버가 바쁩니다. 잠시 후 다시 시도해주세요.")
+        self.in_flight += 1
+
+    def release(self, _=None):
+        self.in_flight -= 1
+        self.semaphore.release()
+
+    async def run_bounded(self, fn, *args, deadline: float):
+        """
+        fn을 스레드에서 실행 (동시 처리 자리는 스레드가 실제로 끝날 때 반납)
+        deadline(초) 안에 끝나지 않으면 504
+        """
+        await self.acquire()
+        task = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+        task.add_done_callback(self.release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=deadline)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail=f"제한 시간 {deadline:.0f}초를 넘었습니다.")
+        except Exception as e:
+            # 조절기가 재시도한 뒤에도 사용량 한도에 걸리면 클라이언트도 잠시 후 재시도하도록 429
+            if is_rate_limit_error(e):
+                raise HTTPException(status_code=429, detail=RATE_LIMIT_DETAIL, headers={"Retry-After": "10"})
+            raise
+
+
+server = RAGServer()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    server.semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    # 모델 로드는 수십 초 걸릴 수 있으므로 기다리지 않고 스레드에서 실행 (그동안 /health는 응답, /ready는 503)
+    load_task = None
+    if not server.ready:
+        load_task = asyncio.create_task(asyncio.to_thread(server.load))
+        load_task.add_done_callback(_log_load_result)
+    yield
+    if load_task is not None and not load_task.done():
+        # 로드 중 종료: 스레드는 중단할 수 없으므로 태스크만 취소 (스레드는 진행 중인 로드를 마치고 종료)
+        load_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await load_task
+
+
+def _log_load_result(task: asyncio.Task):
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        server.load_error = f"{type(error).__name__}: {error}"
+        print(f"RAG 시스템 로드 실패: {server.load_error}")
+
+
+app = FastAPI(title="반려견 질병 Q&A API", lifespan=lifespan)
+
+
+def _filters(request: AskRequest) -> dict:
+    return request.filters if request.filters is not None else detect_filters(request.question)
+
+
+def _serialize_docs(docs) -> list:
+    return [{"content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+
+
+def _check_ready():
+    if server.load_error:
+        raise HTTPException(status_code=503, detail=f"RAG 시스템 로드 실패: {server.load_error}")
+    if not server.ready:
+        raise HTTPException(status_code=503, detail="RAG 시스템을 로드하는 중입니다.")
+
+
+def _cache_lookup(request: AskRequest):
+    # 질문 임베딩이 필요하므로 이벤트 루프가 아닌 스레드에서 호출
+    # 다른 프로세스가 추가한 상담기록이 있으면 캐시 확인 전에 인덱스에 반영 (버전이 바뀌면 캐시 무효화)
+    if server.index_updater is not None:
+        server.index_updater.sync(min_interval=INDEX_SYNC_INTERVAL)
+    # 직접 지정한 필터가 있으면 결과가 달라지므로 캐시를 사용하지 않음 (Streamlit 앱과 같은 규칙)
+    if not request.use_cache or request.filters:
+        return None
+    # 자주 묻는 질문은 미리 만든 답변 먼저 (FAQ_ANSWERS=1)
+    if server.faq_answers is not None:
+        answer = server.faq_answers.lookup(request.question)
+        if answer:
+            return answer
+    return server.answer_cache.lookup(request.question)
+
+
+def _pipeline_deadline(deadline: float) -> Deadline:
+    """파이프라인 마감 시간 (HTTP 제한 시간보다 DEADLINE_MARGIN만큼 앞서 대체 답변으로 마무리)"""
+    return Deadline(max(deadline - DEADLINE_MARGIN, 0.0))
+
+
+def _should_cache(request: AskRequest, docs, degraded) -> bool:
+    # 마감 시간 때문에 단계를 줄인 답변은 캐시하지 않음
+    return bool(docs) and request.use_cache and not request.filters and not degraded
+
+
+def _answer(request: AskRequest, deadline: Deadline) -> dict:
+    """질문 1개 전체 실행 (스레드에서 호출)"""
+    start = time.perf_counter()
+    with trace_request(request.question):
+        result = run_rag_graph(server.graph, request.question, filters=_filters(request), deadline=deadline)
+    answer = result.get("answer", NO_DOCS_ANSWER)
+    docs = filter_docs_by_response(result.get("docs") or [], answer)
+    degraded = result.get("degraded") or []
+    if _should_cache(request, docs, degraded):
+        server.answer_cache.put(request.question, answer, docs, latency=time.perf_counter() - start)
+    return {"answer": answer, "docs": _serialize_docs(docs), "transformed": result.get("transformed"),
+            "timings": result.get("timings", {}), "degraded": degraded}
+
+
+@app.post("/ask", response_model=AskResponse)
+async def ask(request: AskRequest):
+    _check_ready()
+    cached = await asyncio.to_thread(_cache_lookup, request)
+    if cached:
+        return AskResponse(answer=cached['answer'], docs=_serialize_docs(cached['docs']), cached=True)
+    deadline = request.deadline_s or DEFAULT_DEADLINE
+    result = await server.run_bounded(_answer, request, _pipeline_deadline(deadline), deadline=deadline)
+    return AskResponse(**result)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _stream_pipeline(request: AskRequest, emit, started: float, cancelled: threading.Event, deadline: Deadline):
+    """스트리밍 질문 1개 실행 (스레드에서 호출) - 이벤트는 emit(event, data)로 전달"""
+    with trace_request(request.question):
+        try:
+            result = run_rag_graph(server.graph, request.question, filters=_filters(request), skip_generate=True,
+                                   deadline=deadline)
+            degraded = list(result.get("degraded") or [])
+            answer = ""
+            if not result.get("docs"):
+                answer = NO_DOCS_ANSWER
+                emit("token", {"text": answer})
+            elif result.get("answer"):
+                # 생성할 시간이 없어 그래프가 대체 답변을 만든 경우
+                answer = result["answer"]
+                emit("token", {"text": answer})
+            else:
+                with stage("generate"):
+                    for chunk in stream_generation(server.rag_chain, result, deadline, degraded=degraded,
+                                                   fallback_answer=make_fallback_answer(server.answer_cache)):
+                        if cancelled.is_set():
+                            # 클라이언트 연결이 끊기면 생성 중단
+                            return
+                        answer += chunk
+                        emit("token", {"text": chunk})
+
+            docs = filter_docs_by_response(result.get("docs") or [], answer)
+            if _should_cache(request, docs, degraded):
+                server.answer_cache.put(request.question, answer, docs, latency=time.perf_counter() - started)
+            emit("done", {"docs": _serialize_docs(docs), "transformed": result.get("transformed"),
+                          "timings": result.get("timings", {}), "cached": False, "degraded": degraded})
+        except Exception as e:
+            emit("error", {"detail": RATE_LIMIT_DETAIL if is_rate_limit_error(e) else str(e)})
+
+
+@app.post("/ask/stream")
+async def ask_stream(request: AskRequest):
+    _check_ready()
+    deadline = request.deadline_s or DEFAULT_DEADLINE
+    started = time.perf_counter()
+
+    cached = await asyncio.to_thread(_cache_lookup, request)
+    if cached:
+        async def replay():
+            yield _sse("token", {"text": cached['answer']})
+            yield _sse("done", {"docs": _serialize_docs(cached['docs']), "cached": True})
+        return StreamingResponse(replay(), media_type="text/event-stream")
+
+    await server.acquire()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+    emit = lambda event, data: loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+    # 검색부터 생성까지 스레드 하나에서 실행 (동시 처리 자리는 스레드가 끝날 때 반납)
+    task = asyncio.ensure_future(asyncio.to_thread(_stream_pipeline, request, emit, started, cancelled,
+                                                   _pipeline_deadline(deadline)))
+    task.add_done_callback(server.release)
+
+    async def events():
+        try:
+            while True:
+                remaining = deadline - (time.perf_counter() - started)
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=max(remaining, 0))
+                except asyncio.TimeoutError:
+                    yield _sse("error", {"detail": f"제한 시간 {deadline:.0f}초를 넘었습니다."})
+                    return
+                yield _sse(event, data)
+                if event in ("done", "error"):
+                    return
+        finally:
+            cancelled.set()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/ingest")
+async def ingest(request: IngestRequest):
+    _check_ready()
+    if server.index_updater is None:
+        raise HTTPException(status_code=409, detail="이 구성(샤드 인덱스 등)에서는 증분 갱신을 사용할 수 없습니다.")
+    try:
+        # 임베딩 / Chroma 쓰기는 스레드에서 (진행 중인 질문은 이전 인덱스로 계속 처리)
+        return await asyncio.to_thread(server.index_updater.ingest, request.records)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/ready")
+async def ready():
+    _check_ready()
+    return {"ready": True, "in_flight": server.in_flight, "max_concurrency": MAX_CONCURRENCY,
+            "index_version": server.rag_system['index_version'],
+            "query_batching": server.query_encoder.metrics() if server.query_encoder else None,
+            "openai": get_governor().metrics(),
+            "faq_answers": server.faq_answers.metrics() if server.faq_answers else None}
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return METRICS.to_prometheus()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv("API_HOST", "0.0.0.0"), port=int(os.getenv("API_PORT", "8000")))
@@ -0,0 +1,133 @@
+'''
+앙상블 결합 결과 적응형 자르기(ensemble.AdaptiveCutoff) 비교: 고정 개수(Dense k=5 + BM25) vs 점수 분포 기반 자르기
+- 검색 단계 (LLM 없이): 질문당 self-check / 생성으로 넘어가는 문서 수, 재현율
+  재현율: 정답(reference)과 단어가 MIN_OVERLAP 이상 겹치는 문서(고정 결과 기준) 중 자른 결과에도 남은 비율
+  정답 문서 유지율: 고정 결과에서 정답과 가장 많이 겹치는 문서가 자른 결과에도 남은 질문 비율
+- --e2e: 서비스 그래프와 같은 단계(LLM self-check -> 토큰 예산 context -> 생성)로 끝까지 실행
+  -> self_check / generate / 전체 지연시간(평균 / p50 / p95 / p99), 생성에 들어간 문서 수 (OPENAI_API_KEY 필요)
+  --fake: OpenAI 대신 가짜 LLM(fake_models.py, 토큰 수에 비례한 지연)으로 실행 (오프라인에서 경향만 확인)
+  rewrite는 자르기와 무관하므로 생략합니다.
+
+기준 여러 개를 한 번에 비교: --relative=0.5,0.4 --gap=0.3,0.5 --min-docs=1,2 의 모든 조합
+
+실행: python bench_adaptive_cutoff.py [bge_m3|openai] [질문 수] [--e2e] [--fake] [--relative=...] [--gap=...] [--min-docs=...]
+결과: output/adaptive_cutoff_<벡터스토어>.csv
+'''
+
+import itertools
+import os
+import sys
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+warnings.filterwarnings("ignore")
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from bench_utils import (PROJECT_ROOT, load_test_dataset, load_vectorstore, print_summary, reference_overlap,
+                         summarize)
+from context_builder import ContextBuilder
+from ensemble import AdaptiveCutoff, fuse_scored
+from prompt_module import format_docs, get_rag_prompt, get_rewrite_prompt, self_check_retriver
+from rag_graph import build_rag_graph, run_rag_graph
+from rag_service import CONTEXT_TOKEN_BUDGET
+from retrievers import DenseRetriever, BM25BatchRetriever, load_documents_from_vectorstore
+
+load_dotenv()
+
+
+def _option(name: str, default: str) -> list:
+    for arg in sys.argv[1:]:
+        if arg.startswith(f"--{name}="):
+            return [float(value) for value in arg.split("=", 1)[1].split(",")]
+    return [float(value) for value in default.split(",")]
+
+
+args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+VECTORSTORE_TYPE = args[0] if len(args) > 0 else "bge_m3"
+NUM_QUESTIONS = int(args[1]) if len(args) > 1 else 50
+E2E = "--e2e" in sys.argv
+FAKE = "--fake" in sys.argv
+RELATIVE = _option("relative", "0.5,0.4")
+GAPS = _option("gap", "0.3,0.5")
+MIN_DOCS = [int(value) for value in _option("min-docs", "1,2")]
+MIN_OVERLAP = 0.3
+WEIGHTS = [0.5, 0.5]
+RESULT_PATH = os.path.join(PROJECT_ROOT, "output", f"adaptive_cutoff_{VECTORSTORE_TYPE}.csv")
+
+
+# ---------------------------
+# 검색 (질문당 1번, 결합 점수와 함께)
+# ---------------------------
+vectorstore = load_vectorstore(VECTORSTORE_TYPE)
+dense = DenseRetriever(vectorstore, k=5)
+bm25 = BM25BatchRetriever.from_documents(load_documents_from_vectorstore(vectorstore))
+
+dataset = load_test_dataset()[:NUM_QUESTIONS]
+questions = [row["user_input"] for row in dataset]
+references = [row["reference"] for row in dataset]
+scored_list = [fuse_scored(results, WEIGHTS) for results in zip(dense.batch(questions), bm25.batch(questions))]
+print(f"벡터스토어: {VECTORSTORE_TYPE} / 질문 {len(questions)}개 / 고정 결과 평균 문서 "
+      f"{sum(map(len, scored_list)) / len(scored_list):.1f}개")
+
+# 고정 결과 기준 관련 문서 (정답과 많이 겹치는 문서) / 정답 문서 (가장 많이 겹치는 문서)
+relevant_ranks, best_ranks = [], []
+for scored, reference in zip(scored_list, references):
+    overlaps = [reference_overlap(reference, doc.page_content) for doc, _ in scored]
+    relevant_ranks.append([i for i, value in enumerate(overlaps) if value >= MIN_OVERLAP])
+    best = max(range(len(overlaps)), key=overlaps.__getitem__) if overlaps else None
+    best_ranks.append(best if best is not None and overlaps[best] >= MIN_OVERLAP else None)
+
+cutoffs = {"고정": None}
+for relative, gap, min_docs in itertools.product(RELATIVE, GAPS, MIN_DOCS):
+    cutoffs[f"rel={relative} gap={gap} min={min_docs}"] = AdaptiveCutoff(relative, gap, min_docs)
+
+rows = []
+print("\n" + "=" * 70)
+for label, cutoff in cutoffs.items():
+    keeps = [cutoff.cut_index([score for _, score in scored]) if cutoff else len(scored) for scored in scored_list]
+    relevant_total = sum(len(ranks) for ranks in relevant_ranks)
+    relevant_kept = sum(sum(rank < keep for rank in ranks) for ranks, keep in zip(relevant_ranks, keeps))
+    answerable = [(best, keep) for best, keep in zip(best_ranks, keeps) if best is not None]
+    row = {
+        "setting": label,
+        "mean_docs": sum(keeps) / len(keeps),
+        "recall": relevant_kept / relevant_total if relevant_total else 1.0,
+        "best_doc_kept": sum(best < keep for best, keep in answerable) / len(answerable) if answerable else 1.0,
+    }
+    print(f"[검색] {label:<28} 문서 수 평균 {row['mean_docs']:.2f} / 재현율 {row['recall']:.3f} / "
+          f"정답 문서 유지율 {row['best_doc_kept']:.3f}")
+    rows.append(row)
+
+# ---------------------------
+# 끝까지 실행 (self-check + 생성)
+# ---------------------------
+if E2E:
+    if FAKE:
+        from fake_models import FakeChatModel
+        llm = FakeChatModel(latency=0.3, token_latency=0.002)
+    else:
+        from rag_components import get_llm
+        llm = get_llm()
+    builder = ContextBuilder(format_docs, max_tokens=CONTEXT_TOKEN_BUDGET) if CONTEXT_TOKEN_BUDGET > 0 else None
+    graph = build_rag_graph(None, llm, get_rag_prompt(), get_rewrite_prompt(), format_docs,
+                            self_check=lambda docs, question: self_check_retriver(docs, question, llm),
+                            context_builder=builder)
+    for row, cutoff in zip(rows, cutoffs.values()):
+        docs_list = [cutoff.apply(scored) if cutoff else [doc for doc, _ in scored] for scored in scored_list]
+        # 질문별 전체 시간(total)이 필요하므로 run_rag_graph를 4개씩 동시에 실행
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            states = list(pool.map(lambda case: run_rag_graph(graph, case[0], docs=case[1], skip_rewrite=True),
+                                   zip(questions, docs_list)))
+        print("\n" + "=" * 70)
+        for stage_name in ("self_check", "generate", "total"):
+            stats = summarize([state["timings"][stage_name] for state in states if stage_name in state["timings"]])
+            print_summary(f"[{stage_name}] {row['setting']}", stats)
+            row[f"{stage_name}_mean_ms"] = stats["mean_ms"]
+            row[f"{stage_name}_p95_ms"] = stats["p95_ms"]
+        row["generate_docs"] = sum(len(state.get("docs") or []) for state in states) / len(states)
+
+df = pd.DataFrame(rows)
+df.to_csv(RESULT_PATH, index=False, encoding='utf-8-sig')
+print("\n" + df.round(3).to_string(index=False))
+print(f"\n결과 저장: {RESULT_PATH}")
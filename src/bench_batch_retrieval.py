@@ -0,0 +1,64 @@
+'''
+배치 검색 처리량 벤치마크
+- 기존 방식: 질문마다 retriever.invoke(q) (질문별 임베딩 호출 + 전체 BM25 스캔)
+- 배치 방식: retriever.batch(queries) (임베딩 1회 + Chroma 쿼리 1회 + BM25 공통 단어 재사용)
+- 두 방식의 검색 결과가 동일한지도 함께 확인합니다.
+
+실행: python bench_batch_retrieval.py [bge_m3|openai] [반복 횟수]
+'''
+
+import sys
+import warnings
+warnings.filterwarnings("ignore")
+
+from dotenv import load_dotenv
+from langchain_community.retrievers import BM25Retriever
+
+from bench_utils import load_test_questions, load_vectorstore, timed
+from ensemble import EnsembleRetriever
+from retrievers import DenseRetriever, BM25BatchRetriever, load_documents_from_vectorstore
+
+load_dotenv()
+
+VECTORSTORE_TYPE = sys.argv[1] if len(sys.argv) > 1 else "bge_m3"
+REPEAT = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+K = 5
+
+vectorstore = load_vectorstore(VECTORSTORE_TYPE)
+questions = load_test_questions(repeat=REPEAT)
+print(f"벡터스토어: {VECTORSTORE_TYPE} / 질문 수: {len(questions)}개")
+
+bm25_docs = load_documents_from_vectorstore(vectorstore)
+
+# 기존 방식 리트리버 (prompt_module.get_retriever 변경 전 구성)
+legacy = {
+    "Dense": vectorstore.as_retriever(search_kwargs={"k": K}, search_type="similarity"),
+    "BM25": BM25Retriever.from_documents(bm25_docs),
+}
+legacy["Ensemble"] = EnsembleRetriever(retrievers=[legacy["Dense"], legacy["BM25"]], weights=[0.5, 0.5])
+
+# 배치 지원 리트리버
+batched = {
+    "Dense": DenseRetriever(vectorstore, k=K),
+    "BM25": BM25BatchRetriever.from_documents(bm25_docs),
+}
+batched["Ensemble"] = EnsembleRetriever(retrievers=[batched["Dense"], batched["BM25"]], weights=[0.5, 0.5])
+
+# 모델 로딩/캐시 워밍업
+batched["Dense"].invoke(questions[0])
+
+print("\n" + "=" * 70)
+print(f"{'retriever':<10} {'loop(s)':>10} {'batch(s)':>10} {'loop QPS':>10} {'batch QPS':>10} {'speedup':>8} {'same':>6}")
+print("=" * 70)
+
+for name in ["Dense", "BM25", "Ensemble"]:
+    loop_results, loop_time = timed(lambda: [legacy[name].invoke(q) for q in questions])
+    batch_results, batch_time = timed(batched[name].batch, questions)
+
+    same = all(
+        [d.page_content for d in a] == [d.page_content for d in b]
+        for a, b in zip(loop_results, batch_results)
+    )
+    print(f"{name:<10} {loop_time:>10.3f} {batch_time:>10.3f} "
+          f"{len(questions) / loop_time:>10.1f} {len(questions) / batch_time:>10.1f} "
+          f"{loop_time / batch_time:>7.1f}x {str(same):>6}")
@@ -0,0 +1,114 @@
+'''
+context 토큰 예산별 비교 (예산 없음 = 기존 format_docs로 모든 문서 사용)
+- context 토큰 수 (예산 적용 전 토큰 수 함께 기록), 사용/잘린 문서 수
+- 생성 단계 지연시간 (평균 / p50 / p95 / p99)
+- RAGAS faithfulness / answer_relevancy (예산 때문에 근거가 빠져 답변 품질이 떨어지는지 확인)
+
+--compress: 문장 단위 추출 압축(context_compression.py)을 켜고 실행 -> 압축률 / 압축 시간도 기록
+           (압축 없이 실행한 결과와 생성 지연시간, faithfulness를 비교)
+
+검색은 질문당 한 번만 하고(앙상블, 앱과 같은 설정) 같은 문서로 예산만 바꿔 생성합니다.
+RAGAS contexts에는 실제로 LLM에 들어간(잘린) 문서 내용을 넣습니다.
+
+실행: python bench_context_budget.py [bge_m3|openai] [질문 수] [예산...] [--compress]
+결과: output/context_budget_evaluation_<벡터스토어>[_compressed].csv
+'''
+
+import os
+import sys
+import warnings
+warnings.filterwarnings("ignore")
+
+import pandas as pd
+from datasets import Dataset
+from dotenv import load_dotenv
+from ragas import evaluate
+from ragas.embeddings import LangchainEmbeddingsWrapper
+from ragas.metrics import answer_relevancy, faithfulness
+
+from bench_utils import PROJECT_ROOT, load_test_questions, load_vectorstore, print_summary, summarize
+from context_builder import ContextBuilder, count_tokens
+from context_compression import SentenceCompressor
+from ensemble import EnsembleRetriever
+from prompt_module import format_docs, get_rag_prompt, get_rewrite_prompt
+from rag_components import get_llm
+from rag_graph import build_rag_graph, run_rag_graph_batch
+from retrievers import DenseRetriever, BM25BatchRetriever, load_documents_from_vectorstore
+
+load_dotenv()
+
+args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+VECTORSTORE_TYPE = args[0] if len(args) > 0 else "bge_m3"
+NUM_QUESTIONS = int(args[1]) if len(args) > 1 else 20
+BUDGETS = [int(arg) for arg in args[2:]] or [0, 3000, 2000, 1000]
+COMPRESS = "--compress" in sys.argv
+RESULT_PATH = os.path.join(PROJECT_ROOT, "output", f"context_budget_evaluation_{VECTORSTORE_TYPE}"
+                                                   f"{'_compressed' if COMPRESS else ''}.csv")
+
+vectorstore = load_vectorstore(VECTORSTORE_TYPE)
+retriever = EnsembleRetriever(
+    retrievers=[DenseRetriever(vectorstore, k=5),
+                BM25BatchRetriever.from_documents(load_documents_from_vectorstore(vectorstore))],
+    weights=[0.5, 0.5]
+)
+questions = load_test_questions()[:NUM_QUESTIONS]
+docs_list = retriever.batch(questions)
+print(f"벡터스토어: {VECTORSTORE_TYPE} / 질문 {len(questions)}개 / 예산 {BUDGETS} / 압축 {'사용' if COMPRESS else '없음'}")
+
+llm = get_llm()
+ragas_embeddings = LangchainEmbeddingsWrapper(embeddings=vectorstore.embeddings)
+compressor = SentenceCompressor(vectorstore.embeddings) if COMPRESS else None
+
+rows = []
+for budget in BUDGETS:
+    builder = ContextBuilder(format_docs, max_tokens=budget) if budget > 0 else None
+    graph = build_rag_graph(retriever, llm, get_rag_prompt(), get_rewrite_prompt(), format_docs,
+                            compress=compressor.compress if compressor else None, context_builder=builder)
+    # rewrite는 예산과 무관하므로 생략 (원본 질문으로 생성)
+    states = run_rag_graph_batch(graph, questions, docs_list=docs_list, max_concurrency=4, skip_rewrite=True)
+
+    contexts_list = []
+    for state in states:
+        # 압축/예산 적용 후 실제로 LLM에 들어간 문서
+        docs = state.get("docs") or []
+        if builder is not None:
+            _, docs, _ = builder.build(docs)
+        contexts_list.append([doc.page_content for doc in docs])
+
+    result = evaluate(
+        dataset=Dataset.from_dict({"question": questions, "answer": [state["answer"] for state in states],
+                                   "contexts": contexts_list}),
+        metrics=[faithfulness, answer_relevancy],
+        llm=llm,
+        embeddings=ragas_embeddings,
+    ).to_pandas()
+
+    label = f"예산 {budget}" if builder else "예산 없음"
+    generate_latencies = [state["timings"]["generate"] for state in states if "generate" in state["timings"]]
+    print("\n" + "=" * 70)
+    print_summary(f"[생성 지연시간] {label}", summarize(generate_latencies))
+
+    for question, state, (_, scores) in zip(questions, states, result.iterrows()):
+        stats = state.get("context_stats") or {"tokens": count_tokens(state.get("context", ""))}
+        compression = state.get("compression_stats") or {}
+        rows.append({
+            "budget": budget,
+            "question": question,
+            "context_tokens": stats.get("tokens", ""),
+            "tokens_before": stats.get("tokens_before", ""),
+            "docs_used": stats.get("docs_used", ""),
+            "docs_trimmed": stats.get("docs_trimmed", ""),
+            "compression_ratio": compression.get("ratio", ""),
+            "compress_s": state["timings"].get("compress", ""),
+            "generate_s": state["timings"].get("generate", ""),
+            "faithfulness": scores.get("faithfulness"),
+            "answer_relevancy": scores.get("answer_relevancy"),
+        })
+
+df = pd.DataFrame(rows)
+df.to_csv(RESULT_PATH, index=False, encoding='utf-8-sig')
+print("\n예산별 평균:")
+print(df.groupby("budget")[["context_tokens", "compression_ratio", "compress_s", "generate_s",
+                          "faithfulness", "answer_relevancy"]]
+      .agg(lambda column: pd.to_numeric(column, errors="coerce").mean()).round(3).to_string())
+print(f"\n결과 저장: {RESULT_PATH}")
@@ -0,0 +1,102 @@
+'''
+질병명 fast-path 비교: 앙상블(Dense + BM25) vs restrict(질병 청크 안에서만 검색) vs boost(질병 청크 결과와 순위 결합)
+질문에 질병명이 매칭된 질문만 비교합니다. (매칭되지 않은 질문은 세 방식이 같은 경로)
+- 지연시간: 검색 1회 (평균 / p50 / p95 / p99), 질병명 매칭(Aho-Corasick)만의 소요 시간
+- 정밀도: 검색 결과 중 정답(reference)과 단어가 MIN_OVERLAP 이상 겹치는 문서 비율
+- 근거 포함률: 검색 결과에 그런 문서가 1개 이상 있는 질문 비율
+- 질병 일치율: 검색 결과 중 매칭된 질병의 postings(태깅/본문 언급)에 있는 문서 비율
+
+질문 임베딩은 메모리 캐시로 한 번만 계산하므로 지연시간은 검색 단계만 비교합니다.
+
+실행: python bench_entity_fast_path.py [bge_m3|openai] [반복 횟수]
+결과: output/entity_fast_path_<벡터스토어>.csv
+'''
+
+import os
+import sys
+import time
+import warnings
+warnings.filterwarnings("ignore")
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from bench_utils import (PROJECT_ROOT, load_test_dataset, load_vectorstore, print_summary, reference_overlap,
+                         summarize, timed)
+from embedding_cache import CachedEmbeddings
+from ensemble import EnsembleRetriever
+from entity_index import EntityFastPathRetriever, EntityIndex
+from prompt_module import get_index_version
+from retrievers import DenseRetriever, BM25BatchRetriever, load_documents_from_vectorstore
+
+load_dotenv()
+
+VECTORSTORE_TYPE = sys.argv[1] if len(sys.argv) > 1 else "bge_m3"
+REPEAT = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+MIN_OVERLAP = 0.3
+RESULT_PATH = os.path.join(PROJECT_ROOT, "output", f"entity_fast_path_{VECTORSTORE_TYPE}.csv")
+
+vectorstore = load_vectorstore(VECTORSTORE_TYPE)
+vectorstore._embedding_function = CachedEmbeddings(vectorstore.embeddings)
+docs = load_documents_from_vectorstore(vectorstore)
+
+start = time.perf_counter()
+index = EntityIndex.build(docs, version=get_index_version(vectorstore))
+print(f"질병명 인덱스 생성 {time.perf_counter() - start:.2f}초: {index.stats()}")
+
+ensemble = EnsembleRetriever(retrievers=[DenseRetriever(vectorstore, k=5), BM25BatchRetriever.from_documents(docs)],
+                             weights=[0.5, 0.5])
+retrievers = {
+    "ensemble": ensemble,
+    "restrict": EntityFastPathRetriever(ensemble, index, mode="restrict"),
+    "boost": EntityFastPathRetriever(ensemble, index, mode="boost"),
+}
+
+dataset = load_test_dataset()
+cases = [(row["user_input"], row["reference"], index.match(row["user_input"])) for row in dataset]
+cases = [case for case in cases if case[2]]
+print(f"벡터스토어: {VECTORSTORE_TYPE} / 질문 {len(dataset)}개 중 질병명 매칭 {len(cases)}개 x {REPEAT}회")
+if not cases:
+    sys.exit("질병명이 매칭된 질문이 없습니다.")
+
+# 질문 임베딩 미리 계산 (캐시에 저장 -> 이후 검색은 임베딩 비용 없음)
+ensemble.retrievers[0].batch([question for question, _, _ in cases])
+
+match_latencies = []
+for _ in range(REPEAT):
+    for question, _, _ in cases:
+        match_latencies.append(timed(index.match, question)[1])
+print("\n" + "=" * 70)
+print_summary("[질병명 매칭] Aho-Corasick", summarize(match_latencies))
+
+rows = []
+for name, retriever in retrievers.items():
+    latencies, precisions, hits, entity_precisions = [], [], [], []
+    for _ in range(REPEAT):
+        for question, reference, diseases in cases:
+            _, seconds = timed(retriever.invoke, question)
+            latencies.append(seconds)
+    for question, reference, diseases in cases:
+        results = retriever.invoke(question)
+        relevant = [reference_overlap(reference, doc.page_content) >= MIN_OVERLAP for doc in results]
+        postings = set(index.chunk_ids(diseases))
+        precisions.append(sum(relevant) / len(results) if results else 0.0)
+        hits.append(any(relevant))
+        entity_precisions.append(sum(doc.id in postings for doc in results) / len(results) if results else 0.0)
+
+    stats = summarize(latencies)
+    print_summary(f"[검색] {name}", stats)
+    row = {
+        "retriever": name,
+        **stats,
+        "precision": sum(precisions) / len(precisions),
+        "evidence_hit_rate": sum(hits) / len(hits),
+        "disease_precision": sum(entity_precisions) / len(entity_precisions),
+    }
+    print(f"{'':<40} 정밀도={row['precision']:.3f} 근거 포함률={row['evidence_hit_rate']:.3f} "
+          f"질병 일치율={row['disease_precision']:.3f}")
+    rows.append(row)
+
+df = pd.DataFrame(rows)
+df.to_csv(RESULT_PATH, index=False, encoding='utf-8-sig')
+print(f"\n결과 저장: {RESULT_PATH}")
@@ -0,0 +1,79 @@
+'''
+메타데이터 필터 검색 벤치마크 (필터 적용 vs 미적용)
+- 지연시간: Dense / BM25 / Ensemble 각각 필터 미적용 vs 적용
+- 후보 수: 필터 적용 시 BM25가 점수를 계산한 후보 문서 수
+- 재현율: 필터 미적용 top-k 중 필터 조건을 만족하는 문서가 필터 적용 결과에도 포함된 비율
+  (필터링 때문에 잃어버리는 관련 문서가 없는지 확인)
+- 순도: 필터 미적용 결과 중 필터 조건을 만족하는 문서 비율 (필터가 없을 때 self-check로 넘어가는 무관 문서 비중)
+
+질문별 필터는 detect_filters로 감지하고, 감지되지 않으면 질문을 진료과 5개 필터 각각으로 한 번씩 검색합니다.
+
+실행: python bench_filtered_retrieval.py [bge_m3|openai] [반복 횟수]
+'''
+
+import sys
+import warnings
+warnings.filterwarnings("ignore")
+
+from dotenv import load_dotenv
+
+from bench_utils import load_test_questions, load_vectorstore, print_summary, summarize, timed
+from ensemble import EnsembleRetriever
+from metadata_filter import DEPARTMENTS, detect_filters, matches_filters
+from retrievers import DenseRetriever, BM25BatchRetriever, load_documents_from_vectorstore
+
+load_dotenv()
+
+VECTORSTORE_TYPE = sys.argv[1] if len(sys.argv) > 1 else "bge_m3"
+REPEAT = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+K = 5
+
+vectorstore = load_vectorstore(VECTORSTORE_TYPE)
+bm25_docs = load_documents_from_vectorstore(vectorstore)
+
+retrievers = {
+    "Dense": DenseRetriever(vectorstore, k=K),
+    "BM25": BM25BatchRetriever.from_documents(bm25_docs),
+}
+retrievers["Ensemble"] = EnsembleRetriever(retrievers=[retrievers["Dense"], retrievers["BM25"]], weights=[0.5, 0.5])
+
+# (질문, 필터) 쌍 구성
+cases = []
+for question in load_test_questions(repeat=1):
+    filters = detect_filters(question)
+    if filters:
+        cases.append((question, filters))
+    else:
+        cases.extend((question, {"department": department}) for department in DEPARTMENTS)
+print(f"벡터스토어: {VECTORSTORE_TYPE} / (질문, 필터) 케이스: {len(cases)}개 x {REPEAT}회")
+
+# 임베딩 모델 워밍업 (질문 임베딩은 필터와 무관하므로 지연시간 비교에서 제외되도록 먼저 한 번 계산)
+retrievers["Dense"].batch([question for question, _ in cases])
+
+print("\n" + "=" * 70)
+for name, retriever in retrievers.items():
+    unfiltered_latencies, filtered_latencies = [], []
+    recalls, purities = [], []
+
+    for _ in range(REPEAT):
+        for question, filters in cases:
+            unfiltered, t_unfiltered = timed(retriever.invoke, question)
+            filtered, t_filtered = timed(retriever.invoke, question, filters=filters)
+            unfiltered_latencies.append(t_unfiltered)
+            filtered_latencies.append(t_filtered)
+
+            matching = [doc for doc in unfiltered if matches_filters(doc.metadata, filters)]
+            purities.append(len(matching) / len(unfiltered) if unfiltered else 0.0)
+            if matching:
+                filtered_contents = {doc.page_content for doc in filtered}
+                recalls.append(sum(doc.page_content in filtered_contents for doc in matching) / len(matching))
+
+    print_summary(f"[{name}] 필터 미적용", summarize(unfiltered_latencies))
+    print_summary(f"[{name}] 필터 적용", summarize(filtered_latencies))
+    print(f"{'':<40} 재현율={sum(recalls) / len(recalls) if recalls else 0:.3f} "
+          f"순도(미적용)={sum(purities) / len(purities) if purities else 0:.3f}")
+
+# BM25 후보 수 (필터가 후보 집합을 얼마나 줄이는지)
+bm25 = retrievers["BM25"]
+candidate_sizes = [len(bm25._resolve_filters(filters)[2]) for _, filters in cases]
+print(f"\nBM25 후보 문서 수: 전체 {len(bm25.docs)}개 -> 필터 적용 평균 {sum(candidate_sizes) / len(candidate_sizes):.0f}개")
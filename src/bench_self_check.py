@@ -0,0 +1,106 @@
+'''
+문서 검증 단계 비교: LLM self-check (gpt-4o-mini Keep/Drop, 문서별 순차 호출) vs 로컬 cross-encoder 리랭커
+- 지연시간: 질문 1개의 검증 단계 소요 시간 (평균 / p50 / p95 / p99)
+  (현재 self_check_retriver의 일괄 판단 방식(LLM 1회 호출)도 함께 측정)
+- 일치율: 문서별 Keep/Drop 판단이 LLM과 같은 비율, Cohen's kappa
+- LLM Keep 기준 리랭커 정밀도/재현율
+- 최종 문서 집합 Jaccard (모두 Drop이면 원래 문서를 반환하는 규칙까지 적용한 결과)
+- threshold별 일치율 (리랭커 threshold 선택용)
+
+실행: python bench_self_check.py [bge_m3|openai] [질문 수] [--onnx]
+'''
+
+import sys
+import warnings
+warnings.filterwarnings("ignore")
+
+from dotenv import load_dotenv
+from langchain_core.output_parsers import StrOutputParser
+from langchain_openai import ChatOpenAI
+
+from bench_utils import load_test_questions, load_vectorstore, print_summary, summarize, timed
+from ensemble import EnsembleRetriever
+from prompt_module import self_check_prompt, self_check_retriver
+from reranker import CrossEncoderReranker
+from retrievers import DenseRetriever, BM25BatchRetriever, load_documents_from_vectorstore
+
+load_dotenv()
+
+args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+VECTORSTORE_TYPE = args[0] if len(args) > 0 else "bge_m3"
+NUM_QUESTIONS = int(args[1]) if len(args) > 1 else 30
+USE_ONNX = "--onnx" in sys.argv
+THRESHOLDS = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7]
+
+
+def final_set(docs, keeps):
+    """Keep 판단 -> 최종 문서 집합 (모두 Drop이면 원래 문서)"""
+    kept = {doc.page_content for doc, keep in zip(docs, keeps) if keep}
+    return kept or {doc.page_content for doc in docs}
+
+
+def cohen_kappa(a, b):
+    n = len(a)
+    if n == 0:
+        return 0.0
+    observed = sum(x == y for x, y in zip(a, b)) / n
+    pa, pb = sum(a) / n, sum(b) / n
+    expected = pa * pb + (1 - pa) * (1 - pb)
+    return (observed - expected) / (1 - expected) if expected < 1 else 1.0
+
+
+vectorstore = load_vectorstore(VECTORSTORE_TYPE)
+retriever = EnsembleRetriever(
+    retrievers=[DenseRetriever(vectorstore, k=5),
+                BM25BatchRetriever.from_documents(load_documents_from_vectorstore(vectorstore))],
+    weights=[0.5, 0.5]
+)
+questions = load_test_questions()[:NUM_QUESTIONS]
+docs_list = retriever.batch(questions)
+print(f"벡터스토어: {VECTORSTORE_TYPE} / 질문 {len(questions)}개 / 질문당 평균 문서 "
+      f"{sum(map(len, docs_list)) / len(docs_list):.1f}개")
+
+llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+mini_chain = self_check_prompt() | llm | StrOutputParser()
+reranker = CrossEncoderReranker(use_onnx=USE_ONNX)
+reranker.score(questions[0], docs_list[0])  # 모델 워밍업
+
+llm_latencies, single_call_latencies, reranker_latencies = [], [], []
+llm_keeps, scores, jaccards = [], [], []
+for question, docs in zip(questions, docs_list):
+    # 기존 방식과 동일하게 문서별 순차 호출
+    decisions, t_llm = timed(lambda: [
+        mini_chain.invoke({'question': question, 'doc': doc.page_content}).strip().lower() == 'keep'
+        for doc in docs
+    ])
+    _, t_single_call = timed(self_check_retriver, docs, question, llm, mode="single_call")
+    doc_scores, t_reranker = timed(reranker.score, question, docs)
+    llm_latencies.append(t_llm)
+    single_call_latencies.append(t_single_call)
+    reranker_latencies.append(t_reranker)
+
+    llm_keeps.extend(decisions)
+    scores.extend(doc_scores)
+
+    llm_set = final_set(docs, decisions)
+    reranker_set = final_set(docs, [score >= reranker.threshold for score in doc_scores])
+    jaccards.append(len(llm_set & reranker_set) / len(llm_set | reranker_set))
+
+print("\n" + "=" * 70)
+print_summary("[지연시간] LLM self-check (문서별 순차)", summarize(llm_latencies))
+print_summary("[지연시간] LLM self-check (일괄 1회)", summarize(single_call_latencies))
+print_summary(f"[지연시간] 리랭커{' (ONNX)' if USE_ONNX else ''}", summarize(reranker_latencies))
+
+reranker_keeps = [score >= reranker.threshold for score in scores]
+true_positive = sum(a and b for a, b in zip(llm_keeps, reranker_keeps))
+print(f"\n문서 {len(scores)}개 / LLM Keep 비율 {sum(llm_keeps) / len(llm_keeps):.1%}")
+print(f"[threshold={reranker.threshold}] 일치율={sum(a == b for a, b in zip(llm_keeps, reranker_keeps)) / len(scores):.3f} "
+      f"kappa={cohen_kappa(llm_keeps, reranker_keeps):.3f} "
+      f"정밀도={true_positive / max(sum(reranker_keeps), 1):.3f} 재현율={true_positive / max(sum(llm_keeps), 1):.3f} "
+      f"최종 문서 Jaccard={sum(jaccards) / len(jaccards):.3f}")
+
+print("\nthreshold별 일치율:")
+for threshold in THRESHOLDS:
+    keeps = [score >= threshold for score in scores]
+    agreement = sum(a == b for a, b in zip(llm_keeps, keeps)) / len(scores)
+    print(f"  {threshold:.1f}: 일치율={agreement:.3f} kappa={cohen_kappa(llm_keeps, keeps):.3f} Keep 비율={sum(keeps) / len(keeps):.1%}")
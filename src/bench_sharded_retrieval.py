@@ -0,0 +1,99 @@
+'''
+진료과 샤드 인덱스 벤치마크 (단일 인덱스 vs 샤드 + 라우터)
+- 지연시간: 질문 1개씩 invoke (평균 / p50 / p95 / p99)
+- 메모리: 리트리버 구축 시 Python 힙 사용량 (tracemalloc, BM25 역색인 등) + 프로세스 최대 RSS
+- 라우팅: 방식별 비율(keyword / centroid / fallback), 질문당 평균 검색 샤드 수
+- 일치율: 단일 인덱스 결과 중 샤드 검색 결과에도 포함된 문서 비율
+
+샤드는 build_shards.py로 먼저 생성해야 합니다.
+실행: python bench_sharded_retrieval.py [bge_m3|openai] [반복 횟수]
+'''
+
+import sys
+import tracemalloc
+import warnings
+from collections import Counter
+warnings.filterwarnings("ignore")
+
+from dotenv import load_dotenv
+
+from bench_utils import VECTORSTORE_CONFIG, load_test_questions, load_vectorstore, print_summary, summarize, timed
+from ensemble import EnsembleRetriever
+from retrievers import DenseRetriever, BM25BatchRetriever, load_documents_from_vectorstore
+from sharding import load_sharded_retriever
+
+load_dotenv()
+
+VECTORSTORE_TYPE = sys.argv[1] if len(sys.argv) > 1 else "bge_m3"
+REPEAT = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+K = 5
+
+
+def measure_memory(build):
+    """build() 실행 중 늘어난 Python 힙 (MB)"""
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current / 1024 ** 2, peak / 1024 ** 2
+
+
+def max_rss_mb():
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:  # Windows
+        return float("nan")
+
+
+vectorstore = load_vectorstore(VECTORSTORE_TYPE)
+config = VECTORSTORE_CONFIG[VECTORSTORE_TYPE]
+questions = load_test_questions(repeat=1)
+print(f"벡터스토어: {VECTORSTORE_TYPE} / 질문 {len(questions)}개 x {REPEAT}회")
+
+single, single_mem, single_peak = measure_memory(lambda: EnsembleRetriever(
+    retrievers=[DenseRetriever(vectorstore, k=K),
+                BM25BatchRetriever.from_documents(load_documents_from_vectorstore(vectorstore))],
+    weights=[0.5, 0.5]
+))
+rss_after_single = max_rss_mb()
+
+sharded, sharded_mem, sharded_peak = measure_memory(lambda: load_sharded_retriever(
+    config["path"], config["collection_name"], vectorstore.embeddings, k=K, client=vectorstore._client
+))
+rss_after_sharded = max_rss_mb()
+
+print("\n" + "=" * 70)
+print(f"{'[메모리] 단일 인덱스':<40} heap={single_mem:.1f}MB peak={single_peak:.1f}MB")
+print(f"{'[메모리] 샤드 ' + str(len(sharded.shards)) + '개':<40} heap={sharded_mem:.1f}MB peak={sharded_peak:.1f}MB")
+for name, shard in sharded.shards.items():
+    print(f"{'':<4}- {name:<10} {len(shard)}개 문서")
+print(f"{'[메모리] 최대 RSS':<40} 단일 로드 후={rss_after_single:.0f}MB 샤드 로드 후={rss_after_sharded:.0f}MB")
+
+# 임베딩 모델 워밍업 + 질문 임베딩 캐시 채우기 (두 방식 모두 같은 조건에서 검색 단계만 비교)
+single.retrievers[0].batch(questions)
+
+single_latencies, sharded_latencies = [], []
+methods, shard_counts, agreements = Counter(), [], []
+for _ in range(REPEAT):
+    for question in questions:
+        single_docs, t_single = timed(single.invoke, question)
+        sharded_docs, t_sharded = timed(sharded.invoke, question)
+        single_latencies.append(t_single)
+        sharded_latencies.append(t_sharded)
+
+        route = sharded.last_routes[0]
+        methods[route["method"]] += 1
+        shard_counts.append(len(route["shards"]))
+        sharded_contents = {doc.page_content for doc in sharded_docs}
+        if single_docs:
+            agreements.append(sum(doc.page_content in sharded_contents for doc in single_docs) / len(single_docs))
+
+print()
+print_summary("[지연시간] 단일 인덱스", summarize(single_latencies))
+print_summary("[지연시간] 샤드 + 라우터", summarize(sharded_latencies))
+
+total = sum(methods.values())
+print("\n라우팅 방식: " + " ".join(f"{method}={count / total:.1%}" for method, count in methods.most_common()))
+print(f"질문당 평균 검색 샤드 수: {sum(shard_counts) / len(shard_counts):.2f} (common 포함)")
+print(f"단일 인덱스 결과 일치율: {sum(agreements) / len(agreements) if agreements else 0:.3f}")
@@ -0,0 +1,82 @@
+'''
+시작 비용 벤치마크
+- import 시간: 새 파이썬 프로세스에서 모듈 import에 걸린 시간 (모델/DB 로드 없이 끝나야 함)
+- 초기화 시간: initialize_rag_system() (임베딩 모델 로드 + Chroma + BM25 인덱스)
+- 워밍업 시간: warm_up() (첫 인코딩 + 첫 검색)
+- 첫 답변 시간: 워밍업 이후 첫 질문을 그래프로 끝까지 처리하는 데 걸린 시간 (OPENAI_API_KEY가 있을 때만)
+
+결과는 output/startup_benchmark.csv에 한 줄씩 누적됩니다. (변경 전후 비교용)
+실행: python bench_startup.py
+'''
+
+import csv
+import os
+import subprocess
+import sys
+import time
+import warnings
+from datetime import datetime
+warnings.filterwarnings("ignore")
+
+from dotenv import load_dotenv
+
+from bench_utils import PROJECT_ROOT, VECTORSTORE_CONFIG
+
+load_dotenv()
+
+IMPORT_MODULES = ["prompt_module", "rag_graph", "rag_components"]
+QUESTION = "강아지 파보바이러스 증상은 무엇인가요?"
+RESULT_PATH = os.path.join(PROJECT_ROOT, "output", "startup_benchmark.csv")
+
+
+def measure_import(module: str) -> float:
+    """새 프로세스에서 import 시간(초) 측정 (이미 import된 모듈 캐시 영향 없이)"""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+row = {"timestamp": datetime.now().isoformat(timespec="seconds")}
+for module in IMPORT_MODULES:
+    row[f"import_{module}_s"] = measure_import(module)
+    print(f"import {module:<16} {row[f'import_{module}_s']:.2f}s")
+
+from prompt_module import (initialize_rag_system, get_rag_prompt, get_rewrite_prompt, format_docs,
+                           self_check_retriver)
+from rag_components import warm_up
+from rag_graph import build_rag_graph, run_rag_graph, format_timings
+
+config = VECTORSTORE_CONFIG["bge_m3"]
+start = time.perf_counter()
+rag_system = initialize_rag_system(vectorstore_path=config["path"], collection_name=config["collection_name"])
+row["initialize_s"] = time.perf_counter() - start
+print(f"initialize_rag_system  {row['initialize_s']:.2f}s")
+
+start = time.perf_counter()
+warm_up(rag_system)
+row["warm_up_s"] = time.perf_counter() - start
+print(f"warm_up                {row['warm_up_s']:.2f}s")
+
+if os.environ.get("OPENAI_API_KEY"):
+    rag_graph = build_rag_graph(
+        rag_system['retriever'], rag_system['llm'], get_rag_prompt(), get_rewrite_prompt(), format_docs,
+        self_check=lambda docs, question: self_check_retriver(docs, question, rag_system['llm'])
+    )
+    result = run_rag_graph(rag_graph, QUESTION)
+    row["first_answer_s"] = result["timings"]["total"]
+    print(f"첫 답변                  {row['first_answer_s']:.2f}s ({format_timings(result['timings'])})")
+else:
+    row["first_answer_s"] = ""
+    print("OPENAI_API_KEY가 없어 첫 답변 시간은 측정하지 않습니다.")
+
+row["startup_to_first_answer_s"] = (row["initialize_s"] + row["warm_up_s"] + (row["first_answer_s"] or 0))
+
+os.makedirs(os.path.dirname(RESULT_PATH), exist_ok=True)
+write_header = not os.path.exists(RESULT_PATH)
+with open(RESULT_PATH, "a", newline="", encoding="utf-8-sig") as f:
+    writer = csv.DictWriter(f, fieldnames=list(row))
+    if write_header:
+        writer.writeheader()
+    writer.writerow(row)
+print(f"\n결과 저장: {RESULT_PATH}")
@@ -0,0 +1,124 @@
+'''
+벤치마크 스크립트 공용 유틸
+- 테스트 데이터셋(output/pet_test_dataset_*.csv) 질문 로드
+- 벡터스토어 로드
+- 지연시간 통계 (평균 / p50 / p95 / p99)
+- 정답(reference) 단어 겹침 비율 (LLM 없이 검색 결과 관련도 근사)
+'''
+
+import os
+import re
+import time
+from typing import Callable, Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 벡터스토어 타입별 경로 / 컬렉션명 (vectorstore_*.py 에서 생성한 값과 동일해야 합니다)
+VECTORSTORE_CONFIG = {
+    "bge_m3": {
+        "path": os.path.join(PROJECT_ROOT, "data", "ChromaDB_bge_m3"),
+        "collection_name": "pet_health_qa_system_bge_m3",
+    },
+    "openai": {
+        "path": os.path.join(PROJECT_ROOT, "data", "ChromaDB_openai"),
+        "collection_name": "pet_health_qa_system",
+    },
+}
+
+
+def load_test_questions(dataset_types=("bge_m3", "openai"), repeat: int = 1) -> List[str]:
+    """테스트 데이터셋 CSV의 user_input 컬럼을 질문 리스트로 로드"""
+    import pandas as pd
+
+    questions = []
+    for dataset_type in dataset_types:
+        path = os.path.join(PROJECT_ROOT, "output", f"pet_test_dataset_{dataset_type}.csv")
+        if not os.path.exists(path):
+            print(f"✗ 테스트 데이터셋이 없습니다: {path}")
+            continue
+        questions.extend(pd.read_csv(path)["user_input"].dropna().tolist())
+    return questions * repeat
+
+
+def load_test_dataset(dataset_types=("bge_m3", "openai")) -> List[Dict[str, str]]:
+    """테스트 데이터셋을 [{'user_input': ..., 'reference': ...}] 형태로 로드"""
+    import pandas as pd
+
+    rows = []
+    for dataset_type in dataset_types:
+        path = os.path.join(PROJECT_ROOT, "output", f"pet_test_dataset_{dataset_type}.csv")
+        if os.path.exists(path):
+            rows.extend(pd.read_csv(path).dropna().to_dict("records"))
+    return rows
+
+
+def load_vectorstore(vectorstore_type: str = "bge_m3"):
+    """벤치마크용 벡터스토어 로드 (임베딩 모델은 벡터스토어 생성 시와 동일)"""
+    from langchain_community.vectorstores import Chroma
+
+    if vectorstore_type == "bge_m3":
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        embeddings = HuggingFaceEmbeddings(
+            model_name="BAAI/bge-m3",
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': True}
+        )
+    else:
+        from llm_governor import GovernedOpenAIEmbeddings
+        embeddings = GovernedOpenAIEmbeddings(model="text-embedding-3-small")
+
+    config = VECTORSTORE_CONFIG[vectorstore_type]
+    return Chroma(
+        persist_directory=config["path"],
+        collection_name=config["collection_name"],
+        embedding_function=embeddings
+    )
+
+
+def percentile(values: List[float], p: float) -> float:
+    """p 분위수 (선형 보간)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * p / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """지연시간 리스트(초) -> 통계 (ms)"""
+    if not latencies:
+        return {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    return {
+        "count": len(latencies),
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def timed(fn: Callable, *args, **kwargs):
+    """fn 실행 결과와 소요 시간(초)을 함께 반환"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+_WORD = re.compile(r"\w+")
+
+
+def reference_overlap(reference: str, text: str) -> float:
+    """정답 단어 중 문서에 나오는 단어 비율 (테스트 데이터셋은 문서로 만들었으므로 근거 문서일수록 높음)"""
+    reference_words = set(_WORD.findall(reference))
+    if not reference_words:
+        return 0.0
+    return len(reference_words & set(_WORD.findall(text))) / len(reference_words)
+
+
+def print_summary(title: str, stats: Dict[str, float]):
+    print(f"{title:<40} " + " ".join(
+        f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}"
+        for key, value in stats.items()
+    ))
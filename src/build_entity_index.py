@@ -0,0 +1,40 @@
+'''
+질병명 fast-path 인덱스 생성 (코퍼스 disease 메타데이터 -> 질병명 사전 + 질병 -> 청크 id postings)
+벡터스토어 폴더의 entity_index/<컬렉션>.json 으로 저장합니다. (인덱스 버전이 바뀌면 앱 시작 시 자동으로 다시 생성)
+
+실행:
+  python build_entity_index.py            # bge_m3 벡터스토어
+  python build_entity_index.py openai     # openai 벡터스토어
+'''
+
+import sys
+import time
+import warnings
+warnings.filterwarnings("ignore")
+
+from dotenv import load_dotenv
+
+from bench_utils import VECTORSTORE_CONFIG, load_vectorstore
+from entity_index import EntityIndex, entity_index_path
+from prompt_module import get_index_version
+from retrievers import load_documents_from_vectorstore
+
+load_dotenv()
+
+VECTORSTORE_TYPE = sys.argv[1] if len(sys.argv) > 1 else "bge_m3"
+
+vectorstore = load_vectorstore(VECTORSTORE_TYPE)
+config = VECTORSTORE_CONFIG[VECTORSTORE_TYPE]
+docs = load_documents_from_vectorstore(vectorstore)
+print(f"원본 컬렉션: {vectorstore._collection.name} ({len(docs)}개 문서)")
+
+start = time.perf_counter()
+index = EntityIndex.build(docs, version=get_index_version(vectorstore))
+path = entity_index_path(config["path"], config["collection_name"])
+index.save(path)
+print(f"질병명 인덱스 생성 완료 ({time.perf_counter() - start:.1f}초): {index.stats()}")
+print(f"저장: {path}")
+
+# postings가 큰 질병 (restrict 모드에서 후보가 많이 남는 질병)
+for disease, ids in sorted(index.postings.items(), key=lambda item: len(item[1]), reverse=True)[:10]:
+    print(f"  {disease}: {len(ids)}개 청크")
@@ -0,0 +1,94 @@
+'''
+자주 묻는 질문 미리 만든 답변 생성 (오프라인 작업)
+1. 질문 모으기: 질문별 계측 로그(output/request_metrics.jsonl) + --sample이면 테스트 데이터셋 질문
+2. 군집화: 질문 임베딩 코사인 유사도 --threshold(기본 0.85) 이상이면 같은 군집 (faq_answers.cluster_questions)
+3. 질문 수가 많은 상위 군집마다 대표 질문으로 서비스와 같은 그래프(rag_service.build_service_graph)를 끝까지 실행
+4. 검증(참고 문서 있음, 단계 생략 없음)을 통과한 답변만 서비스에서 사용 -> 벡터스토어 폴더의 faq_answers/<컬렉션>.json
+   저장된 JSON에서 approved를 false로 바꾸면 그 답변은 사용하지 않음 (인덱스가 바뀌어 다시 생성해도 유지)
+
+서비스에서 사용: .env에 FAQ_ANSWERS=1 (FAQ_THRESHOLD로 유사도 기준 조정)
+인덱스 버전(컬렉션 이름 + 문서 수)이 바뀌면 서비스가 시작할 때 백그라운드에서 다시 생성합니다.
+
+실행: python build_faq_answers.py [bge_m3|openai] [군집 수] [--sample] [--min-size=2] [--threshold=0.85] [--log=경로]
+'''
+
+import os
+import sys
+import time
+import warnings
+warnings.filterwarnings("ignore")
+
+from dotenv import load_dotenv
+
+from bench_utils import PROJECT_ROOT, VECTORSTORE_CONFIG, load_test_dataset
+from faq_answers import CLUSTER_THRESHOLD, FAQAnswers, cluster_questions, faq_answers_path, load_logged_questions
+from prompt_module import initialize_rag_system
+from rag_components import setup_langsmith
+from rag_service import FAQ_THRESHOLD, build_service_graph, faq_generator, retrieval_options
+
+load_dotenv()
+
+
+def _option(name: str, default: str) -> str:
+    for arg in sys.argv[1:]:
+        if arg.startswith(f"--{name}="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+VECTORSTORE_TYPE = args[0] if len(args) > 0 else "bge_m3"
+NUM_CLUSTERS = int(args[1]) if len(args) > 1 else 20
+USE_SAMPLE = "--sample" in sys.argv
+MIN_SIZE = int(_option("min-size", "2"))
+THRESHOLD = float(_option("threshold", str(CLUSTER_THRESHOLD)))
+LOG_PATH = _option("log", os.getenv("RAG_METRICS_LOG", os.path.join(PROJECT_ROOT, "output", "request_metrics.jsonl")))
+
+config = VECTORSTORE_CONFIG[VECTORSTORE_TYPE]
+
+# ---------------------------
+# 1. 질문 모으기
+# ---------------------------
+questions = load_logged_questions(LOG_PATH)
+print(f"질문 로그: {LOG_PATH} ({len(questions)}개)")
+if USE_SAMPLE:
+    sample = [row["user_input"] for row in load_test_dataset()]
+    questions += sample
+    print(f"테스트 데이터셋 질문 {len(sample)}개 추가")
+if not questions:
+    sys.exit("군집화할 질문이 없습니다. (질문 로그가 없으면 --sample)")
+
+# ---------------------------
+# 2. 군집화 (서비스와 같은 임베딩)
+# ---------------------------
+setup_langsmith()
+rag_system = initialize_rag_system(vectorstore_path=config["path"], collection_name=config["collection_name"],
+                                   **retrieval_options())
+start = time.perf_counter()
+clusters = cluster_questions(questions, rag_system['embeddings'], threshold=THRESHOLD)
+print(f"군집화 {time.perf_counter() - start:.1f}초: 질문 {len(questions)}개 -> 군집 {len(clusters)}개")
+
+# 샘플 질문만 쓸 때는 질문이 1번씩만 나오므로 최소 크기를 적용하지 않음
+min_size = MIN_SIZE if len(questions) > len(set(questions)) else 1
+top = [cluster for cluster in clusters if cluster["size"] >= min_size][:NUM_CLUSTERS]
+covered = sum(cluster["size"] for cluster in top)
+print(f"상위 군집 {len(top)}개가 전체 질문의 {covered / len(questions):.0%}")
+
+# ---------------------------
+# 3. 답변 생성 + 검증
+# ---------------------------
+graph = build_service_graph(rag_system, config["path"])
+start = time.perf_counter()
+faq = FAQAnswers.build(rag_system['embeddings'], top, faq_generator(graph), version=rag_system['index_version'],
+                       threshold=FAQ_THRESHOLD)
+print(f"답변 생성 {time.perf_counter() - start:.1f}초")
+
+path = faq_answers_path(config["path"], config["collection_name"])
+faq.save(path)
+
+print("\n" + "=" * 70)
+for entry in faq.entries:
+    status = "사용" if entry["approved"] else f"제외({entry['reason']})"
+    print(f"[{status}] {entry['size']}회 / 문서 {len(entry['docs'])}개 | {entry['question']}")
+metrics = faq.metrics()
+print(f"\n저장: {path} (답변 {metrics['entries']}개 중 {metrics['approved']}개 사용, 인덱스 버전 {faq.version})")
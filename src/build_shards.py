@@ -0,0 +1,32 @@
+'''
+진료과별 샤드 인덱스 생성 (원본 ChromaDB 컬렉션의 문서/임베딩을 복사하므로 재임베딩 없음)
+
+실행:
+  python build_shards.py                       # bge_m3 벡터스토어 전체 샤드 생성
+  python build_shards.py openai                # openai 벡터스토어 전체 샤드 생성
+  python build_shards.py bge_m3 eye skin       # 안과/피부과 샤드만 다시 생성
+
+샤드 이름: internal(내과) eye(안과) surgery(외과) dental(치과) skin(피부과) common(진료과 없음)
+'''
+
+import sys
+import time
+import warnings
+warnings.filterwarnings("ignore")
+
+from dotenv import load_dotenv
+
+from bench_utils import VECTORSTORE_CONFIG, load_vectorstore
+from sharding import build_shards
+
+load_dotenv()
+
+VECTORSTORE_TYPE = sys.argv[1] if len(sys.argv) > 1 else "bge_m3"
+SHARDS = sys.argv[2:] or None
+
+vectorstore = load_vectorstore(VECTORSTORE_TYPE)
+print(f"원본 컬렉션: {vectorstore._collection.name} ({vectorstore._collection.count()}개 문서)")
+
+start = time.perf_counter()
+counts = build_shards(vectorstore, VECTORSTORE_CONFIG[VECTORSTORE_TYPE]["path"], shards=SHARDS)
+print(f"\n샤드 {len(counts)}개 생성 완료 - 총 {sum(counts.values())}개 문서, {time.perf_counter() - start:.1f}초")
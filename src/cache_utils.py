@@ -0,0 +1,195 @@
+'''
+캐시 공용 유틸
+- normalize_query: 질문 정규화 (캐시 키용)
+- LRUCache: 프로세스 내 LRU 캐시 (TTL 선택)
+- SQLiteCache: 로컬 파일 기반 영구 캐시 (TTL, 최대 개수 초과 시 오래된 항목부터 삭제)
+- CacheStats: 적중률 카운터
+'''
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def normalize_query(text: str) -> str:
+    """
+    캐시 키용 질문 정규화
+    - 유니코드 NFC 정규화 (한글 자모 분리 입력 대응)
+    - 앞뒤 공백 제거, 연속 공백 1개로
+    - 영문 소문자화
+    - 끝의 물음표/마침표/느낌표 제거
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    text = re.sub(r"\s+", " ", text).strip().lower()
+    return text.rstrip("?!.？！。 ")
+
+
+def make_key(*parts: str) -> str:
+    """여러 문자열을 합쳐 고정 길이 해시 키 생성"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class CacheStats:
+    """캐시 적중/미스 카운터 (스레드 안전)"""
+
+    def __init__(self, *names: str):
+        self._lock = threading.Lock()
+        self._counts = {name: 0 for name in names}
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    def get(self, name: str) -> int:
+        return self._counts.get(name, 0)
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+class LRUCache:
+    """프로세스 내 LRU 캐시 (max_size 초과 시 가장 오래 사용하지 않은 항목 제거)"""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, created_at = item
+            if self.ttl is not None and time.time() - created_at > self.ttl:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    로컬 SQLite 파일 기반 key-value 캐시
+    - namespace 별로 항목을 구분 (모델 / 프롬프트 버전 등)
+    - ttl(초)이 지난 항목은 조회 시 무시하고 삭제
+    - 항목 수가 max_entries를 넘으면 마지막 사용 시각이 오래된 항목부터 삭제
+    """
+
+    def __init__(self, path: str, namespace: str = "default",
+                 max_entries: int = 100_000, ttl: Optional[float] = None):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (namespace, accessed_at)")
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+                return None
+            self._conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+            return value
+
+    def put(self, key: str, value: bytes):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, value, now, now),
+            )
+            self._puts_since_evict += 1
+            # 매 put마다 COUNT를 세지 않도록 일정 횟수마다 정리
+            if self._puts_since_evict >= max(1, self.max_entries // 100):
+                self._evict()
+                self._puts_since_evict = 0
+
+    def _evict(self):
+        """TTL 만료 항목과 max_entries 초과분 삭제 (lock 안에서 호출)"""
+        if self.ttl is not None:
+            self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND created_at < ?",
+                (self.namespace, time.time() - self.ttl),
+            )
+        count = self._conn.execute("SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute("""
+                DELETE FROM cache WHERE namespace = ? AND key IN (
+                    SELECT key FROM cache WHERE namespace = ? ORDER BY accessed_at ASC LIMIT ?
+                )
+            """, (self.namespace, self.namespace, overflow))
+
+    def clear(self):
+        """현재 namespace의 항목 전체 삭제"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,147 @@
+'''
+검색 결과 인접 청크 이어 붙이기 (검색 후처리)
+- 같은 원본 레코드(상담기록 1건 / 서적 문서 1건)에서 나온 청크끼리 묶어 chunk_index 순으로 정렬
+  레코드는 청크 메타데이터의 record_id로 구분 (preprocessing.py / index_updater.py가 기록)
+  record_id가 없는 청크(이전에 만든 벡터스토어)는 합치지 않음 -> 같은 서적의 다른 질병 문서가 섞이지 않음
+- 연속된 청크(chunk_index가 1 차이)는 하나의 문서로 합치고, splitter의 chunk_overlap(50~100자)으로
+  겹친 앞부분을 제거 -> 같은 문장이 LLM에 두 번 들어가지 않음
+- fetch_neighbors가 있으면 사이에 빠진 청크(최대 max_gap개)를 벡터스토어에서 가져와 끊긴 구간을 이어줌
+- 합친 문서는 묶음 안에서 가장 순위가 높은 청크 자리에 둠 (관련도 순서 유지)
+
+내용은 빠지지 않고 겹친 부분만 줄어듭니다. 겹침을 찾지 못한 인접 청크는 줄바꿈으로 이어 붙입니다.
+'''
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+# 원본 레코드 id 메타데이터 (전처리 시 원본 JSON 파일 / 증분 반영 시 상담기록 id)
+# 제목 / 저자 / 진료과 / 폴더는 같은 서적의 다른 질병 문서끼리 같으므로 레코드 구분에 쓰지 않음
+RECORD_ID_FIELD = "record_id"
+MAX_OVERLAP_CHARS = 200
+MIN_OVERLAP_CHARS = 5
+
+
+def record_key(metadata: dict) -> Optional[Tuple]:
+    """원본 레코드 식별 키 (레코드 id / 청크 정보가 없는 문서는 None -> 합치지 않음)"""
+    if not metadata.get(RECORD_ID_FIELD):
+        return None
+    if metadata.get("chunk_index") is None or metadata.get("total_chunks") is None:
+        return None
+    return metadata[RECORD_ID_FIELD], metadata["total_chunks"]
+
+
+def overlap_length(previous: str, following: str, max_overlap: int = MAX_OVERLAP_CHARS,
+                   min_overlap: int = MIN_OVERLAP_CHARS) -> int:
+    """following 앞부분이 previous 끝부분과 겹치는 길이 (가장 긴 겹침, 없으면 0)"""
+    previous = previous.rstrip()
+    for length in range(min(max_overlap, len(previous), len(following)), min_overlap - 1, -1):
+        if previous.endswith(following[:length]):
+            return length
+    return 0
+
+
+def merge_chunks(chunks: Sequence[Document]) -> Document:
+    """chunk_index 순으로 정렬된 연속 청크 -> 겹침을 제거한 문서 1개"""
+    text = chunks[0].page_content
+    for chunk in chunks[1:]:
+        overlap = overlap_length(text, chunk.page_content)
+        rest = chunk.page_content[overlap:]
+        text = text.rstrip() + (rest if overlap else "\n" + rest)
+
+    metadata = {**chunks[0].metadata, "chunk_indices": [chunk.metadata["chunk_index"] for chunk in chunks]}
+    return Document(page_content=text, metadata=metadata, id=chunks[0].id)
+
+
+def _where(metadata: dict, chunk_indices: List[int]) -> dict:
+    return {"$and": [{RECORD_ID_FIELD: metadata[RECORD_ID_FIELD]},
+                     {"total_chunks": metadata["total_chunks"]},
+                     {"chunk_index": {"$in": chunk_indices}}]}
+
+
+def chroma_neighbor_fetcher(vectorstore) -> Callable[[dict, List[int]], List[Document]]:
+    """(레코드 메타데이터, 가져올 chunk_index 목록) -> 청크 문서 목록 (Chroma get 1회)"""
+    collection = vectorstore._collection
+
+    def fetch(metadata: dict, chunk_indices: List[int]) -> List[Document]:
+        result = collection.get(where=_where(metadata, chunk_indices), include=["documents", "metadatas"])
+        return [
+            Document(page_content=text, metadata=meta or {}, id=doc_id)
+            for doc_id, text, meta in zip(result["ids"], result["documents"], result["metadatas"])
+        ]
+
+    return fetch
+
+
+def _fill_gaps(chunks: List[Document], fetch_neighbors, max_gap: int) -> List[Document]:
+    """max_gap개 이하로 끊긴 구간의 빠진 청크를 가져와 채움"""
+    present = {chunk.metadata["chunk_index"] for chunk in chunks}
+    missing = []
+    for previous, following in zip(chunks, chunks[1:]):
+        gap = following.metadata["chunk_index"] - previous.metadata["chunk_index"] - 1
+        if 0 < gap <= max_gap:
+            missing.extend(range(previous.metadata["chunk_index"] + 1, following.metadata["chunk_index"]))
+    if not missing:
+        return chunks
+
+    try:
+        fetched = fetch_neighbors(chunks[0].metadata, missing)
+    except Exception as e:
+        print(f"인접 청크 조회 실패: {e}")
+        return chunks
+
+    extra = {}
+    for doc in fetched:
+        index = doc.metadata.get("chunk_index")
+        if index in missing and index not in present and record_key(doc.metadata) == record_key(chunks[0].metadata):
+            extra[index] = doc
+    return sorted(chunks + list(extra.values()), key=lambda chunk: chunk.metadata["chunk_index"])
+
+
+def stitch_chunks(docs: List[Document], fetch_neighbors: Optional[Callable[[dict, List[int]], List[Document]]] = None,
+                  max_gap: int = 1) -> List[Document]:
+    """
+    검색 결과(관련도 순) -> 같은 레코드의 연속 청크를 합친 결과 (관련도 순)
+    fetch_neighbors: chroma_neighbor_fetcher(vectorstore) 등. None이면 빠진 청크는 채우지 않음
+    """
+    groups: Dict[Tuple, List[Tuple[int, Document]]] = {}
+    order: List[Tuple[int, object]] = []  # (순위, 그룹 키 또는 단독 문서)
+
+    for rank, doc in enumerate(docs):
+        key = record_key(doc.metadata)
+        if key is None:
+            order.append((rank, doc))
+            continue
+        if key not in groups:
+            groups[key] = []
+            order.append((rank, key))
+        groups[key].append((rank, doc))
+
+    stitched = []
+    for _, item in order:
+        if isinstance(item, Document):
+            stitched.append(item)
+            continue
+
+        # 같은 청크가 여러 번 검색된 경우 하나만 사용
+        chunks = list({doc.metadata["chunk_index"]: doc for _, doc in reversed(groups[item])}.values())
+        chunks.sort(key=lambda chunk: chunk.metadata["chunk_index"])
+        if fetch_neighbors is not None and max_gap > 0:
+            chunks = _fill_gaps(chunks, fetch_neighbors, max_gap)
+
+        # 연속 구간별로 합치고, 구간은 가장 높은 순위(가장 앞 rank) 순서로 배치
+        ranks = {}
+        for rank, doc in groups[item]:
+            ranks.setdefault(doc.metadata["chunk_index"], rank)
+        runs, run = [], [chunks[0]]
+        for chunk in chunks[1:]:
+            if chunk.metadata["chunk_index"] == run[-1].metadata["chunk_index"] + 1:
+                run.append(chunk)
+            else:
+                runs.append(run)
+                run = [chunk]
+        runs.append(run)
+        runs.sort(key=lambda run: min(ranks.get(chunk.metadata["chunk_index"], len(docs)) for chunk in run))
+        stitched.extend(merge_chunks(run) if len(run) > 1 else run[0] for run in runs)
+
+    return stitched
@@ -0,0 +1,133 @@
+'''
+토큰 예산 기반 context 구성
+- tiktoken으로 LLM 입력 토큰 수를 세면서 관련도 순(검색/검증 결과 순서)으로 문서를 채움
+- 예산을 넘는 문서, 문서별 상한(max_doc_tokens)을 넘는 문서는 문장 경계에서 잘라서 넣음
+- 요청마다 사용한 토큰 수를 통계로 반환
+
+문서 하나를 문자열로 만드는 방식은 주입받은 format_docs([doc])를 그대로 사용하므로
+프롬프트에 들어가는 형식(<document> 블록 + 출처)은 기존과 같습니다.
+'''
+
+import re
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+DEFAULT_TOKEN_MODEL = "gpt-4o-mini"
+
+# 문장 끝: 마침표/물음표/느낌표 뒤 공백, 또는 줄바꿈
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?。])\s+|\n+")
+
+
+def split_sentences(text: str) -> List[str]:
+    """문장 단위로 분리 (빈 문장 제거)"""
+    return [sentence.strip() for sentence in _SENTENCE_BOUNDARY.split(text) if sentence and sentence.strip()]
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    """tiktoken 인코더 (BPE 파일을 받을 수 없는 오프라인 환경 등에서는 None)"""
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"tiktoken 인코더 로드 실패 ({e}) - 글자 수 기반 추정으로 토큰 수를 셉니다.")
+        return None
+
+
+def count_tokens(text: str, model: str = DEFAULT_TOKEN_MODEL) -> int:
+    """model 기준 토큰 수 (tiktoken을 쓸 수 없으면 한국어 기준 약 1.5글자 = 1토큰으로 추정)"""
+    encoding = _encoding(model)
+    if encoding is None:
+        return -(-len(text) * 2 // 3)
+    return len(encoding.encode(text))
+
+
+class ContextBuilder:
+    """
+    토큰 예산 안에서 context 문자열 구성
+    max_tokens: context 전체 토큰 예산
+    max_doc_tokens: 문서 하나의 토큰 상한 (None이면 제한 없음)
+    min_trim_tokens: 남은 예산이 이보다 작으면 잘라서 넣지 않고 멈춤
+    """
+
+    def __init__(self, format_docs: Callable[[List[Document]], str], max_tokens: int = 2000,
+                 max_doc_tokens: Optional[int] = None, min_trim_tokens: int = 60,
+                 model: str = DEFAULT_TOKEN_MODEL, separator: str = "\n\n"):
+        self.format_docs = format_docs
+        self.max_tokens = max_tokens
+        self.max_doc_tokens = max_doc_tokens
+        self.min_trim_tokens = min_trim_tokens
+        self.model = model
+        self.separator = separator
+        self._separator_tokens = count_tokens(separator, model)
+
+    def _block_tokens(self, doc: Document) -> int:
+        return count_tokens(self.format_docs([doc]), self.model)
+
+    def _trim(self, doc: Document, limit: int) -> Optional[Document]:
+        """문장 경계에서 잘라 limit 토큰 이하로 만든 문서 (한 문장도 들어가지 않으면 None)"""
+        sentences = split_sentences(doc.page_content)
+        # 내용이 없을 때의 블록(출처 등) 토큰 + 문장별 토큰을 더해가며 들어가는 만큼만 사용
+        used = count_tokens(self.format_docs([Document(page_content="", metadata=doc.metadata)]), self.model)
+        kept = []
+        for sentence in sentences:
+            sentence_tokens = count_tokens(sentence + " ", self.model)
+            if used + sentence_tokens > limit:
+                break
+            kept.append(sentence)
+            used += sentence_tokens
+        if not kept:
+            return None
+        return Document(page_content=" ".join(kept), metadata={**doc.metadata, "trimmed": True}, id=doc.id)
+
+    def build(self, docs: List[Document], max_tokens: Optional[int] = None) -> Tuple[str, List[Document], dict]:
+        """
+        반환: (context 문자열, 실제로 들어간 문서(잘린 문서는 잘린 내용), 통계)
+        통계: tokens(사용), budget, tokens_before(예산 적용 전 전체), docs_in, docs_used, docs_trimmed
+        max_tokens: 이번 호출에만 쓸 예산 (마감 시간이 얼마 남지 않아 context를 줄일 때)
+        """
+        budget = self.max_tokens if max_tokens is None else max_tokens
+        blocks, used_docs = [], []
+        used_tokens, tokens_before, trimmed = 0, 0, 0
+        full = False
+
+        for doc in docs:
+            block_tokens = self._block_tokens(doc)
+            tokens_before += block_tokens + (self._separator_tokens if tokens_before else 0)
+            if full:
+                # 예산을 다 쓴 뒤에는 예산 적용 전 토큰 수만 집계
+                continue
+
+            remaining = budget - used_tokens - (self._separator_tokens if blocks else 0)
+            limit = remaining if self.max_doc_tokens is None else min(remaining, self.max_doc_tokens)
+
+            if block_tokens > limit:
+                if remaining < self.min_trim_tokens:
+                    full = True
+                    continue
+                doc = self._trim(doc, limit)
+                if doc is None:
+                    continue
+                block_tokens = self._block_tokens(doc)
+                trimmed += 1
+
+            blocks.append(self.format_docs([doc]))
+            used_docs.append(doc)
+            used_tokens += block_tokens + (self._separator_tokens if len(blocks) > 1 else 0)
+
+        context = self.separator.join(blocks)
+        stats = {
+            "tokens": count_tokens(context, self.model) if blocks else 0,
+            "budget": budget,
+            "tokens_before": tokens_before,
+            "docs_in": len(docs),
+            "docs_used": len(used_docs),
+            "docs_trimmed": trimmed,
+        }
+        return context, used_docs, stats
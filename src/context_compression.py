@@ -0,0 +1,76 @@
+'''
+문장 단위 추출 압축 (생성 전 context 줄이기, 선택 단계)
+- 검증을 통과한 문서를 문장으로 나누고, 이미 로드된 BGE-M3 임베딩으로 질문과의 유사도를 계산
+  (모든 문서의 문장을 embed_documents 1회로 한 번에 인코딩, 질문 임베딩은 검색 때 캐시된 값 재사용)
+- 문서마다 점수가 높은 문장 top_k개만 원래 순서대로 남김 (메타데이터는 그대로라 출처 표시는 유지)
+- 요청마다 압축률(남은 글자 수 / 원래 글자 수)과 압축 소요 시간을 통계로 반환
+
+LLM을 쓰지 않는 로컬 단계라 추가 API 비용이 없습니다.
+'''
+
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from context_builder import split_sentences
+
+
+class SentenceCompressor:
+    """
+    embeddings: 검색에 쓰는 임베딩 (CachedEmbeddings 가능, normalize_embeddings=True 전제)
+    top_k: 문서별로 남길 문장 수 (문장이 top_k개 이하인 문서는 그대로)
+    min_score: 이 점수 미만 문장은 top_k 안이어도 제외 (단, 문서마다 최고 점수 문장 1개는 항상 남김)
+    """
+
+    def __init__(self, embeddings, top_k: int = 3, min_score: Optional[float] = None):
+        self.embeddings = embeddings
+        self.top_k = top_k
+        self.min_score = min_score
+
+    def _select(self, scores: np.ndarray) -> List[int]:
+        """문장 점수 -> 남길 문장 인덱스 (원래 순서)"""
+        ranked = np.argsort(-scores)[:self.top_k]
+        keep = [int(i) for i in ranked if self.min_score is None or scores[i] >= self.min_score]
+        return sorted(keep or [int(ranked[0])])
+
+    def compress(self, docs: List[Document], question: str) -> Tuple[List[Document], dict]:
+        """
+        반환: (압축된 문서, 통계)
+        통계: chars_before, chars_after, ratio(남은 비율), sentences_before, sentences_after, seconds
+        """
+        start = time.perf_counter()
+        sentences_per_doc = [split_sentences(doc.page_content) for doc in docs]
+        targets = [i for i, sentences in enumerate(sentences_per_doc) if len(sentences) > self.top_k]
+        all_sentences = [sentence for i in targets for sentence in sentences_per_doc[i]]
+
+        compressed = list(docs)
+        if all_sentences:
+            query_vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+            sentence_vectors = np.asarray(self.embeddings.embed_documents(all_sentences), dtype=np.float32)
+            scores = sentence_vectors @ query_vector
+
+            offset = 0
+            for i in targets:
+                sentences = sentences_per_doc[i]
+                keep = self._select(scores[offset:offset + len(sentences)])
+                offset += len(sentences)
+                doc = docs[i]
+                compressed[i] = Document(
+                    page_content=" ".join(sentences[j] for j in keep),
+                    metadata={**doc.metadata, "compressed": True},
+                    id=doc.id
+                )
+
+        chars_before = sum(len(doc.page_content) for doc in docs)
+        chars_after = sum(len(doc.page_content) for doc in compressed)
+        stats = {
+            "chars_before": chars_before,
+            "chars_after": chars_after,
+            "ratio": chars_after / chars_before if chars_before else 1.0,
+            "sentences_before": sum(map(len, sentences_per_doc)),
+            "sentences_after": sum(len(split_sentences(doc.page_content)) for doc in compressed),
+            "seconds": time.perf_counter() - start,
+        }
+        return compressed, stats
@@ -0,0 +1,133 @@
+'''
+요청별 지연시간 예산(deadline)과 단계 생략 정책
+모델 API가 느려져도 질문 1개의 응답 시간이 예산을 넘지 않도록, 남은 시간에 따라 단계를 줄입니다.
+- Deadline: 요청 시작 시점 기준 예산(초) -> 남은 시간
+- DegradationPolicy: 생성에 남겨 둘 시간, 선택 단계(self-check / rewrite) 생략 기준, context 축소 기준
+- call_with_timeout: 제한 시간 안에 끝나지 않으면 기다리지 않고 DeadlineExceeded (작업 스레드는 뒤에서 끝남)
+- stream_with_deadline: 다음 토큰이 남은 시간 안에 오지 않으면 DeadlineExceeded
+
+적용한 생략/대체는 질문 처리 그래프(rag_graph.py)가 state["degraded"]와 계측(instrumentation.record_degradation)에 기록합니다.
+'''
+
+import contextvars
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, Iterable, Iterator
+
+
+class DeadlineExceeded(TimeoutError):
+    """요청 예산 안에 단계가 끝나지 않음"""
+
+
+class Deadline:
+    """요청 1개의 마감 시각 (time.monotonic 기준)"""
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    @classmethod
+    def at(cls, expires_at: float) -> "Deadline":
+        deadline = cls.__new__(cls)
+        deadline.expires_at = expires_at
+        deadline.budget = max(0.0, expires_at - time.monotonic())
+        return deadline
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class DegradationPolicy:
+    """
+    남은 시간(초)에 따른 단계 생략 기준
+    generate_reserve: 답변 생성에 남겨 둘 시간 - 선택 단계(self-check / rewrite)는 남은 시간에서 이만큼 뺀 시간만 사용
+    self_check_min / rewrite_min: 선택 단계에 쓸 수 있는 시간이 이보다 적으면 실행하지 않음
+    reduce_context_below: 생성 시작 시 남은 시간이 이보다 적으면 context를 reduced_context_ratio 비율로 줄임
+    generate_min: 생성 시작 시 남은 시간이 이보다 적으면 LLM 없이 대체 답변 (캐시 / 검색 문서)
+    """
+
+    def __init__(self, generate_reserve: float = 8.0, self_check_min: float = 2.0, rewrite_min: float = 1.5,
+                 reduce_context_below: float = 12.0, reduced_context_ratio: float = 0.5, generate_min: float = 2.0):
+        self.generate_reserve = generate_reserve
+        self.self_check_min = self_check_min
+        self.rewrite_min = rewrite_min
+        self.reduce_context_below = reduce_context_below
+        self.reduced_context_ratio = reduced_context_ratio
+        self.generate_min = generate_min
+
+    @classmethod
+    def from_env(cls) -> "DegradationPolicy":
+        """.env의 DEADLINE_GENERATE_RESERVE / DEADLINE_GENERATE_MIN 등으로 기본값 변경"""
+        defaults = cls()
+        return cls(**{
+            name: float(os.getenv(f"DEADLINE_{name.upper()}", getattr(defaults, name)))
+            for name in ("generate_reserve", "self_check_min", "rewrite_min", "reduce_context_below",
+                         "reduced_context_ratio", "generate_min")
+        })
+
+    def optional_budget(self, deadline: Deadline) -> float:
+        """선택 단계(self-check / rewrite)에 쓸 수 있는 시간"""
+        return deadline.remaining() - self.generate_reserve
+
+
+def call_with_timeout(fn: Callable, timeout: float, *args, **kwargs):
+    """
+    fn을 작업 스레드에서 실행하고 timeout(초)까지만 기다림 (넘으면 DeadlineExceeded)
+    계측 컨텍스트(현재 질문 trace / 단계)는 작업 스레드로 복사
+    """
+    if timeout <= 0:
+        raise DeadlineExceeded("남은 시간이 없습니다.")
+    # 시간이 지나도 결과를 기다리지 않도록 executor는 wait=False로 종료 (self_check_retriver와 같은 방식)
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        future = executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise DeadlineExceeded(f"{timeout:.1f}초 안에 끝나지 않았습니다.")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+_END = object()
+
+
+def stream_with_deadline(make_stream: Callable[[], Iterable], deadline: Deadline) -> Iterator:
+    """
+    make_stream()의 청크를 그대로 전달하되, 다음 청크가 마감 전에 오지 않으면 DeadlineExceeded
+    (생산 스레드는 소비가 끝나면 다음 청크에서 멈춤)
+    """
+    chunks: "queue.Queue" = queue.Queue()
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            for chunk in make_stream():
+                if stopped.is_set():
+                    return
+                chunks.put(chunk)
+            chunks.put(_END)
+        except Exception as e:
+            chunks.put(e)
+
+    threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True).start()
+    try:
+        while True:
+            try:
+                item = chunks.get(timeout=deadline.remaining())
+            except queue.Empty:
+                raise DeadlineExceeded("답변 생성이 마감 시간을 넘었습니다.")
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
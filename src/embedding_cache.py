@@ -0,0 +1,107 @@
+'''
+질문 임베딩 캐시
+initialize_rag_system이 반환하는 embeddings를 감싸서, 같은 질문은 다시 인코딩하지 않습니다.
+- 1단계: 프로세스 내 LRU (메모리)
+- 2단계(선택): SQLite 영구 캐시 (재실행/평가 재실행 간 공유)
+- 문서 임베딩(embed_documents)은 인덱싱 용도이므로 캐시하지 않고 그대로 전달합니다.
+'''
+
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from cache_utils import CacheStats, LRUCache, SQLiteCache, make_key, normalize_query
+
+
+def embedding_model_name(embeddings) -> str:
+    """임베딩 모델 식별자 (캐시 namespace용)"""
+    for attr in ("model_name", "model"):
+        name = getattr(embeddings, attr, None)
+        if isinstance(name, str) and name:
+            return name
+    return type(embeddings).__name__
+
+
+class CachedEmbeddings(Embeddings):
+    """질문 임베딩 캐시 래퍼 (LangChain Embeddings 인터페이스 그대로 사용 가능)"""
+
+    def __init__(self, embeddings: Embeddings, persist_path: Optional[str] = None,
+                 max_memory_entries: int = 2048, max_disk_entries: int = 100_000):
+        self.embeddings = embeddings
+        self.namespace = f"query_embedding:{embedding_model_name(embeddings)}"
+        self.memory = LRUCache(max_size=max_memory_entries)
+        self.disk = SQLiteCache(persist_path, namespace=self.namespace, max_entries=max_disk_entries) if persist_path else None
+        self.stats = CacheStats("memory_hits", "disk_hits", "misses")
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        vector = self.memory.get(key)
+        if vector is not None:
+            self.stats.incr("memory_hits")
+            return vector
+
+        if self.disk is not None:
+            blob = self.disk.get(key)
+            if blob is not None:
+                vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                self.memory.put(key, vector)
+                self.stats.incr("disk_hits")
+                return vector
+
+        self.stats.incr("misses")
+        return None
+
+    def _store(self, key: str, vector: List[float]):
+        self.memory.put(key, vector)
+        if self.disk is not None:
+            self.disk.put(key, np.asarray(vector, dtype=np.float32).tobytes())
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        질문 여러 개 임베딩 - 캐시에 없는 질문만 모아서 한 번에 인코딩
+        정규화(normalize_query)는 캐시 키에만 쓰고, 인코딩은 원래 질문으로 (캐시 없을 때와 같은 벡터)
+        """
+        keys = [make_key(self.namespace, normalize_query(text)) for text in texts]
+
+        vectors = [self._lookup(key) for key in keys]
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], []).append(i)
+
+        if missing:
+            missing_keys = list(missing.keys())
+            missing_texts = [texts[missing[key][0]] for key in missing_keys]
+            if hasattr(self.embeddings, "embed_queries"):
+                # 마이크로 배칭 인코더(query_batcher.py): 다른 요청의 질문과 함께 인코딩
+                computed = self.embeddings.embed_queries(missing_texts)
+            elif len(missing_texts) == 1:
+                computed = [self.embeddings.embed_query(missing_texts[0])]
+            else:
+                computed = self.embeddings.embed_documents(missing_texts)
+            for key, vector in zip(missing_keys, computed):
+                vector = list(vector)
+                self._store(key, vector)
+                for i in missing[key]:
+                    vectors[i] = vector
+
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def cache_metrics(self) -> dict:
+        """적중률 지표"""
+        counts = self.stats.as_dict()
+        lookups = counts["memory_hits"] + counts["disk_hits"] + counts["misses"]
+        hits = counts["memory_hits"] + counts["disk_hits"]
+        return {
+            **counts,
+            "lookups": lookups,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_size": len(self.memory),
+            "disk_size": len(self.disk) if self.disk is not None else 0,
+        }
@@ -1,34 +1,125 @@
-from typing import List
+import os
+from typing import List, Optional, Tuple
 from langchain_core.documents import Document
 
+from instrumentation import METRICS, stage
+
+
+class AdaptiveCutoff:
+    """
+    결합 점수 분포에 따라 결합 결과를 자르는 기준 (쉬운 질문은 상위 1~2개만 self-check / 생성 단계로)
+    relative_threshold: 1위 점수 대비 이 비율보다 낮은 문서부터 제외
+    max_gap: 바로 앞 문서와의 점수 차이가 1위 점수 대비 이 비율 이상이면 그 앞에서 자름
+    min_docs / max_docs: 자른 뒤에도 최소 / 최대 문서 수 (max_docs=None이면 제한 없음)
+    """
+
+    def __init__(self, relative_threshold: float = 0.5, max_gap: float = 0.3, min_docs: int = 2,
+                 max_docs: Optional[int] = None):
+        self.relative_threshold = relative_threshold
+        self.max_gap = max_gap
+        self.min_docs = min_docs
+        self.max_docs = max_docs
+
+    @classmethod
+    def from_env(cls) -> "AdaptiveCutoff":
+        """.env의 CUTOFF_RELATIVE_THRESHOLD / CUTOFF_MAX_GAP / CUTOFF_MIN_DOCS / CUTOFF_MAX_DOCS로 기본값 변경"""
+        max_docs = int(os.getenv("CUTOFF_MAX_DOCS", "0"))
+        return cls(relative_threshold=float(os.getenv("CUTOFF_RELATIVE_THRESHOLD", "0.5")),
+                   max_gap=float(os.getenv("CUTOFF_MAX_GAP", "0.3")),
+                   min_docs=int(os.getenv("CUTOFF_MIN_DOCS", "2")),
+                   max_docs=max_docs or None)
+
+    def __repr__(self) -> str:
+        return (f"AdaptiveCutoff(relative_threshold={self.relative_threshold}, max_gap={self.max_gap}, "
+                f"min_docs={self.min_docs}, max_docs={self.max_docs})")
+
+    def cut_index(self, scores: List[float]) -> int:
+        """점수 내림차순 리스트 -> 남길 문서 수"""
+        limit = min(len(scores), self.max_docs or len(scores))
+        if limit <= self.min_docs or scores[0] <= 0:
+            return limit
+        top = scores[0]
+        for i in range(max(self.min_docs, 1), limit):
+            if scores[i] < top * self.relative_threshold or (scores[i - 1] - scores[i]) / top >= self.max_gap:
+                return i
+        return limit
+
+    def apply(self, scored: List[Tuple[Document, float]]) -> List[Document]:
+        """[(문서, 결합 점수)] (점수 내림차순) -> 자른 문서 리스트"""
+        keep = self.cut_index([score for _, score in scored])
+        METRICS.incr("cutoff_docs_kept", keep)
+        METRICS.incr("cutoff_docs_dropped", len(scored) - keep)
+        return [doc for doc, _ in scored[:keep]]
+
+
+def fuse_results(results: List[List[Document]], weights: List[float],
+                 cutoff: Optional[AdaptiveCutoff] = None) -> List[Document]:
+    """
+    retriever별 검색 결과(같은 질문)를 순위 기반 가중치 점수로 결합
+    cutoff: 주면 결합 점수 분포에 따라 뒤쪽 문서를 잘라냄 (AdaptiveCutoff)
+    """
+    with stage("fusion"):
+        scored = fuse_scored(results, weights)
+        if cutoff is not None:
+            return cutoff.apply(scored)
+        return [doc for doc, _ in scored]
+
+
+def fuse_scored(results: List[List[Document]], weights: List[float]) -> List[Tuple[Document, float]]:
+    """결합 결과를 [(문서, 결합 점수)] 점수 내림차순으로 반환"""
+    doc_scores = {}
+
+    for docs, weight in zip(results, weights):
+        # 각 문서에 가중치 적용
+        for i, doc in enumerate(docs):
+            doc_id = hash(doc.page_content)
+            # 순위 기반 스코어 (상위일수록 높은 점수)
+            score = weight * (len(docs) - i) / len(docs)
+
+            if doc_id in doc_scores:
+                doc_scores[doc_id]['score'] += score
+            else:
+                doc_scores[doc_id] = {'doc': doc, 'score': score}
+
+    # 스코어 기준으로 정렬
+    sorted_docs = sorted(doc_scores.values(), key=lambda x: x['score'], reverse=True)
+    return [(item['doc'], item['score']) for item in sorted_docs]
+
 
 class EnsembleRetriever:
     """여러 retriever의 결과를 가중치 기반으로 결합하는 앙상블 리트리버"""
-    
-    def __init__(self, retrievers: List, weights: List[float]):
+
+    def __init__(self, retrievers: List, weights: List[float], cutoff: Optional[AdaptiveCutoff] = None):
         self.retrievers = retrievers
         self.weights = weights
-    
-    def invoke(self, query: str) -> List[Document]:
-        """여러 retriever의 결과를 가중치 기반으로 결합"""
-        all_docs = []
-        doc_scores = {}
-        
-        for retriever, weight in zip(self.retrievers, self.weights):
-            docs = retriever.invoke(query)
-            
-            # 각 문서에 가중치 적용
-            for i, doc in enumerate(docs):
-                doc_id = hash(doc.page_content)
-                # 순위 기반 스코어 (상위일수록 높은 점수)
-                score = weight * (len(docs) - i) / len(docs)
-                
-                if doc_id in doc_scores:
-                    doc_scores[doc_id]['score'] += score
-                else:
-                    doc_scores[doc_id] = {'doc': doc, 'score': score}
-        
-        # 스코어 기준으로 정렬
-        sorted_docs = sorted(doc_scores.values(), key=lambda x: x['score'], reverse=True)
-        return [item['doc'] for item in sorted_docs]
+        self.cutoff = cutoff
+
+    def _fuse(self, results: List[List[Document]]) -> List[Document]:
+        """retriever별 검색 결과(같은 질문)를 가중치 기반으로 결합 (cutoff가 있으면 점수 분포에 따라 자름)"""
+        return fuse_results(results, self.weights, cutoff=self.cutoff)
+
+    def invoke(self, query: str, filters: Optional[dict] = None) -> List[Document]:
+        """
+        여러 retriever의 결과를 가중치 기반으로 결합
+        filters: 메타데이터 필터 (metadata_filter.py 형식) - 각 retriever의 검색 단계에 그대로 전달
+        """
+        if filters:
+            return self._fuse([retriever.invoke(query, filters=filters) for retriever in self.retrievers])
+        return self._fuse([retriever.invoke(query) for retriever in self.retrievers])
 
+    def batch(self, queries: List[str], filters=None) -> List[List[Document]]:
+        """
+        여러 질문을 한 번에 검색 (오프라인 평가 / 대량 질문 처리용)
+        각 retriever의 batch()를 한 번씩만 호출한 뒤 질문별로 결합합니다.
+        filters: 모든 질문 공통 dict 또는 질문별 dict 리스트
+        """
+        queries = list(queries)
+        # retriever별 [질문별 문서 리스트]
+        if filters:
+            per_retriever = [retriever.batch(queries, filters=filters) for retriever in self.retrievers]
+        else:
+            per_retriever = [retriever.batch(queries) for retriever in self.retrievers]
+        return [
+            self._fuse([results[i] for results in per_retriever])
+            for i in range(len(queries))
+        ]
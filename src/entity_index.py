@@ -0,0 +1,297 @@
+'''
+질병명 fast-path 인덱스
+질문에 특정 질병명("파보바이러스", "슬개골 탈구", "신부전")이 나오면, 그 질병으로 태깅된 QA 청크와
+본문에 그 질병명이 나오는 의학지식 청크로 검색 후보를 좁히거나(restrict) 그 청크들을 위로 올립니다(boost).
+- EntityIndex: 코퍼스 메타데이터(disease)로 만든 질병명 사전 + 질병 -> 청크 id postings (인덱싱 시 1회 생성, JSON 저장)
+- AhoCorasick: 사전 전체를 질문 1번 훑어서 찾는 다중 패턴 매칭 (공백/대소문자 무시, 가장 긴 이름 우선)
+- EntityFastPathRetriever: 기존 리트리버(EnsembleRetriever / ShardedRetriever)를 감싸서
+  매칭된 질병의 청크 id를 필터({"id": [...]}, metadata_filter.py)로 넘김
+  restrict: 해당 청크 안에서만 검색 (결과가 없으면 전체 검색) / boost: 전체 검색 결과와 해당 청크 검색 결과를 순위 결합
+
+생성: python build_entity_index.py [bge_m3|openai]  (없으면 initialize_rag_system이 시작할 때 만들어 저장)
+'''
+
+import json
+import os
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from ensemble import fuse_results
+from instrumentation import METRICS, stage
+from metadata_filter import ID_FIELD
+
+# 한 질병명이 이 비율보다 많은 청크 본문에 나오면 일반 단어로 보고 본문 postings에서 제외 (태깅된 청크는 유지)
+MAX_MENTION_RATIO = 0.05
+MIN_ENTITY_LENGTH = 2
+
+_SPLIT = re.compile(r"[,/·;]")
+_PAREN = re.compile(r"\(([^)]*)\)")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_entity(text: str) -> str:
+    """매칭용 정규화: 소문자 + 공백 제거 ("슬개골 탈구" == "슬개골탈구")"""
+    return _SPACE.sub("", text.lower())
+
+
+def disease_names(value: str) -> List[str]:
+    """disease 메타데이터 값 -> 질병명 목록 ("A, B" / "A(B)" 형태 분리)"""
+    names = []
+    for part in _SPLIT.split(value or ""):
+        inner = _PAREN.findall(part)
+        outer = _PAREN.sub("", part).strip()
+        for name in [outer] + [text.strip() for text in inner]:
+            if len(normalize_entity(name)) >= MIN_ENTITY_LENGTH:
+                names.append(name)
+    return names
+
+
+# ---------------------------
+# Aho-Corasick 다중 패턴 매칭
+# ---------------------------
+class AhoCorasick:
+    """패턴 사전 전체를 텍스트 1번 훑어서 찾는 오토마톤 (add 후 build 호출)"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, str]]] = [[]]  # 노드 -> [(패턴 길이, 값)]
+
+    def add(self, pattern: str, value: str):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(pattern), value))
+
+    def build(self):
+        """실패 링크 계산 (BFS)"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0) if node else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def iter_matches(self, text: str) -> Iterable[Tuple[int, int, str]]:
+        """(시작, 끝, 값) - 겹치는 매칭 모두"""
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, value in self._out[node]:
+                yield i - length + 1, i + 1, value
+
+    def find(self, text: str) -> List[str]:
+        """겹치는 매칭은 먼저 시작하고 더 긴 것만 남긴 값 목록 (등장 순서, 중복 제거)"""
+        matches = sorted(self.iter_matches(text), key=lambda m: (m[0], m[0] - m[1]))
+        found, end = [], -1
+        for start, stop, value in matches:
+            if start >= end:
+                found.append(value)
+                end = stop
+        return list(dict.fromkeys(found))
+
+
+# ---------------------------
+# 질병명 사전 + postings
+# ---------------------------
+class EntityIndex:
+    """질병명 사전(정규화 이름 -> 질병) + 질병 -> 청크 id postings (태깅된 청크 먼저, 본문 언급 청크 다음)"""
+
+    def __init__(self, aliases: Dict[str, str], postings: Dict[str, List[str]], version: str = ""):
+        self.aliases = aliases
+        self.postings = postings
+        self.version = version
+        self._matcher = AhoCorasick()
+        for alias, disease in aliases.items():
+            self._matcher.add(alias, disease)
+        self._matcher.build()
+
+    @classmethod
+    def build(cls, docs: List[Document], version: str = "",
+              max_mention_ratio: float = MAX_MENTION_RATIO) -> "EntityIndex":
+        """코퍼스 문서(Chroma id 포함) -> 인덱스"""
+        aliases: Dict[str, str] = {}
+        tagged: Dict[str, List[str]] = {}
+        for doc in docs:
+            for name in disease_names(str(doc.metadata.get("disease") or "")):
+                # 같은 이름(정규화 기준)은 처음 나온 표기로 통일
+                disease = aliases.setdefault(normalize_entity(name), name)
+                if doc.id is not None:
+                    tagged.setdefault(disease, []).append(doc.id)
+
+        # 본문 언급: 사전 전체로 청크 본문을 1번씩 훑음
+        matcher = AhoCorasick()
+        for alias, disease in aliases.items():
+            matcher.add(alias, disease)
+        matcher.build()
+        mentioned: Dict[str, List[str]] = {}
+        for doc in docs:
+            if doc.id is None:
+                continue
+            for disease in matcher.find(normalize_entity(doc.page_content)):
+                mentioned.setdefault(disease, []).append(doc.id)
+
+        max_mentions = max(1, int(len(docs) * max_mention_ratio))
+        postings = {}
+        for disease in dict.fromkeys(list(tagged) + list(mentioned)):
+            ids = list(tagged.get(disease, []))
+            if len(mentioned.get(disease, [])) <= max_mentions:
+                ids += mentioned.get(disease, [])
+            postings[disease] = list(dict.fromkeys(ids))
+        return cls(aliases, postings, version=version)
+
+    def updated(self, docs: List[Document], remove_ids: Iterable[str] = (), version: str = "") -> "EntityIndex":
+        """
+        새 청크를 반영한 새 인덱스 (self는 바뀌지 않음, index_updater.py)
+        새 청크의 태깅 / 본문 언급만 추가하고 remove_ids / 덮어쓴 청크는 postings에서 뺌
+        (새 질병명이 기존 청크 본문에 나오는 경우는 build_entity_index.py로 다시 생성할 때 반영)
+        """
+        removed = set(remove_ids) | {doc.id for doc in docs if doc.id is not None}
+        aliases = dict(self.aliases)
+        postings = {disease: [chunk_id for chunk_id in ids if chunk_id not in removed]
+                    for disease, ids in self.postings.items()}
+        for doc in docs:
+            for name in disease_names(str(doc.metadata.get("disease") or "")):
+                disease = aliases.setdefault(normalize_entity(name), name)
+                if doc.id is not None:
+                    postings.setdefault(disease, []).append(doc.id)
+
+        index = type(self)(aliases, postings, version=version)
+        for doc in docs:
+            if doc.id is None:
+                continue
+            for disease in index._matcher.find(normalize_entity(doc.page_content)):
+                if doc.id not in postings[disease]:
+                    postings[disease].append(doc.id)
+        return index
+
+    def match(self, question: str) -> List[str]:
+        """질문에 나온 질병 (등장 순서)"""
+        return self._matcher.find(normalize_entity(question))
+
+    def chunk_ids(self, diseases: List[str]) -> List[str]:
+        return list(dict.fromkeys(chunk_id for disease in diseases for chunk_id in self.postings.get(disease, [])))
+
+    def stats(self) -> dict:
+        sizes = [len(ids) for ids in self.postings.values()]
+        return {"diseases": len(self.postings), "aliases": len(self.aliases),
+                "mean_postings": sum(sizes) / len(sizes) if sizes else 0.0,
+                "max_postings": max(sizes, default=0)}
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "aliases": self.aliases, "postings": self.postings},
+                      f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "EntityIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["aliases"], data["postings"], version=data.get("version", ""))
+
+
+def entity_index_path(vectorstore_path: str, collection_name: str) -> str:
+    """질병명 인덱스 저장 경로 (벡터스토어 폴더 안)"""
+    return os.path.join(vectorstore_path, "entity_index", f"{collection_name}.json")
+
+
+def load_entity_index(path: str, version: str, docs_loader) -> EntityIndex:
+    """
+    저장된 인덱스의 버전(컬렉션 이름 + 문서 수)이 같으면 로드, 아니면 docs_loader()로 다시 만들어 저장
+    docs_loader: () -> 코퍼스 문서 리스트 (예: lambda: load_documents_from_vectorstore(vectorstore))
+    """
+    if os.path.exists(path):
+        index = EntityIndex.load(path)
+        if index.version == version:
+            return index
+        print(f"질병명 인덱스 버전이 달라 다시 만듭니다: {index.version} -> {version}")
+    index = EntityIndex.build(docs_loader(), version=version)
+    index.save(path)
+    return index
+
+
+# ---------------------------
+# fast-path 리트리버
+# ---------------------------
+class EntityFastPathRetriever:
+    """
+    질문에 질병명이 있으면 해당 질병 청크로 검색을 좁히거나(restrict) 올리는(boost) 리트리버 래퍼
+    (EnsembleRetriever와 같은 invoke/batch 인터페이스, 질병명이 없는 질문은 감싼 리트리버 그대로)
+    """
+
+    def __init__(self, retriever, index: EntityIndex, mode: str = "restrict", boost_weight: float = 1.0):
+        if mode not in ("restrict", "boost"):
+            raise ValueError(f"mode는 restrict 또는 boost: {mode}")
+        self.retriever = retriever
+        self.index = index
+        self.mode = mode
+        self.boost_weight = boost_weight
+
+    def _entity_filters(self, question: str, filters: Optional[dict]) -> Optional[dict]:
+        """질문 -> 청크 id 필터를 더한 필터 (질병명이 없거나 사용자가 id 필터를 준 경우 None)"""
+        if filters and ID_FIELD in filters:
+            return None
+        # 증분 갱신(index_updater.py)으로 인덱스가 교체되어도 질문 1개는 같은 인덱스로 매칭
+        index = self.index
+        with stage("entity_match"):
+            diseases = index.match(question)
+        if not diseases:
+            return None
+        return {**(filters or {}), ID_FIELD: index.chunk_ids(diseases)}
+
+    def invoke(self, query: str, filters: Optional[dict] = None) -> List[Document]:
+        return self.batch([query], filters=filters)[0]
+
+    def batch(self, queries: List[str], filters=None) -> List[List[Document]]:
+        """filters: 모든 질문 공통 dict 또는 질문별 dict 리스트"""
+        queries = list(queries)
+        if filters is None or isinstance(filters, dict):
+            per_query = [filters] * len(queries)
+        else:
+            per_query = list(filters)
+
+        entity_filters = [self._entity_filters(q, f) for q, f in zip(queries, per_query)]
+        matched = [i for i, f in enumerate(entity_filters) if f is not None]
+        METRICS.incr("entity_fast_path_matches", len(matched))
+
+        results: List[Optional[List[Document]]] = [None] * len(queries)
+        if matched:
+            try:
+                narrowed = self.retriever.batch([queries[i] for i in matched],
+                                                filters=[entity_filters[i] for i in matched])
+            except Exception as e:
+                # 증분 갱신(index_updater.py)으로 방금 삭제된 청크 id가 이전 인덱스에 남아 있던 경우 등 -> 전체 검색
+                print(f"질병명 청크 검색 실패, 전체 검색으로 대체: {e}")
+                narrowed = [None] * len(matched)
+            for i, docs in zip(matched, narrowed):
+                results[i] = docs
+
+        # 질병명이 없는 질문, boost 모드, restrict 결과가 비어 있는 질문은 전체 검색
+        full = [i for i, docs in enumerate(results) if docs is None or self.mode == "boost" or not docs]
+        METRICS.incr("entity_fast_path_fallbacks", sum(1 for i in full if i in matched and not results[i]))
+        if full:
+            full_results = self.retriever.batch([queries[i] for i in full], filters=[per_query[i] for i in full])
+            for i, docs in zip(full, full_results):
+                if results[i] and self.mode == "boost":
+                    results[i] = fuse_results([docs, results[i]], [1.0, self.boost_weight])
+                else:
+                    results[i] = docs
+        return results
+
@@ -16,7 +16,8 @@ import pandas as pd
 import csv
 
 # LangChain 최신 버전 임포트
-from langchain_openai import ChatOpenAI
+# OpenAI 호출은 프로세스 공용 조절기를 거침 (평가는 낮은 우선순위)
+from llm_governor import BACKGROUND, GovernedChatOpenAI
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.chat_models import ChatOllama
 from langchain_community.vectorstores import Chroma 
@@ -28,16 +29,21 @@ from langchain_core.output_parsers import StrOutputParser, PydanticOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.documents import Document
 
-# LangGraph 관련 임포트
-from langgraph.graph import StateGraph, START, END
+# LangGraph 질문 처리 파이프라인 (rewrite와 검색 병렬 실행)
+from rag_graph import run_rag_graph_batch, build_rag_graph
 from langchain_community.document_loaders import JSONLoader
 from langchain_community.document_loaders import DirectoryLoader, JSONLoader
 from langchain_core.documents import Document
-from langchain_community.retrievers import BM25Retriever
 from typing import List
 from ensemble import EnsembleRetriever
+from retrievers import DenseRetriever, BM25BatchRetriever, load_documents_from_vectorstore
+from embedding_cache import CachedEmbeddings
+from llm_cache import enable_llm_cache, llm_cache_metrics
+from rewrite_cache import RewriteCache
 
 load_dotenv()
+# LLM 응답 캐시 (답변 생성 / rewrite / RAGAS 평가 호출을 재실행 시 재사용)
+enable_llm_cache()
 if not os.environ.get('OPENAI_API_KEY'):
     raise ValueError('.env 확인하세요. key가 없습니다')
 # if not os.environ.get('LANGSMITH_API_KEY'):
@@ -71,6 +77,8 @@ embeddings = HuggingFaceEmbeddings(
     model_kwargs={'device': 'cpu'},  # GPU 사용시 'cuda'로 변경
     encode_kwargs={'normalize_embeddings': True}  # bge-m3는 정규화 권장
 )
+# 질문 임베딩 캐시 (평가 재실행 시 같은 질문은 다시 인코딩하지 않음)
+embeddings = CachedEmbeddings(embeddings, persist_path=r"..\data\cache\query_embeddings.sqlite")
 # RAGAS용 embeddings wrapper 생성
 ragas_embeddings = LangchainEmbeddingsWrapper(embeddings=embeddings)
 
@@ -199,8 +207,8 @@ query = [
 ]
 
 
-llm = ChatOpenAI(model="gpt-4.1", temperature=0)
-retriever = vectorstore.as_retriever(search_kwargs={"k": 5}, search_type="similarity") #리트리버 변경 가능
+llm = GovernedChatOpenAI(model="gpt-4.1", temperature=0, priority=BACKGROUND)
+retriever = DenseRetriever(vectorstore, k=5) #리트리버 변경 가능 (batch 검색 지원)
 retriever_mmr = vectorstore.as_retriever(
     search_type="mmr",
     search_kwargs={
@@ -211,32 +219,16 @@ retriever_mmr = vectorstore.as_retriever(
 )
 # BM25 리트리버 생성 (벡터스토어에서 문서 추출 필요)
 # ChromaDB에서 모든 문서를 직접 가져오기
-collection = vectorstore._collection
-doc_count = collection.count()
+doc_count = vectorstore._collection.count()
 print(f"벡터스토어 총 문서 수: {doc_count}개")
 
 if doc_count == 0:
     raise ValueError("벡터스토어가 비어있습니다. 먼저 문서를 추가해주세요.")
 
-# ChromaDB의 get() 메서드를 사용하여 모든 문서 가져오기
-all_data = collection.get(limit=doc_count)
-
-# Document 객체로 변환
-bm25_docs = []
-if all_data and 'ids' in all_data and len(all_data['ids']) > 0:
-    documents = all_data.get('documents', [])
-    metadatas = all_data.get('metadatas', [])
-    
-    for i, doc_id in enumerate(all_data['ids']):
-        page_content = documents[i] if i < len(documents) else ""
-        metadata = metadatas[i] if i < len(metadatas) else {}
-        bm25_docs.append(Document(page_content=page_content, metadata=metadata))
-
-if len(bm25_docs) == 0:
-    raise ValueError("벡터스토어에서 문서를 가져올 수 없습니다.")
+bm25_docs = load_documents_from_vectorstore(vectorstore)
 
 print(f"BM25 리트리버용 문서 {len(bm25_docs)}개 로드 완료")
-retriever_bm25 = BM25Retriever.from_documents(bm25_docs) 
+retriever_bm25 = BM25BatchRetriever.from_documents(bm25_docs) 
 # 앙상블 리트리버
 retriever_ensemble = EnsembleRetriever(
     retrievers=[retriever, retriever_bm25],
@@ -248,11 +240,12 @@ retriever_dict = {
     "BM25 검색(BM25 Search)": retriever_bm25,
     "앙상블 검색(Ensemble Search)": retriever_ensemble
 }
-rewrite_chain =  rewrite_prompt | llm | StrOutputParser()
-rag_chain = prompt | llm | StrOutputParser()
 
 
 
+# 질문 변환 결과 캐시 (리트리버마다 같은 질문을 다시 변환하지 않도록 공유, Streamlit 앱과 같은 파일)
+rewrite_cache = RewriteCache(rewrite_prompt, llm, persist_path=r"..\data\cache\rewrites.sqlite")
+
 # RAGAS 평가를 위한 데이터 수집
 evaluation_results = []
 
@@ -263,19 +256,27 @@ for name, temp_retriever in retriever_dict.items():
     contexts_list = []
     transformed_queries = []
     
-    for q in query:
-        docs = temp_retriever.invoke(q)
-        context = format_docs(docs)
-        
-        transformed = rewrite_chain.invoke({'question': q})
-        generation = rag_chain.invoke({"context": context, "question": transformed})
-        
+    # 질문 전체를 한 번에 검색 (임베딩 1회 + 검색 1회)
+    docs_list = temp_retriever.batch(query)
+    
+    # 검색된 문서를 넣어 그래프 실행 (검색 단계 생략, rewrite -> 생성을 질문 여러 개 동시에)
+    rag_graph = build_rag_graph(temp_retriever, llm, prompt, rewrite_prompt, format_docs,
+                                rewrite_cache=rewrite_cache)
+    states = run_rag_graph_batch(rag_graph, query, docs_list=docs_list, max_concurrency=4)
+    
+    for q, docs, state in zip(query, docs_list, states):
         # 평가 데이터 수집
         questions.append(q)
-        answers.append(generation)
+        answers.append(state["answer"])
         # RAGAS는 contexts를 리스트 형태로 요구 (각 문서를 개별 요소로)
         contexts_list.append([doc.page_content for doc in docs])
-        transformed_queries.append(transformed)
+        transformed_queries.append(state.get("transformed", q))
+    
+    # 단계별 평균 소요 시간
+    for node in ["rewrite", "generate"]:
+        node_timings = [state["timings"][node] for state in states if node in state["timings"]]
+        if node_timings:
+            print(f"[{name}] {node} 평균 {sum(node_timings) / len(node_timings):.2f}s")
     
     # RAGAS 평가 수행
     print(f"\n=== {name} RAGAS 평가 시작 ===\n")
@@ -353,3 +354,6 @@ if evaluation_results:
 else:
     print("평가할 데이터가 없습니다.")
 
+print(f"\nLLM 캐시: {llm_cache_metrics()}")
+print(f"rewrite 캐시: {rewrite_cache.cache_metrics()}")
+
@@ -0,0 +1,150 @@
+'''
+부하 테스트용 로컬 가짜 모델 (OpenAI API / BGE-M3 없이 파이프라인 전체 실행)
+- FakeChatModel: 프롬프트 종류(rewrite / self-check 일괄·문서별 / 답변 생성)에 맞는 형식의 응답을 돌려주는 Chat 모델
+  지연시간 = latency(첫 토큰까지) + token_latency x 출력 토큰 수, jitter 비율만큼 무작위 변동, error_rate 확률로 예외
+  스트리밍(.stream) 지원, usage_metadata(토큰 수) 포함 -> 로컬 계측(instrumentation.py)에 그대로 기록
+- FakeEmbeddings: 단어 해시 기반 결정적 벡터 (같은 단어가 많을수록 가까움 -> dense 검색 결과가 어느 정도 의미 있음)
+  모델 1개를 공유하는 임베딩 서버처럼 동시에 1개 호출만 처리 (latency + per_item_latency x 문장 수), error_rate 확률로 예외
+'''
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class InjectedError(RuntimeError):
+    """error_rate로 주입한 가짜 오류"""
+
+
+def _jittered(seconds: float, jitter: float) -> float:
+    if seconds <= 0:
+        return 0.0
+    return max(0.0, seconds * (1 + random.uniform(-jitter, jitter)))
+
+
+def _count_tokens(text: str) -> int:
+    # tiktoken 없이 대략적인 토큰 수 (한국어는 글자 2~3개당 1토큰 정도)
+    return max(1, len(text) * 2 // 3)
+
+
+# ---------------------------
+# 가짜 Chat 모델
+# ---------------------------
+class FakeChatModel(BaseChatModel):
+    """프롬프트 종류에 맞는 형식으로 답하는 지연시간/오류 주입 가능 Chat 모델"""
+
+    latency: float = 0.5
+    token_latency: float = 0.0
+    jitter: float = 0.2
+    error_rate: float = 0.0
+    model_name: str = "fake-chat"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _respond(self, prompt: str) -> str:
+        if "검색된 문서 목록" in prompt:
+            # self-check 일괄 판단: 모든 문서 Keep
+            numbers = sorted({int(n) for n in re.findall(r'^\[(\d+)\] """', prompt, flags=re.M)})
+            return json.dumps({"keep": numbers})
+        if "문서 내용:" in prompt:
+            return "Keep"
+        if "원본 질문:" in prompt:
+            match = re.search(r"원본 질문:\s*(.+)", prompt)
+            return match.group(1).strip() if match else prompt[-100:]
+
+        # 답변 생성: context의 출처 문구를 그대로 인용 (filter_docs_by_response가 문서를 찾을 수 있도록)
+        sources = re.findall(r"(상담기록 - [^\n<]+|서적 - [^\n<]+)", prompt)
+        return ("- 상태 요약: 가짜 모델이 생성한 부하 테스트용 답변입니다. 제공된 문서를 바탕으로 증상을 정리했습니다.\n"
+                "- 가능한 원인: 문서에 언급된 원인\n"
+                "- 집에서 관리 방법: 충분한 휴식, 수분 공급, 상태 관찰\n"
+                "- 병원 방문 시기: 증상이 하루 이상 계속되면 방문\n"
+                "- 출처: " + (", ".join(dict.fromkeys(sources)) or "없음"))
+
+    def _prompt_text(self, messages) -> str:
+        return "\n".join(str(message.content) for message in messages)
+
+    def _maybe_fail(self):
+        if self.error_rate and random.random() < self.error_rate:
+            raise InjectedError("가짜 LLM 오류 (주입)")
+
+    def _usage(self, prompt: str, text: str) -> dict:
+        input_tokens, output_tokens = _count_tokens(prompt), _count_tokens(text)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        prompt = self._prompt_text(messages)
+        text = self._respond(prompt)
+        time.sleep(_jittered(self.latency + self.token_latency * _count_tokens(text), self.jitter))
+        self._maybe_fail()
+        message = AIMessage(content=text, usage_metadata=self._usage(prompt, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        prompt = self._prompt_text(messages)
+        text = self._respond(prompt)
+        time.sleep(_jittered(self.latency, self.jitter))
+        self._maybe_fail()
+        pieces = [text[i:i + 3] for i in range(0, len(text), 3)]
+        for piece in pieces:
+            if self.token_latency:
+                time.sleep(_jittered(self.token_latency * _count_tokens(piece), self.jitter))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+        # 마지막 청크에 토큰 사용량 (ChatOpenAI stream_usage=True와 같은 방식)
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(prompt, text)))
+
+
+# ---------------------------
+# 가짜 임베딩 서버
+# ---------------------------
+class FakeEmbeddings(Embeddings):
+    """단어 해시 벡터 임베딩 (동시 호출은 직렬 처리 - 모델 1개짜리 임베딩 서버 흉내)"""
+
+    def __init__(self, dim: int = 1024, latency: float = 0.02, per_item_latency: float = 0.005,
+                 jitter: float = 0.2, error_rate: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.model_name = f"fake-embedding-{dim}"
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.split():
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.calls += 1
+            time.sleep(_jittered(self.latency + self.per_item_latency * len(texts), self.jitter))
+            if self.error_rate and random.random() < self.error_rate:
+                raise InjectedError("가짜 임베딩 서버 오류 (주입)")
+        return [self._vector(text) for text in texts]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0]
@@ -0,0 +1,318 @@
+'''
+자주 묻는 질문 미리 만든 답변 (FAQ)
+예방접종 시기, 초콜릿 섭취, 파보바이러스 증상처럼 반복되는 질문은 매번 검색 → self-check → rewrite → 생성을
+다시 실행하지 않도록, 오프라인 작업(build_faq_answers.py)에서 질문 로그를 군집화해 상위 군집의 답변을 미리 만들어 둡니다.
+- cluster_questions: 질문 임베딩을 코사인 유사도 기준으로 묶음 (많이 나온 질문부터, 군집 중심과 threshold 이상이면 같은 군집)
+- FAQAnswers: 군집 중심 벡터 + 대표 질문 + 검증된 답변 / 참고 문서 (JSON 저장)
+  lookup: 질문과 가장 가까운 군집 중심의 유사도가 threshold 이상이고 검증을 통과한 답변이면 반환
+  (SemanticAnswerCache.lookup과 같은 반환 형식 -> Streamlit / API에서 같은 경로로 사용)
+- 검증(vet_answer): 참고 문서가 있고(답변에 실제로 인용된 문서) 마감 시간 때문에 단계를 줄이지 않은 답변만 사용
+  저장된 JSON에서 approved를 false로 바꾸면 사람이 검토해서 뺀 답변으로 보고 사용하지 않음
+- 인덱스 버전이 바뀌면 저장된 답변은 쓰지 않고, generate를 주면 백그라운드에서 같은 대표 질문으로 다시 생성 후 저장
+
+생성: python build_faq_answers.py [bge_m3|openai] [군집 수]
+'''
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from cache_utils import CacheStats, normalize_query
+from instrumentation import METRICS, stage
+
+CLUSTER_THRESHOLD = 0.85
+MAX_MEMBER_QUESTIONS = 10
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def _embed_question(embeddings, question: str) -> np.ndarray:
+    # SemanticAnswerCache와 같은 정규화 -> CachedEmbeddings에서 같은 질문 임베딩을 재사용
+    return _normalize_rows(np.asarray(embeddings.embed_query(normalize_query(question)), dtype=np.float32))
+
+
+# ---------------------------
+# 질문 군집화
+# ---------------------------
+def cluster_questions(questions: List[str], embeddings, threshold: float = CLUSTER_THRESHOLD) -> List[dict]:
+    """
+    질문 목록(중복 포함) -> 군집 리스트 (질문 수가 많은 군집부터)
+    군집: {'question': 대표 질문(중심과 가장 가까운 질문), 'questions': [(질문, 횟수)], 'size', 'centroid'}
+    """
+    counts = Counter()
+    display: Dict[str, str] = {}
+    for question in questions:
+        key = normalize_query(question)
+        if key:
+            counts[key] += 1
+            display.setdefault(key, question.strip())
+    if not counts:
+        return []
+
+    keys = [key for key, _ in counts.most_common()]
+    vectors = _normalize_rows(np.asarray(embeddings.embed_documents(keys), dtype=np.float32))
+
+    # 많이 나온 질문부터 가장 가까운 군집에 넣고, threshold 미만이면 새 군집 (중심 = 횟수 가중 평균)
+    sums: List[np.ndarray] = []
+    members: List[List[int]] = []
+    for i, vector in enumerate(vectors):
+        if sums:
+            centroids = _normalize_rows(np.stack(sums))
+            similarities = centroids @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= threshold:
+                sums[best] = sums[best] + vector * counts[keys[i]]
+                members[best].append(i)
+                continue
+        sums.append(vector * counts[keys[i]])
+        members.append([i])
+
+    clusters = []
+    for total, indices in zip(sums, members):
+        centroid = _normalize_rows(total)
+        central = max(indices, key=lambda i: float(vectors[i] @ centroid))
+        ranked = sorted(indices, key=lambda i: counts[keys[i]], reverse=True)
+        clusters.append({
+            "question": display[keys[central]],
+            "questions": [(display[keys[i]], counts[keys[i]]) for i in ranked],
+            "size": sum(counts[keys[i]] for i in indices),
+            "centroid": centroid,
+        })
+    clusters.sort(key=lambda cluster: cluster["size"], reverse=True)
+    return clusters
+
+
+def load_logged_questions(log_path: str) -> List[str]:
+    """질문별 계측 로그(JSONL, instrumentation.configure_metrics)의 질문 목록"""
+    questions = []
+    if not os.path.exists(log_path):
+        return questions
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                question = json.loads(line).get("question")
+            except json.JSONDecodeError:
+                continue
+            if question:
+                questions.append(question)
+    return questions
+
+
+# ---------------------------
+# 답변 검증 / 직렬화
+# ---------------------------
+def vet_answer(answer: str, docs: List[Document], degraded: List[str]) -> Optional[str]:
+    """미리 만든 답변으로 쓸 수 없는 이유 (통과하면 None)"""
+    if not answer or not answer.strip():
+        return "empty_answer"
+    if not docs:
+        return "no_docs"
+    if degraded:
+        return "degraded:" + ",".join(degraded)
+    return None
+
+
+def _doc_to_dict(doc: Document) -> dict:
+    return {"id": doc.id, "content": doc.page_content, "metadata": doc.metadata}
+
+
+def _doc_from_dict(data: dict) -> Document:
+    return Document(page_content=data["content"], metadata=data.get("metadata") or {}, id=data.get("id"))
+
+
+# ---------------------------
+# 미리 만든 답변 저장소
+# ---------------------------
+class FAQAnswers:
+    """군집 중심 벡터로 찾는 미리 만든 답변 (스레드 안전, 인덱스 버전이 다르면 사용하지 않음)"""
+
+    def __init__(self, embeddings, entries: List[dict], version: str = "", threshold: float = 0.9):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.version = version              # 답변을 만든 인덱스 버전
+        self.index_version = version        # 지금 서비스 중인 인덱스 버전
+        self.refreshing = False
+        self.path: Optional[str] = None     # load()한 파일 (다시 생성한 답변 저장 위치)
+        self._lock = threading.Lock()
+        self.stats = CacheStats("hits", "misses", "stale_lookups", "refreshes")
+        self._set_entries(entries)
+
+    def _set_entries(self, entries: List[dict]):
+        self._entries = entries
+        served = [entry for entry in entries if entry.get("approved")]
+        self._served = served
+        self._matrix = (_normalize_rows(np.stack([np.asarray(entry["centroid"], dtype=np.float32) for entry in served]))
+                        if served else None)
+
+    @staticmethod
+    def make_entry(cluster: dict, answer: str, docs: List[Document], degraded: List[str]) -> dict:
+        """군집 + 생성 결과 -> 저장 항목 (검증 결과 포함)"""
+        reason = vet_answer(answer, docs, degraded)
+        return {
+            "question": cluster["question"],
+            "questions": [list(item) for item in cluster["questions"][:MAX_MEMBER_QUESTIONS]],
+            "size": cluster["size"],
+            "centroid": np.asarray(cluster["centroid"], dtype=np.float32).tolist(),
+            "answer": answer,
+            "docs": list(docs),
+            "approved": reason is None,
+            "reason": reason,
+            "generated_at": time.time(),
+        }
+
+    @classmethod
+    def build(cls, embeddings, clusters: List[dict], generate: Callable[[str], Tuple[str, List[Document], List[str]]],
+              version: str = "", threshold: float = 0.9) -> "FAQAnswers":
+        """
+        군집마다 대표 질문으로 답변 생성 -> 저장소
+        generate: 질문 -> (답변, 참고 문서, 마감 시간 때문에 적용한 항목) (예: rag_service.faq_generator)
+        """
+        entries = []
+        for cluster in clusters:
+            answer, docs, degraded = generate(cluster["question"])
+            entries.append(cls.make_entry(cluster, answer, docs, degraded))
+        return cls(embeddings, entries, version=version, threshold=threshold)
+
+    @property
+    def entries(self) -> List[dict]:
+        return list(self._entries)
+
+    def lookup(self, question: str) -> Optional[dict]:
+        """
+        가까운 군집의 답변이 있으면 {'answer', 'docs', 'similarity', 'question'} 반환, 없으면 None
+        답변을 만든 인덱스 버전이 지금과 다르면(다시 생성 중) 사용하지 않음
+        """
+        with self._lock:
+            if self.version != self.index_version:
+                self.stats.incr("stale_lookups")
+                return None
+            matrix, served = self._matrix, self._served
+        if matrix is None:
+            self.stats.incr("misses")
+            METRICS.incr("faq_misses")
+            return None
+
+        with stage("faq_lookup"):
+            similarities = matrix @ _embed_question(self.embeddings, question)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            self.stats.incr("misses")
+            METRICS.incr("faq_misses")
+            return None
+
+        entry = served[best]
+        self.stats.incr("hits")
+        METRICS.incr("faq_hits")
+        return {
+            "answer": entry["answer"],
+            "docs": list(entry["docs"]),
+            "similarity": float(similarities[best]),
+            "question": entry["question"],
+        }
+
+    def refresh(self, generate: Callable[[str], Tuple[str, List[Document], List[str]]], version: str,
+                path: Optional[str] = None):
+        """같은 대표 질문 / 군집으로 답변만 다시 생성 (사람이 뺀 답변(reason=rejected)은 그대로 유지)"""
+        entries = []
+        for entry in self.entries:
+            if entry.get("reason") == "rejected":
+                entries.append(entry)
+                continue
+            answer, docs, degraded = generate(entry["question"])
+            cluster = {**entry, "questions": [tuple(item) for item in entry["questions"]]}
+            entries.append(self.make_entry(cluster, answer, docs, degraded))
+
+        with self._lock:
+            self._set_entries(entries)
+            self.version = version
+        self.stats.incr("refreshes")
+        METRICS.incr("faq_refreshes")
+        if path:
+            self.save(path)
+
+    def set_index_version(self, version: str, generate=None, path: Optional[str] = None):
+        """
+        서비스 중인 인덱스 버전 설정. 답변을 만든 버전과 다르면 저장된 답변은 쓰지 않고,
+        generate를 주면 백그라운드 스레드에서 다시 생성 (끝나면 path(없으면 load한 파일)에 저장하고 다시 사용)
+        다시 생성하는 중에 버전이 또 바뀌면(증분 갱신) 끝난 뒤 최신 버전으로 한 번 더 생성
+        """
+        path = path or self.path
+        with self._lock:
+            self.index_version = version
+            start = generate is not None and self.version != version and not self.refreshing
+            if start:
+                self.refreshing = True
+        if not start:
+            return
+
+        def run():
+            try:
+                target = version
+                while target != self.version:
+                    print(f"FAQ 답변을 다시 생성합니다: {self.version} -> {target} ({len(self._entries)}개)")
+                    self.refresh(generate, target, path)
+                    target = self.index_version
+            except Exception as e:
+                print(f"FAQ 답변 다시 생성 실패: {e}")
+            finally:
+                with self._lock:
+                    self.refreshing = False
+
+        threading.Thread(target=run, name="faq-refresh", daemon=True).start()
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            data = {
+                "version": self.version,
+                "entries": [{**entry, "docs": [_doc_to_dict(doc) for doc in entry["docs"]]}
+                            for entry in self._entries],
+            }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+
+    @classmethod
+    def load(cls, path: str, embeddings, threshold: float = 0.9) -> "FAQAnswers":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        entries = []
+        for entry in data["entries"]:
+            entry = {**entry, "docs": [_doc_from_dict(doc) for doc in entry.get("docs") or []]}
+            # 사람이 approved를 false로 바꾼 답변은 다시 생성해도 사용하지 않음
+            if not entry.get("approved") and not entry.get("reason"):
+                entry["reason"] = "rejected"
+            entries.append(entry)
+        faq = cls(embeddings, entries, version=data.get("version", ""), threshold=threshold)
+        faq.path = path
+        return faq
+
+    def metrics(self) -> dict:
+        """적중률 / 항목 수 지표"""
+        counts = self.stats.as_dict()
+        lookups = counts["hits"] + counts["misses"]
+        return {
+            **counts,
+            "hit_rate": counts["hits"] / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "approved": len(self._served),
+            "version": self.version,
+            "stale": self.version != self.index_version,
+            "refreshing": self.refreshing,
+        }
+
+
+def faq_answers_path(vectorstore_path: str, collection_name: str) -> str:
+    """미리 만든 답변 저장 경로 (벡터스토어 폴더 안)"""
+    return os.path.join(vectorstore_path, "faq_answers", f"{collection_name}.json")
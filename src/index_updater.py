@@ -0,0 +1,265 @@
+'''
+운영 중 증분 인덱스 갱신 (재시작 없이 새 상담기록 반영)
+새 상담기록을 넣을 때마다 전처리 + 벡터스토어 전체 생성 + 앱 재시작(BM25 재구성)을 하지 않도록,
+새 청크만 임베딩해서 Chroma에 upsert하고 BM25 / 질병명 인덱스에도 새 청크만 반영합니다.
+- qa_records_to_chunks: 상담기록(preprocessing.py와 같은 meta / qa JSON 형식) -> 같은 splitter 설정으로 청킹
+  청크 id = 레코드 id + chunk_index (레코드에 id가 없으면 질문 + 답변 해시) -> 같은 레코드를 다시 넣으면 덮어쓰고
+  청크 수가 줄면 남는 청크는 삭제
+- IndexUpdater.ingest: 임베딩 -> Chroma upsert -> 새 BM25 / 질병명 인덱스로 교체 -> 인덱스 리비전 증가
+  교체는 리트리버 목록 / 인덱스 참조를 한 번에 바꾸는 것이라 진행 중인 질문은 이전 인덱스로 끝까지 실행 (검색은 잠그지 않음)
+  Chroma upsert 직후 바로 교체하므로 Dense만 새 청크를 보는 구간은 교체 한 번 사이뿐
+- IndexUpdater.sync: 다른 프로세스(ingest_records.py)가 Chroma에 반영한 청크(리비전이 더 큰 청크)를 BM25 / 질병명 인덱스에 반영
+- add_listener: 교체 후 새 인덱스 버전으로 콜백 (답변 캐시 무효화, FAQ 답변 다시 생성 - rag_service.attach_index_updater)
+
+샤드 인덱스(ShardedRetriever)는 지원하지 않습니다. (build_shards.py로 다시 생성)
+'''
+
+import glob
+import json
+import os
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from cache_utils import make_key
+from chunk_stitching import RECORD_ID_FIELD
+from ensemble import EnsembleRetriever
+from entity_index import EntityFastPathRetriever
+from instrumentation import METRICS, stage
+from prompt_module import INDEX_REVISION_KEY, get_index_version
+from retrievers import BM25BatchRetriever
+
+DEFAULT_SOURCE_PATH = "ingest"
+# preprocessing.py의 QA 데이터 splitter와 같은 설정
+QA_CHUNK_SIZE = 800
+QA_CHUNK_OVERLAP = 50
+QA_SEPARATORS = ['\n\nA:', 'Q:', '\n\n', '\n', '.', ' ', '']
+
+
+# ---------------------------
+# 상담기록 -> 청크
+# ---------------------------
+def load_qa_records(path: str) -> List[dict]:
+    """JSON 파일(레코드 1개 또는 리스트) / 폴더(하위 *.json 전체) -> 상담기록 리스트"""
+    paths = glob.glob(os.path.join(path, "**", "*.json"), recursive=True) if os.path.isdir(path) else [path]
+    records = []
+    for file_path in sorted(paths):
+        with open(file_path, "r", encoding="utf-8-sig") as f:
+            data = json.load(f)
+        records.extend(data if isinstance(data, list) else [data])
+    return records
+
+
+def record_id(record: dict) -> str:
+    """레코드 id (없으면 질문 + 답변 해시 -> 같은 상담기록을 다시 넣으면 같은 id)"""
+    if record.get("id"):
+        return str(record["id"])
+    qa_info = record.get("qa", {})
+    return "qa-" + make_key(qa_info.get("input", ""), qa_info.get("output", ""))[:16]
+
+
+def qa_record_to_document(record: dict) -> Document:
+    """상담기록 1건 -> Document (preprocessing.py와 같은 page_content / metadata)"""
+    meta_info = record.get("meta", {})
+    qa_info = record.get("qa", {})
+    question = qa_info.get("input", "")
+    answer = qa_info.get("output", "")
+    if not question or not answer:
+        raise ValueError(f"상담기록에 qa.input / qa.output이 없습니다: {record_id(record)}")
+
+    metadata = {
+        "lifeCycle": meta_info.get("lifeCycle", "") or "",
+        "department": meta_info.get("department", "") or "",
+        "disease": meta_info.get("disease", "") or "",
+        "question": question,
+        "answer": answer,
+        "source_type": "qa_data",
+        "source_path": record.get("source_path") or DEFAULT_SOURCE_PATH,
+        RECORD_ID_FIELD: record_id(record),
+    }
+    return Document(page_content=f"Q: {question}\n\nA: {answer}", metadata=metadata)
+
+
+def qa_records_to_chunks(records: Iterable[dict]) -> List[Document]:
+    """상담기록 -> 청크 (chunk_index / total_chunks / chunk_method 포함, id = 레코드 id-chunk_index)"""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=QA_CHUNK_SIZE, chunk_overlap=QA_CHUNK_OVERLAP,
+                                              separators=QA_SEPARATORS)
+    chunks = []
+    for record in records:
+        doc = qa_record_to_document(record)
+        pieces = splitter.split_documents([doc])
+        for i, chunk in enumerate(pieces):
+            chunk.metadata.update({"chunk_index": i, "total_chunks": len(pieces), "chunk_method": "qa_data"})
+            chunk.id = f"{doc.metadata[RECORD_ID_FIELD]}-{i}"
+        chunks.extend(pieces)
+    return chunks
+
+
+# ---------------------------
+# 증분 갱신
+# ---------------------------
+def _live_indexes(retriever) -> Tuple[Optional[EntityFastPathRetriever], Optional[EnsembleRetriever]]:
+    """서비스 리트리버 -> (질병명 fast-path 래퍼, 앙상블) - 교체할 인덱스를 가진 객체"""
+    if retriever is None:
+        return None, None
+    fast_path = retriever if isinstance(retriever, EntityFastPathRetriever) else None
+    ensemble = fast_path.retriever if fast_path else retriever
+    if not isinstance(ensemble, EnsembleRetriever) or not any(
+            isinstance(r, BM25BatchRetriever) for r in ensemble.retrievers):
+        raise ValueError("증분 갱신은 단일 인덱스 앙상블 리트리버(Dense + BM25)만 지원합니다. "
+                         "(샤드 인덱스는 build_shards.py로 다시 생성)")
+    return fast_path, ensemble
+
+
+class IndexUpdater:
+    """
+    Chroma + 서비스 중인 BM25 / 질병명 인덱스 증분 갱신 (갱신끼리는 순서대로, 검색은 잠그지 않음)
+    retriever: initialize_rag_system()의 리트리버 (None이면 Chroma만 갱신 - ingest_records.py)
+    """
+
+    def __init__(self, vectorstore, retriever=None, batch_size: int = 100):
+        self.vectorstore = vectorstore
+        self.batch_size = batch_size
+        self._fast_path, self._ensemble = _live_indexes(retriever)
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[str], None]] = []
+        self._last_sync = time.monotonic()
+        self.revision = self._stored_revision()
+        self.version = get_index_version(vectorstore, revision=self.revision)
+
+    def add_listener(self, callback: Callable[[str], None]):
+        """인덱스 교체 후 callback(새 인덱스 버전) 호출"""
+        self._listeners.append(callback)
+
+    # ---------------------------
+    # 내부 유틸
+    # ---------------------------
+    def _stored_revision(self) -> int:
+        """Chroma에 저장된 리비전 (다른 프로세스가 갱신했을 수 있으므로 컬렉션을 다시 조회)"""
+        name = self.vectorstore._collection.name
+        metadata = self.vectorstore._client.get_collection(name).metadata or {}
+        return int(metadata.get(INDEX_REVISION_KEY) or 0)
+
+    def _store_revision(self, revision: int):
+        collection = self.vectorstore._collection
+        # 거리 함수(hnsw:*)는 바꿀 수 없으므로 나머지 메타데이터만 넘김
+        metadata = {key: value for key, value in (collection.metadata or {}).items() if not key.startswith("hnsw:")}
+        collection.modify(metadata={**metadata, INDEX_REVISION_KEY: revision})
+
+    def _bm25(self) -> Optional[BM25BatchRetriever]:
+        if self._ensemble is None:
+            return None
+        return next(r for r in self._ensemble.retrievers if isinstance(r, BM25BatchRetriever))
+
+    def _prepare(self, chunks: List[Document], remove_ids: List[str]):
+        """새 청크를 반영한 새 BM25 / 질병명 인덱스 (아직 교체하지 않음)"""
+        bm25 = self._bm25()
+        new_bm25 = bm25.updated(chunks, remove_ids) if bm25 is not None else None
+        new_index = self._fast_path.index.updated(chunks, remove_ids) if self._fast_path is not None else None
+        return bm25, new_bm25, new_index
+
+    def _swap(self, prepared):
+        """리트리버 목록 / 인덱스 참조를 한 번에 교체 (진행 중인 검색은 이전 객체로 끝까지 실행)"""
+        bm25, new_bm25, new_index = prepared
+        if new_bm25 is not None:
+            self._ensemble.retrievers = [new_bm25 if r is bm25 else r for r in self._ensemble.retrievers]
+        if new_index is not None:
+            self._fast_path.index = new_index
+
+    def _publish(self, revision: int):
+        """새 인덱스 버전 기록 + 알림"""
+        self.revision = revision
+        self.version = get_index_version(self.vectorstore, revision=revision)
+        if self._fast_path is not None:
+            self._fast_path.index.version = self.version
+        METRICS.set_gauge("index_revision", revision)
+        for callback in self._listeners:
+            try:
+                callback(self.version)
+            except Exception as e:
+                print(f"인덱스 갱신 알림 실패: {e}")
+
+    # ---------------------------
+    # 공개 API
+    # ---------------------------
+    def ingest(self, records: List[dict]) -> dict:
+        """
+        상담기록 -> 임베딩 -> Chroma upsert -> BM25 / 질병명 인덱스 교체
+        반환: {'records', 'chunks', 'removed', 'index_version', 'seconds'}
+        """
+        start = time.perf_counter()
+        chunks = qa_records_to_chunks(records)
+        if not chunks:
+            return {"records": 0, "chunks": 0, "removed": 0, "index_version": self.version, "seconds": 0.0}
+
+        collection = self.vectorstore._collection
+        with self._lock, stage("ingest"):
+            revision = max(self._stored_revision(), self.revision) + 1
+            for chunk in chunks:
+                chunk.metadata[INDEX_REVISION_KEY] = revision
+
+            # 다시 넣은 레코드의 청크 수가 줄었으면 남는 청크 삭제
+            record_ids = sorted({chunk.metadata[RECORD_ID_FIELD] for chunk in chunks})
+            chunk_ids = {chunk.id for chunk in chunks}
+            previous = collection.get(where={RECORD_ID_FIELD: {"$in": record_ids}}, include=[])["ids"]
+            remove_ids = [doc_id for doc_id in previous if doc_id not in chunk_ids]
+
+            vectors = []
+            for i in range(0, len(chunks), self.batch_size):
+                batch = chunks[i:i + self.batch_size]
+                vectors.extend(self.vectorstore.embeddings.embed_documents([chunk.page_content for chunk in batch]))
+
+            # 교체할 인덱스를 먼저 만들어 두고 Chroma 반영 직후 교체
+            prepared = self._prepare(chunks, remove_ids)
+            collection.upsert(ids=[chunk.id for chunk in chunks], embeddings=vectors,
+                              documents=[chunk.page_content for chunk in chunks],
+                              metadatas=[chunk.metadata for chunk in chunks])
+            self._store_revision(revision)
+            self._swap(prepared)
+            # 교체한 인덱스에는 없는 청크이므로 교체 후 삭제
+            # (그 사이 이전 질병명 인덱스로 검색 중이던 질문은 EntityFastPathRetriever가 전체 검색으로 대체)
+            if remove_ids:
+                collection.delete(ids=remove_ids)
+            self._publish(revision)
+
+        METRICS.incr("index_ingested_chunks", len(chunks))
+        return {"records": len(records), "chunks": len(chunks), "removed": len(remove_ids),
+                "index_version": self.version, "seconds": time.perf_counter() - start}
+
+    def sync(self, min_interval: float = 0.0) -> bool:
+        """
+        다른 프로세스가 Chroma에 반영한 청크를 BM25 / 질병명 인덱스에 반영 (바뀐 것이 없으면 False)
+        min_interval: 마지막 확인 후 이 시간(초)이 지나지 않았으면 확인하지 않음 (질문마다 호출할 때)
+        """
+        if self._ensemble is None or time.monotonic() - self._last_sync < min_interval:
+            return False
+        self._last_sync = time.monotonic()
+        if self._stored_revision() <= self.revision:
+            return False
+
+        with self._lock, stage("index_sync"):
+            revision = self._stored_revision()
+            if revision <= self.revision:
+                return False
+            data = self.vectorstore._collection.get(where={INDEX_REVISION_KEY: {"$gt": self.revision}},
+                                                    include=["documents", "metadatas"])
+            chunks = [Document(page_content=text, metadata=metadata or {}, id=doc_id)
+                      for doc_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"])]
+            # 같은 레코드의 이전 청크 중 Chroma에서 삭제된 청크
+            record_ids = {chunk.metadata.get(RECORD_ID_FIELD) for chunk in chunks} - {None}
+            live_ids = set(data["ids"])
+            remove_ids = [doc.id for doc in self._bm25().docs
+                          if doc.metadata.get(RECORD_ID_FIELD) in record_ids and doc.id not in live_ids]
+            self._swap(self._prepare(chunks, remove_ids))
+            self._publish(revision)
+        print(f"인덱스 동기화: 청크 {len(chunks)}개 반영, {len(remove_ids)}개 제거 -> {self.version}")
+        return True
+
+    def metrics(self) -> dict:
+        bm25 = self._bm25()
+        return {"index_version": self.version, "revision": self.revision,
+                "bm25_docs": len(bm25.docs) if bm25 is not None else None}
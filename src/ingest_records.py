@@ -0,0 +1,36 @@
+'''
+새 상담기록 증분 반영 (전처리 + 벡터스토어 전체 생성 없이)
+상담기록 JSON(preprocessing.py와 같은 meta / qa 형식)을 청킹 -> 임베딩 -> Chroma upsert 하고 인덱스 리비전을 올립니다.
+실행 중인 Streamlit 앱 / API 서버는 INDEX_SYNC_INTERVAL초 안에 새 청크를 BM25 / 질병명 인덱스에 반영합니다. (재시작 불필요)
+API 서버 안에서 바로 반영하려면 POST /ingest 사용
+
+실행: python ingest_records.py [bge_m3|openai] <JSON 파일 또는 폴더>
+'''
+
+import sys
+import warnings
+warnings.filterwarnings("ignore")
+
+from dotenv import load_dotenv
+
+from bench_utils import load_vectorstore
+from index_updater import IndexUpdater, load_qa_records
+
+load_dotenv()
+
+if len(sys.argv) < 3:
+    sys.exit("실행: python ingest_records.py [bge_m3|openai] <JSON 파일 또는 폴더>")
+
+VECTORSTORE_TYPE = sys.argv[1]
+RECORDS_PATH = sys.argv[2]
+
+records = load_qa_records(RECORDS_PATH)
+print(f"상담기록 {len(records)}건 로드: {RECORDS_PATH}")
+
+vectorstore = load_vectorstore(VECTORSTORE_TYPE)
+updater = IndexUpdater(vectorstore)
+print(f"반영 전 인덱스 버전: {updater.version}")
+
+result = updater.ingest(records)
+print(f"청크 {result['chunks']}개 upsert, 이전 청크 {result['removed']}개 삭제 ({result['seconds']:.1f}초)")
+print(f"반영 후 인덱스 버전: {result['index_version']}")
@@ -0,0 +1,330 @@
+'''
+로컬 계측 (LangSmith 없이, 오프라인에서 동작)
+- 단계별 지연시간: query_embedding / dense_search / bm25 / fusion / self_check / stitch / compress /
+  rewrite / generate (검색 구성 요소와 질문 처리 그래프에서 stage()로 기록)
+- LLM 토큰 수: prompt / completion (TokenUsageHandler 콜백, 단계별로 집계)
+- 프로세스 내 히스토그램(단계별) + 카운터(토큰) -> Prometheus 텍스트 형식으로 내보내기
+- 질문 1개 단위 기록(trace_request): 끝나면 JSONL 파일에 한 줄씩 추가 (configure_metrics(log_path=...))
+- serve_metrics(port): http://localhost:<port>/metrics 에서 Prometheus 형식으로 조회
+- record_degradation(name): 마감 시간 때문에 생략/대체한 단계 기록 (rag_degraded_<name>_total, 질문별 JSONL의 degraded)
+- 게이지(set_gauge): 현재 값 (예: OpenAI 호출 대기열 길이 - llm_governor.py)
+
+사용 예:
+    with trace_request(question) as trace:
+        result = run_rag_graph(graph, question)
+    print(trace.as_dict())
+'''
+
+import contextvars
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# 지연시간 히스토그램 구간 경계(초)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("rag_trace", default=None)
+_current_stage: contextvars.ContextVar = contextvars.ContextVar("rag_stage", default=None)
+
+
+class Histogram:
+    """누적 구간 히스토그램 (Prometheus histogram과 같은 방식)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 마지막 칸은 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """구간 경계 기준 근사 분위수"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    """단계별 지연시간 히스토그램 + 토큰 카운터 (스레드 안전)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Histogram] = {}
+        self.tokens: Dict[tuple, int] = {}  # (stage, kind) -> 토큰 수
+        self.counters: Dict[str, int] = {}  # 기타 카운터 (rag_<name>_total)
+        self.gauges: Dict[str, float] = {}  # 현재 값 (rag_<name>)
+        self.requests = 0
+        self.log_path: Optional[str] = None
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram(self.buckets)
+            self.histograms[stage].observe(seconds)
+
+    def add_tokens(self, stage: str, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            for kind, value in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+                self.tokens[(stage, kind)] = self.tokens.get((stage, kind), 0) + value
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+
+    def record_request(self, trace: "RequestTrace"):
+        with self._lock:
+            self.requests += 1
+            log_path = self.log_path
+        if log_path:
+            with self._lock, open(log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(trace.as_dict(), ensure_ascii=False) + "\n")
+
+    def summary(self) -> Dict[str, dict]:
+        """단계별 count / 평균 / p50 / p95 (ms)"""
+        with self._lock:
+            return {
+                stage: {
+                    "count": hist.count,
+                    "mean_ms": hist.sum / hist.count * 1000 if hist.count else 0.0,
+                    "p50_ms": hist.quantile(0.5) * 1000,
+                    "p95_ms": hist.quantile(0.95) * 1000,
+                }
+                for stage, hist in self.histograms.items()
+            }
+
+    def to_prometheus(self) -> str:
+        """Prometheus 텍스트 노출 형식"""
+        lines = [
+            "# HELP rag_stage_seconds RAG 파이프라인 단계별 소요 시간",
+            "# TYPE rag_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, hist in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {hist.count}')
+                lines.append(f'rag_stage_seconds_sum{{stage="{stage}"}} {hist.sum}')
+                lines.append(f'rag_stage_seconds_count{{stage="{stage}"}} {hist.count}')
+
+            lines += ["# HELP rag_llm_tokens_total LLM 토큰 수", "# TYPE rag_llm_tokens_total counter"]
+            for (stage, kind), value in sorted(self.tokens.items()):
+                lines.append(f'rag_llm_tokens_total{{stage="{stage}",kind="{kind}"}} {value}')
+
+            lines += ["# HELP rag_requests_total 처리한 질문 수", "# TYPE rag_requests_total counter",
+                      f"rag_requests_total {self.requests}"]
+            for name, value in sorted(self.counters.items()):
+                lines += [f"# TYPE rag_{name}_total counter", f"rag_{name}_total {value}"]
+            for name, value in sorted(self.gauges.items()):
+                lines += [f"# TYPE rag_{name} gauge", f"rag_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path: str):
+        """Prometheus 텍스트 형식으로 파일 저장 (node_exporter textfile collector 등에서 읽기)"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.tokens.clear()
+            self.counters.clear()
+            self.gauges.clear()
+            self.requests = 0
+
+
+METRICS = MetricsRegistry()
+
+
+class RequestTrace:
+    """질문 1개의 단계별 소요 시간 / 토큰 수"""
+
+    def __init__(self, question: str):
+        self.question = question
+        self.started_at = time.time()
+        self.stages: Dict[str, float] = {}
+        self.tokens: Dict[str, Dict[str, int]] = {}
+        self.degraded: List[str] = []
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_tokens(self, stage: str, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            counts = self.tokens.setdefault(stage, {"prompt": 0, "completion": 0})
+            counts["prompt"] += prompt_tokens
+            counts["completion"] += completion_tokens
+
+    def add_degradation(self, name: str):
+        with self._lock:
+            self.degraded.append(name)
+
+    def as_dict(self) -> dict:
+        return {
+            "question": self.question,
+            "started_at": self.started_at,
+            "total_s": self.total,
+            "stages_s": dict(self.stages),
+            "tokens": {stage: dict(counts) for stage, counts in self.tokens.items()},
+            "degraded": list(self.degraded),
+        }
+
+
+@contextmanager
+def trace_request(question: str) -> Iterator[RequestTrace]:
+    """
+    질문 1개 계측 구간. 안쪽에서 기록되는 stage / 토큰이 이 trace에 모임
+    이미 trace가 열려 있으면(바깥에서 감싼 경우) 그 trace를 그대로 사용
+    """
+    current = _current_trace.get()
+    if current is not None:
+        yield current
+        return
+
+    trace = RequestTrace(question)
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.total = time.perf_counter() - start
+        _current_trace.reset(token)
+        METRICS.observe("request", trace.total)
+        METRICS.record_request(trace)
+
+
+class _StageTimer:
+    seconds = 0.0
+
+
+@contextmanager
+def stage(name: str) -> Iterator[_StageTimer]:
+    """단계 소요 시간 기록 (전역 히스토그램 + 현재 질문 trace). timer.seconds로 소요 시간 확인"""
+    timer = _StageTimer()
+    token = _current_stage.set(name)
+    start = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        timer.seconds = time.perf_counter() - start
+        _current_stage.reset(token)
+        METRICS.observe(name, timer.seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_stage(name, timer.seconds)
+
+
+def current_stage() -> Optional[str]:
+    """지금 실행 중인 stage 이름 (없으면 None)"""
+    return _current_stage.get()
+
+
+def record_tokens(prompt_tokens: int, completion_tokens: int, stage_name: Optional[str] = None):
+    """토큰 수 기록 (stage_name이 없으면 현재 stage, 그것도 없으면 'llm')"""
+    stage_name = stage_name or _current_stage.get() or "llm"
+    METRICS.add_tokens(stage_name, prompt_tokens, completion_tokens)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_tokens(stage_name, prompt_tokens, completion_tokens)
+
+
+def record_degradation(name: str):
+    """마감 시간 때문에 생략/대체한 단계 기록 (예: self_check_skipped, generate_timeout)"""
+    METRICS.incr(f"degraded_{name}")
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_degradation(name)
+
+
+def _usage_from_result(response) -> List[tuple]:
+    """LLMResult -> [(prompt_tokens, completion_tokens)]"""
+    usages = []
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                usages.append((usage.get("input_tokens", 0), usage.get("output_tokens", 0)))
+    if usages:
+        return usages
+
+    token_usage = (response.llm_output or {}).get("token_usage") or {}
+    if token_usage:
+        return [(token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0))]
+    return []
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """LLM 호출이 끝날 때 토큰 사용량을 METRICS / 현재 trace에 기록하는 콜백"""
+
+    def on_llm_end(self, response, **kwargs):
+        for prompt_tokens, completion_tokens in _usage_from_result(response):
+            record_tokens(prompt_tokens, completion_tokens)
+
+
+TOKEN_USAGE_HANDLER = TokenUsageHandler()
+
+
+def configure_metrics(log_path: Optional[str] = None, port: Optional[int] = None):
+    """질문별 JSONL 로그 경로 지정 / Prometheus 엔드포인트 시작 (둘 다 선택)"""
+    if log_path:
+        os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+        METRICS.log_path = log_path
+    if port:
+        serve_metrics(port)
+
+
+_servers: Dict[int, object] = {}
+
+
+def serve_metrics(port: int = 9464, host: str = "127.0.0.1"):
+    """GET /metrics 로 Prometheus 텍스트를 돌려주는 백그라운드 HTTP 서버 (포트별 1개)"""
+    if port in _servers:
+        return _servers[port]
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = METRICS.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    _servers[port] = server
+    print(f"계측 엔드포인트: http://{host}:{port}/metrics")
+    return server
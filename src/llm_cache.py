@@ -0,0 +1,99 @@
+'''
+LLM 응답 영구 캐시 (LangChain 전역 LLM 캐시)
+- 키: (모델 설정 문자열(llm_string: 모델명/temperature 등), 프롬프트) 해시
+- 저장소: 로컬 SQLite (cache_utils.SQLiteCache) - TTL, 최대 개수 초과 시 오래 사용하지 않은 항목부터 삭제
+- namespace: 프롬프트 버전별로 구분 (LLM_CACHE_NAMESPACE를 바꾸면 이전 응답은 사용하지 않음)
+- 적중/미스 카운터: llm_cache_metrics()
+
+enable_llm_cache()를 호출하면 그 뒤의 모든 LangChain LLM 호출(rewrite / self-check / RAG 답변 /
+RAGAS 평가 / 테스트셋 생성)이 이 캐시를 거칩니다. temperature=0 체인은 같은 프롬프트에 같은 답을 주므로
+Streamlit 재실행이나 평가 재실행 때 API 비용과 대기 시간을 줄일 수 있습니다.
+(토큰 스트리밍(.stream) 호출은 LangChain이 캐시를 거치지 않습니다.)
+
+환경변수: LLM_CACHE=0 (끄기), LLM_CACHE_PATH, LLM_CACHE_NAMESPACE, LLM_CACHE_TTL(초), LLM_CACHE_MAX_ENTRIES
+'''
+
+import os
+from typing import Optional
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+from cache_utils import CacheStats, SQLiteCache, make_key
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_LLM_CACHE_PATH = os.path.join(PROJECT_ROOT, "data", "cache", "llm_responses.sqlite")
+DEFAULT_NAMESPACE = "v1"
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 50_000
+
+
+class PersistentLLMCache(BaseCache):
+    """SQLite 기반 LangChain LLM 캐시 (set_llm_cache로 등록)"""
+
+    def __init__(self, path: str = DEFAULT_LLM_CACHE_PATH, namespace: str = DEFAULT_NAMESPACE,
+                 ttl: Optional[float] = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.namespace = f"llm:{namespace}"
+        self.store = SQLiteCache(path, namespace=self.namespace, max_entries=max_entries, ttl=ttl)
+        self.stats = CacheStats("hits", "misses")
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return make_key(llm_string, prompt)
+
+    def lookup(self, prompt: str, llm_string: str):
+        value = self.store.get(self._key(prompt, llm_string))
+        if value is None:
+            self.stats.incr("misses")
+            return None
+        try:
+            generations = loads(value.decode("utf-8"))
+        except Exception:
+            # 직렬화 형식이 바뀐 항목은 미스로 처리 (새 응답으로 덮어씀)
+            self.stats.incr("misses")
+            return None
+        self.stats.incr("hits")
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        self.store.put(self._key(prompt, llm_string), dumps(return_val).encode("utf-8"))
+
+    def clear(self, **kwargs) -> None:
+        self.store.clear()
+
+    def metrics(self) -> dict:
+        counts = self.stats.as_dict()
+        lookups = counts["hits"] + counts["misses"]
+        return {**counts, "hit_rate": counts["hits"] / lookups if lookups else 0.0, "entries": len(self.store)}
+
+
+_cache: Optional[PersistentLLMCache] = None
+
+
+def enable_llm_cache(path: Optional[str] = None, namespace: Optional[str] = None,
+                     ttl: Optional[float] = None, max_entries: Optional[int] = None) -> Optional[PersistentLLMCache]:
+    """
+    전역 LLM 캐시 등록 (이미 등록되어 있으면 그대로 반환, LLM_CACHE=0이면 등록하지 않고 None)
+    인자를 주지 않으면 환경변수 -> 기본값 순으로 사용
+    """
+    global _cache
+    if os.getenv("LLM_CACHE", "1") == "0":
+        return None
+    if _cache is not None:
+        return _cache
+
+    from langchain_core.globals import set_llm_cache
+
+    _cache = PersistentLLMCache(
+        path=path or os.getenv("LLM_CACHE_PATH", DEFAULT_LLM_CACHE_PATH),
+        namespace=namespace or os.getenv("LLM_CACHE_NAMESPACE", DEFAULT_NAMESPACE),
+        ttl=ttl if ttl is not None else float(os.getenv("LLM_CACHE_TTL", DEFAULT_TTL)),
+        max_entries=max_entries or int(os.getenv("LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+    )
+    set_llm_cache(_cache)
+    return _cache
+
+
+def llm_cache_metrics() -> dict:
+    """전역 LLM 캐시 적중률 (캐시를 켜지 않았으면 빈 dict)"""
+    return _cache.metrics() if _cache is not None else {}
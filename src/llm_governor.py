@@ -0,0 +1,448 @@
+'''
+프로세스 전체 OpenAI 호출 조절기 (LLM + 임베딩 공통)
+Streamlit 세션/평가 실행마다 따로 호출하면 사용자가 몰릴 때 self-check 호출이 한꺼번에 나가 사용량 한도(429)에 걸리므로,
+한 프로세스의 모든 OpenAI 호출이 조절기 1개를 거치도록 합니다.
+- 동시 호출 수 제한 (OPENAI_MAX_CONCURRENCY) - 자리가 없으면 우선순위 순으로 대기
+  우선순위: INTERACTIVE(답변 생성) > DEFAULT(검색 중 self-check / rewrite / 질문 임베딩) > BACKGROUND(평가 / 인덱싱)
+- 분당 요청 수 / 토큰 수 예산 (OPENAI_RPM / OPENAI_TPM, 0이면 제한 없음) - 예상 토큰 수를 먼저 차감하고 응답의 실제 사용량으로 정산
+- 429 / 5xx / 연결 오류는 지수 백오프 + 무작위 지연(full jitter)으로 재시도 (Retry-After 헤더가 있으면 그 시간 사용)
+  재시도는 조절기가 담당하므로 클라이언트 자체 재시도는 끔 (max_retries=0)
+- 계측(instrumentation.py): openai_queue_depth / openai_in_flight 게이지, openai_calls / openai_throttled /
+  openai_retries / openai_failures / openai_rate_waits 카운터, openai_wait 히스토그램(자리 + 예산 대기 시간)
+
+사용 예:
+    llm = GovernedChatOpenAI(model="gpt-4o-mini", priority=BACKGROUND)
+    with llm_priority(INTERACTIVE):
+        llm.invoke(...)
+'''
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from cache_utils import CacheStats
+from context_builder import count_tokens
+from instrumentation import METRICS, current_stage
+
+try:
+    from openai import APIConnectionError
+    _CONNECTION_ERRORS: tuple = (APIConnectionError,)
+except ImportError:
+    _CONNECTION_ERRORS = ()
+
+# 우선순위 (작을수록 먼저)
+INTERACTIVE = 0
+DEFAULT = 1
+BACKGROUND = 2
+
+# 응답 길이를 모를 때 예상 출력 토큰 수 (요청 전 토큰 예산 차감용)
+DEFAULT_COMPLETION_TOKENS = 512
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("openai_priority", default=None)
+
+
+@contextmanager
+def llm_priority(level: int):
+    """with 블록 안의 OpenAI 호출 우선순위 지정 (모델에 지정한 priority보다 우선)"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+# ---------------------------
+# 오류 분류
+# ---------------------------
+def is_rate_limit_error(error: BaseException) -> bool:
+    """사용량 한도 초과(429)"""
+    return getattr(error, "status_code", None) == 429
+
+
+def is_retryable(error: BaseException) -> bool:
+    """다시 시도하면 성공할 수 있는 오류 (429 / 5xx / 연결 오류, 결제 한도 초과는 제외)"""
+    if getattr(error, "code", None) == "insufficient_quota":
+        return False
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, _CONNECTION_ERRORS)
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """응답 헤더의 Retry-After (초)"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+# ---------------------------
+# 동시 호출 자리 / 분당 예산
+# ---------------------------
+class _PrioritySlots:
+    """우선순위 세마포어 (자리가 나면 우선순위가 가장 높은, 먼저 온 대기자부터)"""
+
+    def __init__(self, size: int, on_change: Callable[[int, int], None]):
+        self.size = size
+        self.in_flight = 0
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._on_change = on_change
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def acquire(self, priority: int):
+        with self._cond:
+            if self.in_flight < self.size and not self._waiters:
+                self.in_flight += 1
+                self._on_change(self.in_flight, 0)
+                return
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            self._on_change(self.in_flight, len(self._waiters))
+            while not (self.in_flight < self.size and self._waiters[0] is entry):
+                self._cond.wait()
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            self._on_change(self.in_flight, len(self._waiters))
+            # 자리가 더 남아 있으면 다음 대기자도 확인하도록
+            self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._on_change(self.in_flight, len(self._waiters))
+            self._cond.notify_all()
+
+
+class _RateBudget:
+    """분당 예산 토큰 버킷 (먼저 차감하고, 모자라면 채워질 때까지 기다릴 시간을 돌려줌)"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.available = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            self._refill()
+            self.available -= min(amount, self.capacity)
+            return max(0.0, -self.available) / self.rate
+
+    def refund(self, amount: float):
+        """예상보다 적게 쓴 만큼 돌려받음 (음수면 추가 차감)"""
+        with self._lock:
+            self._refill()
+            self.available = min(self.capacity, self.available + amount)
+
+
+# ---------------------------
+# 조절기
+# ---------------------------
+class OpenAIGovernor:
+    """동시 호출 수 / 분당 요청·토큰 예산 / 재시도를 한곳에서 관리 (스레드 안전, async 호출도 지원)"""
+
+    def __init__(self, max_concurrency: int = 8, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_retries: int = 5, base_delay: float = 0.5, max_delay: float = 30.0,
+                 default_priority: int = DEFAULT):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.default_priority = default_priority
+        self.requests = _RateBudget(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = _RateBudget(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.stats = CacheStats("calls", "retries", "throttled", "server_errors", "failures", "rate_waits")
+        self._slots = _PrioritySlots(max_concurrency, self._publish)
+
+    @classmethod
+    def from_env(cls) -> "OpenAIGovernor":
+        """.env의 OPENAI_MAX_CONCURRENCY / OPENAI_RPM / OPENAI_TPM / OPENAI_MAX_RETRIES 등으로 설정"""
+        return cls(
+            max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "8")),
+            requests_per_minute=float(os.getenv("OPENAI_RPM", "0")),
+            tokens_per_minute=float(os.getenv("OPENAI_TPM", "0")),
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "5")),
+            base_delay=float(os.getenv("OPENAI_BACKOFF_BASE_S", "0.5")),
+            max_delay=float(os.getenv("OPENAI_BACKOFF_MAX_S", "30")),
+        )
+
+    def _publish(self, in_flight: int, waiting: int):
+        METRICS.set_gauge("openai_in_flight", in_flight)
+        METRICS.set_gauge("openai_queue_depth", waiting)
+
+    def resolve_priority(self, priority: Optional[int] = None) -> int:
+        """llm_priority() 블록 > 모델의 priority > 답변 생성 단계면 INTERACTIVE > default_priority"""
+        scoped = _priority.get()
+        if scoped is not None:
+            return scoped
+        if priority is not None:
+            return priority
+        if current_stage() == "generate":
+            return INTERACTIVE
+        return self.default_priority
+
+    # ---------------------------
+    # 자리 / 예산 확보
+    # ---------------------------
+    def _budget_delay(self, tokens: int) -> float:
+        delay = 0.0
+        if self.requests:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens and tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        if delay > 0:
+            self.stats.incr("rate_waits")
+            METRICS.incr("openai_rate_waits")
+        return delay
+
+    def _entered(self, started: float):
+        self.stats.incr("calls")
+        METRICS.incr("openai_calls")
+        METRICS.observe("openai_wait", time.perf_counter() - started)
+
+    def _enter(self, priority: int, tokens: int):
+        started = time.perf_counter()
+        self._slots.acquire(priority)
+        delay = self._budget_delay(tokens)
+        if delay > 0:
+            # 자리를 잡은 채로 기다려야 뒤에 온 낮은 우선순위 호출이 예산을 먼저 쓰지 않음
+            time.sleep(delay)
+        self._entered(started)
+
+    async def _aenter(self, priority: int, tokens: int):
+        started = time.perf_counter()
+        acquiring = asyncio.ensure_future(asyncio.to_thread(self._slots.acquire, priority))
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # 취소되어도 자리 확보 스레드는 끝까지 실행되므로, 확보되는 즉시 반납
+            acquiring.add_done_callback(lambda _: self._slots.release())
+            raise
+        try:
+            delay = self._budget_delay(tokens)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            self._slots.release()
+            raise
+        self._entered(started)
+
+    def _exit(self):
+        self._slots.release()
+
+    def settle(self, reserved: int, used: Optional[int]):
+        """요청 전에 차감한 예상 토큰 수를 실제 사용량으로 정산"""
+        if self.tokens and used is not None:
+            self.tokens.refund(reserved - used)
+
+    # ---------------------------
+    # 재시도
+    # ---------------------------
+    def _retry_delay(self, error: BaseException, attempt: int) -> Optional[float]:
+        """다시 시도할 때까지 기다릴 시간 (재시도하지 않으면 None)"""
+        if not is_retryable(error):
+            return None
+        if is_rate_limit_error(error):
+            self.stats.incr("throttled")
+            METRICS.incr("openai_throttled")
+        else:
+            self.stats.incr("server_errors")
+            METRICS.incr("openai_server_errors")
+        if attempt >= self.max_retries:
+            self.stats.incr("failures")
+            METRICS.incr("openai_failures")
+            return None
+        self.stats.incr("retries")
+        METRICS.incr("openai_retries")
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn: Callable, *args, priority: Optional[int] = None, tokens: int = 0, **kwargs):
+        """fn(*args, **kwargs)를 자리/예산을 확보한 뒤 실행 (재시도 가능한 오류는 백오프 후 재시도)"""
+        priority = self.resolve_priority(priority)
+        for attempt in itertools.count():
+            self._enter(priority, tokens)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self._exit()
+            time.sleep(delay)
+
+    async def acall(self, fn: Callable, *args, priority: Optional[int] = None, tokens: int = 0, **kwargs):
+        """call()의 async 버전 (fn은 coroutine 함수)"""
+        priority = self.resolve_priority(priority)
+        for attempt in itertools.count():
+            await self._aenter(priority, tokens)
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self._exit()
+            await asyncio.sleep(delay)
+
+    def stream(self, make_stream: Callable[[], Iterable], priority: Optional[int] = None,
+               tokens: int = 0) -> Iterator:
+        """
+        스트리밍 호출: 자리는 스트림이 끝날 때까지 유지
+        첫 청크를 받기 전 오류만 재시도 (이미 전달한 청크가 있으면 그대로 오류)
+        """
+        priority = self.resolve_priority(priority)
+        for attempt in itertools.count():
+            self._enter(priority, tokens)
+            try:
+                chunks = iter(make_stream())
+                first = next(chunks)
+            except StopIteration:
+                self._exit()
+                return
+            except Exception as e:
+                self._exit()
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            try:
+                yield first
+                yield from chunks
+            finally:
+                self._exit()
+            return
+
+    def metrics(self) -> dict:
+        """호출 / 재시도 / 429 횟수, 현재 동시 호출 수와 대기열 길이"""
+        return {**self.stats.as_dict(), "in_flight": self._slots.in_flight, "queue_depth": self._slots.waiting,
+                "max_concurrency": self.max_concurrency}
+
+
+@lru_cache(maxsize=None)
+def get_governor() -> OpenAIGovernor:
+    """프로세스 전체에서 공유하는 조절기 (처음 사용할 때 .env 설정으로 생성)"""
+    return OpenAIGovernor.from_env()
+
+
+# ---------------------------
+# 조절기를 거치는 OpenAI 모델
+# ---------------------------
+def _messages_tokens(messages) -> int:
+    return sum(count_tokens(str(message.content)) for message in messages)
+
+
+def _result_tokens(result) -> Optional[int]:
+    """ChatResult의 실제 토큰 사용량 (없으면 None)"""
+    total = 0
+    found = False
+    for generation in result.generations:
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage:
+            total += usage.get("total_tokens", 0)
+            found = True
+    if found:
+        return total
+    token_usage = (result.llm_output or {}).get("token_usage") or {}
+    return token_usage.get("total_tokens")
+
+
+class GovernedChatOpenAI(ChatOpenAI):
+    """모든 호출이 get_governor()를 거치는 ChatOpenAI (priority가 None이면 조절기 규칙으로 결정)"""
+
+    priority: Optional[int] = None
+    # 재시도는 조절기가 담당
+    max_retries: Optional[int] = 0
+
+    def _estimate_tokens(self, messages) -> int:
+        return _messages_tokens(messages) + (self.max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        if self.streaming:
+            # streaming=True면 부모 _generate가 _stream을 호출하므로 거기서 조절
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        governor = get_governor()
+        tokens = self._estimate_tokens(messages)
+        result = governor.call(super()._generate, messages, stop=stop, run_manager=run_manager,
+                               priority=self.priority, tokens=tokens, **kwargs)
+        governor.settle(tokens, _result_tokens(result))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        if self.streaming:
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        governor = get_governor()
+        tokens = self._estimate_tokens(messages)
+        result = await governor.acall(super()._agenerate, messages, stop=stop, run_manager=run_manager,
+                                      priority=self.priority, tokens=tokens, **kwargs)
+        governor.settle(tokens, _result_tokens(result))
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        governor = get_governor()
+        tokens = self._estimate_tokens(messages)
+        parent_stream = super()._stream
+        used = None
+        try:
+            for chunk in governor.stream(lambda: parent_stream(messages, stop=stop, run_manager=run_manager,
+                                                               **kwargs),
+                                         priority=self.priority, tokens=tokens):
+                usage = getattr(chunk.message, "usage_metadata", None)
+                if usage:
+                    used = (used or 0) + usage.get("total_tokens", 0)
+                yield chunk
+        finally:
+            governor.settle(tokens, used)
+
+
+class GovernedOpenAIEmbeddings(OpenAIEmbeddings):
+    """모든 호출이 get_governor()를 거치는 OpenAIEmbeddings (embed_query도 embed_documents를 거침)"""
+
+    priority: Optional[int] = None
+    max_retries: int = 0
+
+    def _estimate_tokens(self, texts: List[str]) -> int:
+        return sum(count_tokens(text) for text in texts)
+
+    def embed_documents(self, texts: List[str], chunk_size: Optional[int] = None, **kwargs: Any) -> List[List[float]]:
+        parent = super().embed_documents
+        return get_governor().call(parent, texts, chunk_size=chunk_size, priority=self.priority,
+                                   tokens=self._estimate_tokens(texts), **kwargs)
+
+    async def aembed_documents(self, texts: List[str], chunk_size: Optional[int] = None,
+                               **kwargs: Any) -> List[List[float]]:
+        parent = super().aembed_documents
+        return await get_governor().acall(parent, texts, chunk_size=chunk_size, priority=self.priority,
+                                          tokens=self._estimate_tokens(texts), **kwargs)
@@ -0,0 +1,302 @@
+'''
+동시 사용자 부하 테스트 (retrieve -> self-check -> rewrite -> generate 파이프라인)
+- 동시 사용자 N명이 테스트 데이터셋(output/pet_test_dataset_*.csv) 질문을 차례로 재생
+- 기본: 이 프로세스 안에서 서비스 그래프(rag_service.py)를 가짜 모델(fake_models.py)로 실행
+  (BM25/Chroma 검색, self-check, rewrite, 생성 흐름은 실제 코드 그대로, LLM과 임베딩 모델만 가짜)
+- --http: 같은 가짜 구성으로 HTTP API(api_server.py)를 이 프로세스에서 띄우고 /ask로 요청
+- --url=URL: 이미 실행 중인 API 서버에 요청 (서버 쪽 모델 사용, 가짜 모델 옵션 무시)
+- 검색 대상 문서: data/ChromaDB_<type>이 있으면 그 문서를 가짜 임베딩으로 다시 색인, 없으면 테스트 데이터셋 reference
+- 결과: QPS, 오류 수(종류별), 단계별 p50/p95/p99 -> output/load_test_results.csv에 누적
+
+가짜 모델 옵션:
+  --llm-latency=0.5 (초, 첫 토큰까지)   --llm-token-latency=0.0 (출력 토큰당 초)
+  --embed-latency=0.02 (호출당 초)      --embed-item-latency=0.005 (문장당 초)
+  --error-rate=0.0 (LLM/임베딩 호출마다 오류 확률)
+기타: --think=0 (사용자별 요청 간 대기 초)  --batch (질문 임베딩 마이크로 배칭)
+      --deadline=0 (질문 1개 지연시간 예산 초, 0이면 제한 없음 - 단계 생략/대체 답변 횟수를 함께 출력)
+      --no-cache (질문 임베딩/rewrite 캐시 끄기)  --answer-cache (HTTP 모드에서 답변 캐시 사용)
+
+실행: python load_test.py [동시 사용자 수] [총 요청 수] [bge_m3|openai] [옵션]
+예:   python load_test.py 16 400 --llm-latency=0.8 --error-rate=0.02
+'''
+
+import contextlib
+import csv
+import io
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from collections import Counter
+from datetime import datetime
+warnings.filterwarnings("ignore")
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from bench_utils import PROJECT_ROOT, VECTORSTORE_CONFIG, load_test_dataset, load_test_questions, print_summary, summarize
+
+load_dotenv()
+
+args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+NUM_USERS = int(args[0]) if len(args) > 0 else 8
+NUM_REQUESTS = int(args[1]) if len(args) > 1 else 200
+VECTORSTORE_TYPE = args[2] if len(args) > 2 else "bge_m3"
+
+
+def option(name: str, default, cast=float):
+    """--name=value 옵션 값"""
+    for arg in sys.argv[1:]:
+        if arg.startswith(f"--{name}="):
+            return cast(arg.split("=", 1)[1])
+    return default
+
+
+URL = option("url", None, str)
+HTTP = "--http" in sys.argv or URL is not None
+USE_BATCH = "--batch" in sys.argv
+USE_CACHE = "--no-cache" not in sys.argv
+USE_ANSWER_CACHE = "--answer-cache" in sys.argv
+THINK_TIME = option("think", 0.0)
+ERROR_RATE = option("error-rate", 0.0)
+DEADLINE = option("deadline", 0.0)
+
+RESULT_PATH = os.path.join(PROJECT_ROOT, "output", "load_test_results.csv")
+# 보고서 단계 순서 (이 외의 단계는 뒤에 이름순)
+STAGE_ORDER = ["query_embedding", "query_batch_wait", "dense_search", "bm25", "fusion", "retrieve", "self_check",
+               "stitch", "compress", "rewrite", "generate", "server_total", "request"]
+
+
+# ---------------------------
+# 가짜 모델로 파이프라인 구성
+# ---------------------------
+def load_corpus(vectorstore_type: str):
+    """검색 대상 문서 (실제 벡터스토어의 문서, 없으면 테스트 데이터셋 reference)"""
+    config = VECTORSTORE_CONFIG[vectorstore_type]
+    if os.path.exists(config["path"]):
+        import chromadb
+
+        collection = chromadb.PersistentClient(path=config["path"]).get_collection(config["collection_name"])
+        data = collection.get(include=["documents", "metadatas"])
+        return [Document(page_content=text or "", metadata=metadata or {}, id=doc_id)
+                for doc_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"])]
+
+    from metadata_filter import detect_filters
+
+    print(f"벡터스토어가 없어 테스트 데이터셋 reference를 문서로 사용합니다: {config['path']}")
+    # 진료과는 질문에서 감지한 값 (요청마다 적용하는 detect_filters 필터로 검색해도 문서가 남도록)
+    return [Document(page_content=row["reference"],
+                     metadata={"source_type": "qa_data", "lifeCycle": "", "disease": "",
+                               "department": detect_filters(row["user_input"]).get("department", ""),
+                               "record_id": f"testset-{i}", "chunk_index": 0},
+                     id=f"testset-{i}")
+            for i, row in enumerate(load_test_dataset())]
+
+
+def build_fake_system(corpus):
+    """initialize_rag_system()과 같은 형태의 dict (가짜 LLM / 가짜 임베딩 서버 + 메모리 Chroma)"""
+    import chromadb
+    from langchain_community.vectorstores import Chroma
+
+    from embedding_cache import CachedEmbeddings
+    from fake_models import FakeChatModel, FakeEmbeddings
+    from prompt_module import get_index_version, get_retriever
+
+    llm = FakeChatModel(latency=option("llm-latency", 0.5), token_latency=option("llm-token-latency", 0.0),
+                        error_rate=ERROR_RATE)
+    # 색인은 지연/오류 없이 (문서 임베딩은 측정 대상이 아님)
+    base = FakeEmbeddings(latency=0.0, per_item_latency=0.0)
+    embeddings = CachedEmbeddings(base) if USE_CACHE else base
+
+    vectorstore = Chroma(client=chromadb.EphemeralClient(), collection_name="load_test",
+                         embedding_function=embeddings)
+    for start in range(0, len(corpus), 1000):
+        vectorstore.add_documents(corpus[start:start + 1000])
+    base.latency = option("embed-latency", 0.02)
+    base.per_item_latency = option("embed-item-latency", 0.005)
+    base.error_rate = ERROR_RATE
+
+    rag_system = {
+        'vectorstore': vectorstore,
+        'llm': llm,
+        'retriever': get_retriever(vectorstore, k=5),
+        'embeddings': embeddings,
+        'index_version': get_index_version(vectorstore),
+    }
+    if USE_BATCH:
+        from query_batcher import MicroBatchEncoder, enable_query_batching
+
+        if USE_CACHE:
+            enable_query_batching(embeddings)
+        else:
+            vectorstore._embedding_function = MicroBatchEncoder(base)
+    return rag_system
+
+
+# ---------------------------
+# 요청 함수 (질문 1개 -> (단계별 소요 시간, 마감 시간 때문에 적용한 항목))
+# ---------------------------
+def make_graph_call(rag_system):
+    from metadata_filter import detect_filters
+    from rag_graph import run_rag_graph
+    from rag_service import build_service_graph, new_deadline
+    from instrumentation import trace_request
+
+    # rewrite 캐시 파일은 임시 폴더에 (실제 캐시와 섞이지 않도록)
+    graph = build_service_graph(rag_system, os.path.join(tempfile.mkdtemp(), "index"), use_rewrite_cache=USE_CACHE)
+
+    def call(question: str):
+        with trace_request(question) as trace:
+            run_rag_graph(graph, question, filters=detect_filters(question), deadline=new_deadline(DEADLINE))
+        return dict(trace.stages), list(trace.degraded)
+
+    return call
+
+
+def start_local_api(rag_system) -> str:
+    """가짜 구성으로 API 서버를 백그라운드 스레드에서 실행 -> base URL"""
+    import socket
+
+    import uvicorn
+
+    import api_server
+
+    # rewrite 캐시 파일은 임시 폴더에 (실제 캐시와 섞이지 않도록)
+    api_server.server.load(rag_system, vectorstore_path=os.path.join(tempfile.mkdtemp(), "index"))
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    uvicorn_server = uvicorn.Server(uvicorn.Config(api_server.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=uvicorn_server.run, daemon=True).start()
+    while not uvicorn_server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def make_http_call(base_url: str):
+    import httpx
+
+    local = threading.local()
+
+    def call(question: str):
+        # 사용자(스레드)별 연결 1개
+        if not hasattr(local, "client"):
+            local.client = httpx.Client(base_url=base_url, timeout=300)
+        payload = {"question": question, "use_cache": USE_ANSWER_CACHE}
+        if DEADLINE:
+            payload["deadline_s"] = DEADLINE
+        response = local.client.post("/ask", json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        body = response.json()
+        timings = dict(body.get("timings") or {})
+        if "total" in timings:
+            timings["server_total"] = timings.pop("total")
+        return timings, body.get("degraded") or []
+
+    return call
+
+
+# ---------------------------
+# 부하 실행
+# ---------------------------
+def run_load(call, questions, num_users: int, num_requests: int, think_time: float):
+    """동시 사용자 num_users명이 총 num_requests개 요청 -> (요청별 기록, 전체 소요 시간)"""
+    counter = itertools.count()
+    records = []
+    lock = threading.Lock()
+
+    def user(user_id: int):
+        while True:
+            i = next(counter)
+            if i >= num_requests:
+                return
+            question = questions[i % len(questions)]
+            start = time.perf_counter()
+            try:
+                (stages, degraded), error = call(question), ""
+            except Exception as e:
+                stages, degraded, error = {}, [], str(e) if str(e).startswith("HTTP ") else type(e).__name__
+            stages["request"] = time.perf_counter() - start
+            with lock:
+                records.append({"user": user_id, "question": question, "error": error, "stages": stages,
+                                "degraded": degraded})
+            if think_time:
+                time.sleep(think_time)
+
+    threads = [threading.Thread(target=user, args=(u,), daemon=True) for u in range(num_users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records, time.perf_counter() - start
+
+
+def stage_stats(records) -> dict:
+    """성공한 요청 기준 단계별 통계"""
+    values = {}
+    for record in records:
+        if record["error"]:
+            continue
+        for stage, seconds in record["stages"].items():
+            values.setdefault(stage, []).append(seconds)
+    ordered = [s for s in STAGE_ORDER if s in values] + sorted(s for s in values if s not in STAGE_ORDER)
+    return {stage: summarize(values[stage]) for stage in ordered}
+
+
+questions = load_test_questions()
+if not questions:
+    sys.exit("테스트 데이터셋이 없습니다. make_llm_testset.py를 먼저 실행하세요.")
+
+if URL:
+    mode = "http_remote"
+    call = make_http_call(URL)
+else:
+    corpus = load_corpus(VECTORSTORE_TYPE)
+    rag_system = build_fake_system(corpus)
+    print(f"가짜 모델 구성 완료: 문서 {len(corpus)}개 / LLM 지연 {rag_system['llm'].latency}s / 오류율 {ERROR_RATE}")
+    if HTTP:
+        mode = "http_fake"
+        call = make_http_call(start_local_api(rag_system))
+    else:
+        mode = "graph_fake"
+        call = make_graph_call(rag_system)
+
+print(f"부하 테스트 시작: {mode} / 동시 사용자 {NUM_USERS}명 / 요청 {NUM_REQUESTS}개 / 질문 {len(questions)}종")
+# self-check 등 파이프라인 로그는 숨김 (결과 표만 출력)
+with contextlib.redirect_stdout(io.StringIO()):
+    records, wall = run_load(call, questions, NUM_USERS, NUM_REQUESTS, THINK_TIME)
+
+succeeded = [r for r in records if not r["error"]]
+errors = Counter(r["error"] for r in records if r["error"])
+qps = len(succeeded) / wall if wall else 0.0
+print(f"\n소요 {wall:.1f}s / 성공 {len(succeeded)} / 실패 {len(records) - len(succeeded)} / QPS {qps:.2f}")
+for error, count in errors.most_common():
+    print(f"  오류 {error}: {count}")
+degradations = Counter(name for r in records for name in r["degraded"])
+for name, count in degradations.most_common():
+    print(f"  단계 생략/대체 {name}: {count}")
+
+print("\n[단계별 지연시간 (성공 요청 기준)]")
+stats = stage_stats(records)
+for stage, summary in stats.items():
+    print_summary(stage, summary)
+
+timestamp = datetime.now().isoformat(timespec="seconds")
+rows = [{"timestamp": timestamp, "mode": mode, "users": NUM_USERS, "requests": len(records),
+         "errors": len(records) - len(succeeded), "qps": round(qps, 3), "batch": USE_BATCH, "cache": USE_CACHE,
+         "deadline": DEADLINE, "degraded": sum(1 for r in records if r["degraded"]),
+         "stage": stage, **{key: round(value, 2) for key, value in summary.items()}}
+        for stage, summary in stats.items()]
+os.makedirs(os.path.dirname(RESULT_PATH), exist_ok=True)
+write_header = not os.path.exists(RESULT_PATH)
+with open(RESULT_PATH, "a", newline="", encoding="utf-8-sig") as f:
+    writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["timestamp"])
+    if write_header:
+        writer.writeheader()
+    writer.writerows(rows)
+print(f"\n결과 저장: {RESULT_PATH}")
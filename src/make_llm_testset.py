@@ -14,14 +14,18 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # 1. LLM 및 임베딩 모델 준비
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from pydantic import BaseModel, Field
+from llm_cache import enable_llm_cache, llm_cache_metrics
+# OpenAI 호출은 프로세스 공용 조절기를 거침 (429는 백오프 후 재시도)
+from llm_governor import BACKGROUND, GovernedChatOpenAI, GovernedOpenAIEmbeddings
 
-llm = ChatOpenAI(model="gpt-4.1")
-embedding_model = OpenAIEmbeddings(model="text-embedding-3-large")
+# 같은 문서로 다시 생성할 때는 캐시된 응답 재사용
+enable_llm_cache()
+llm = GovernedChatOpenAI(model="gpt-4.1", priority=BACKGROUND)
+embedding_model = GovernedOpenAIEmbeddings(model="text-embedding-3-large", priority=BACKGROUND)
 
 # 2. 벡터스토어 설정 - ChromaDB 벡터스토어 선택
 # 옵션: "bge_m3" 또는 "openai"
@@ -213,6 +217,8 @@ with open(json_filename, 'w', encoding='utf-8') as f:
     json.dump(data_for_df, f, ensure_ascii=False, indent=2)
 print(f"✓ JSON 형식으로도 저장되었습니다: {json_filename}")
 
+print(f"LLM 캐시: {llm_cache_metrics()}")
+
 print("\n" + "="*60)
 print("✅ 작업 완료!")
 print("="*60)
@@ -0,0 +1,109 @@
+'''
+메타데이터 필터
+- 질문에서 진료과(department) / 생애주기(lifeCycle) 감지
+- 필터 dict -> Chroma where 절 변환
+- 필터 dict와 문서 메타데이터 비교
+
+필터 형식: {"department": "안과"} 또는 {"department": ["안과", "피부과"], "lifeCycle": "노령견"}
+(값이 리스트면 그 중 하나라도 일치하면 통과, 필드끼리는 AND)
+주의: lifeCycle/disease는 QA 데이터에만 있으므로 해당 필터를 걸면 서적 데이터는 제외됩니다.
+{"id": [청크 id, ...]}: 메타데이터가 아닌 청크 id(Chroma id)로 후보 제한 (질병 fast-path, entity_index.py)
+'''
+
+from typing import Dict, List, Optional
+
+DEPARTMENTS = ["내과", "안과", "외과", "치과", "피부과"]
+LIFE_CYCLES = ["자견", "성견", "노령견"]
+
+# BM25 인덱스에서 파티션/필터로 사용할 수 있는 메타데이터 필드
+FILTER_FIELDS = ("department", "lifeCycle", "disease", "source_type")
+# 메타데이터 대신 청크 id로 후보를 제한하는 필터 키
+ID_FIELD = "id"
+
+# 진료과 감지용 키워드 (질문에 등장하면 해당 과로 판단)
+DEPARTMENT_KEYWORDS = {
+    "안과": ["안과", "눈곱", "눈물", "결막염", "각막", "백내장", "녹내장", "안구", "체리아이", "유루증", "충혈"],
+    "치과": ["치과", "치아", "이빨", "치석", "잇몸", "치주", "구취", "입냄새", "발치", "스케일링"],
+    "피부과": ["피부", "탈모", "가려움", "가려워", "습진", "아토피", "비듬", "진드기", "각질", "외이염", "귀 냄새"],
+    "외과": ["외과", "슬개골", "탈구", "골절", "인대", "디스크", "절뚝", "절름", "봉합"],
+    "내과": ["내과", "구토", "설사", "신부전", "당뇨", "췌장염", "심장", "기침", "파보", "홍역", "식욕부진", "혈변"],
+}
+
+LIFE_CYCLE_KEYWORDS = {
+    "자견": ["자견", "새끼 강아지", "아기 강아지", "퍼피"],
+    "성견": ["성견"],
+    "노령견": ["노령견", "노견", "노령", "나이 많은"],
+}
+
+
+def _match_keywords(question: str, keyword_map: Dict[str, List[str]]) -> Optional[str]:
+    """키워드가 한 항목에서만 등장할 때 그 항목 반환 (여러 항목이 겹치면 확신이 없으므로 None)"""
+    hits = {name: sum(question.count(kw) for kw in keywords) for name, keywords in keyword_map.items()}
+    matched = [name for name, count in hits.items() if count > 0]
+    if len(matched) == 1:
+        return matched[0]
+    return None
+
+
+def detect_filters(question: str, fields=("department",)) -> dict:
+    """
+    질문에서 메타데이터 필터 감지
+    기본은 서적/QA 모두에 있는 department만 감지합니다. (lifeCycle은 fields에 넣었을 때만)
+    """
+    filters = {}
+    if "department" in fields:
+        department = _match_keywords(question, DEPARTMENT_KEYWORDS)
+        if department:
+            filters["department"] = department
+    if "lifeCycle" in fields:
+        life_cycle = _match_keywords(question, LIFE_CYCLE_KEYWORDS)
+        if life_cycle:
+            filters["lifeCycle"] = life_cycle
+    return filters
+
+
+def normalize_filters(filters: Optional[dict]) -> dict:
+    """필터 값을 항상 리스트로 통일 ({"department": "안과"} -> {"department": ["안과"]}), 빈 값 제거"""
+    normalized = {}
+    for field, value in (filters or {}).items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        values = [v for v in values if v not in (None, "")]
+        if values:
+            normalized[field] = sorted(set(values))
+    return normalized
+
+
+def filter_key(filters: Optional[dict]) -> tuple:
+    """필터를 dict key로 쓸 수 있는 형태로 변환 (같은 필터 질문끼리 묶을 때 사용)"""
+    return tuple((field, tuple(values)) for field, values in sorted(normalize_filters(filters).items()))
+
+
+def filter_ids(filters: Optional[dict]) -> Optional[List[str]]:
+    """필터의 청크 id 목록 (id 필터가 없으면 None)"""
+    return normalize_filters(filters).get(ID_FIELD)
+
+
+def to_chroma_where(filters: Optional[dict]) -> Optional[dict]:
+    """필터 dict -> Chroma where 절 (id 필터는 where가 아니라 query(ids=...)로 전달)"""
+    clauses = []
+    for field, values in normalize_filters(filters).items():
+        if field == ID_FIELD:
+            continue
+        if len(values) == 1:
+            clauses.append({field: {"$eq": values[0]}})
+        else:
+            clauses.append({field: {"$in": values}})
+
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+def matches_filters(metadata: dict, filters: Optional[dict]) -> bool:
+    """문서 메타데이터가 필터 조건을 만족하는지 (id 필터는 메타데이터로 판단할 수 없으므로 제외)"""
+    for field, values in normalize_filters(filters).items():
+        if field != ID_FIELD and metadata.get(field) not in values:
+            return False
+    return True
@@ -75,6 +75,8 @@ for path in paths:
             #기존 메타데이터에 source_type과 source_path 추가
             "source_type": "medical data",
             "source_path": path,  # 어느 경로에서 왔는지 추가
+            # 원본 파일 1개 = 레코드 1개 (같은 서적의 다른 질병 문서와 구분, 인접 청크 합치기에서 사용)
+            "record_id": os.path.relpath(file_path, os.path.dirname(path)),
         }
 
         docs.append(Document(page_content=page_content, metadata=meta))
@@ -130,7 +132,8 @@ for path_qa in paths_qa:
 
             #기존 메타데이터에 source_type과 source_path 추가
             "source_type": "qa_data",
-            "source_path": path_qa  # path 대신 path_qa 사용
+            "source_path": path_qa,  # path 대신 path_qa 사용
+            "record_id": os.path.relpath(file_path, os.path.dirname(path_qa)),
         }
 
         docs_qa.append(Document(page_content=page_content, metadata=metadata))
@@ -1,30 +1,22 @@
 
-import os
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 import warnings
 warnings.filterwarnings("ignore")
 
 # LangChain 임포트
-from langchain_openai import ChatOpenAI
-from langchain_community.vectorstores import Chroma 
-import chromadb
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.documents import Document
-from langchain_community.retrievers import BM25Retriever
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
 from ensemble import EnsembleRetriever
+from entity_index import EntityFastPathRetriever, entity_index_path, load_entity_index
+from retrievers import DenseRetriever, BM25BatchRetriever, load_documents_from_vectorstore
+from sharding import load_sharded_retriever
+# 모델/DB는 처음 필요할 때 로드 (import만으로는 로드하지 않음, LangSmith는 setup_langsmith() 호출 시에만)
+from rag_components import default_embedding_cache_path, get_llm, get_vectorstore, setup_langsmith, warm_up
 
 load_dotenv()
-if not os.environ.get('OPENAI_API_KEY'):
-    raise ValueError('OPENAI_API_KEY 없음. .env 확인하세요')
-if not os.environ.get('LANGSMITH_API_KEY'):
-    raise ValueError('LANGSMITH_API_KEY 없음. env 확인하세요')
-
-os.environ["LANGSMITH_TRACING_V2"] = "true"
-os.environ["LANGSMITH_ENDPOINT"] = "https://api.smith.langchain.com"
-os.environ["LANGSMITH_PROJECT"] = "pet_rag"
-print("LangSmith 연결 완료")
 
 
 
@@ -32,47 +24,27 @@ print("LangSmith 연결 완료")
 # 앙상블 리트리버 생성 함수
 # ---------------------------
 
-def get_retriever(vectorstore, k=5):
-    """앙상블 리트리버 생성"""
+def get_retriever(vectorstore, k=5, cutoff=None):
+    """앙상블 리트리버 생성 (cutoff: 결합 점수 분포에 따라 결과를 자르는 AdaptiveCutoff, None이면 모두 사용)"""
     
-    # 기본 리트리버
-    retriever = vectorstore.as_retriever(search_kwargs={"k": k}, search_type="similarity")
+    # 기본 리트리버 (질문 여러 개를 한 번에 임베딩/검색 가능)
+    retriever = DenseRetriever(vectorstore, k=k)
     
     # BM25 리트리버 생성
 
     # BM25 전용 문서 로드 (벡터스토어의 임베딩을 Document로 변환 - BM25는 텍스트 기반이므로)
-    collection = vectorstore._collection
-    doc_count = collection.count()
-    
-    if doc_count == 0:
-        raise ValueError("벡터스토어가 비어있습니다.")
-    
-    # ChromaDB에서 모든 문서 가져오기
-    all_data = collection.get(limit=doc_count)
-    
-    # Document 객체로 변환
-    bm25_docs = []
-    if all_data and 'ids' in all_data and len(all_data['ids']) > 0:
-        documents = all_data.get('documents', [])
-        metadatas = all_data.get('metadatas', [])
-        
-        for i, doc_id in enumerate(all_data['ids']):
-            page_content = documents[i] if i < len(documents) else ""
-            metadata = metadatas[i] if i < len(metadatas) else {}
-            bm25_docs.append(Document(page_content=page_content, metadata=metadata))
-    
-    if len(bm25_docs) == 0:
-        raise ValueError("벡터스토어에서 문서를 가져올 수 없습니다.")
+    bm25_docs = load_documents_from_vectorstore(vectorstore)
     
     print(f"BM25 리트리버용 문서 {len(bm25_docs)}개 로드 완료")
-    retriever_bm25 = BM25Retriever.from_documents(bm25_docs)
+    retriever_bm25 = BM25BatchRetriever.from_documents(bm25_docs)
     
     
     # 기본 리트리버와 BM25를 합쳐
     # 앙상블 리트리버 생성
     retriever_ensemble = EnsembleRetriever(
         retrievers=[retriever, retriever_bm25],
-        weights=[0.5, 0.5] #가중치
+        weights=[0.5, 0.5], #가중치
+        cutoff=cutoff
     )
     
     return retriever_ensemble
@@ -81,38 +53,75 @@ def get_retriever(vectorstore, k=5):
 # ---------------------------
 # 초기화 함수: 벡터스토어 및 LLM 로드
 # ---------------------------
-def initialize_rag_system(vectorstore_path=r".\data\ChromaDB_bge_m3", collection_name="pet_health_qa_system_bge_m3"):
-    """RAG 시스템 초기화 (벡터스토어, LLM, Retriever)"""
+def initialize_rag_system(vectorstore_path=r".\data\ChromaDB_bge_m3", collection_name="pet_health_qa_system_bge_m3",
+                          embedding_cache_path=None, use_shards=False, cutoff=None,
+                          entity_fast_path=None):
+    """
+    RAG 시스템 초기화 (벡터스토어, LLM, Retriever)
+    embedding_cache_path: 질문 임베딩 영구 캐시(SQLite) 경로. None이면 벡터스토어 옆 cache 폴더 사용, False면 메모리 캐시만 사용
+    use_shards: True면 진료과 샤드 인덱스 + 라우터 사용 (build_shards.py로 샤드를 먼저 생성, 샤드가 없으면 단일 인덱스)
+    cutoff: 앙상블 결합 결과 적응형 자르기 (ensemble.AdaptiveCutoff, None이면 결합 결과 모두 사용)
+    entity_fast_path: 질문에 질병명이 있으면 그 질병 청크로 검색을 "restrict"(제한) / "boost"(상향) (None이면 사용 안 함)
+    """
     
-    # 임베딩 모델 로드
-    embeddings = HuggingFaceEmbeddings(
-        model_name="BAAI/bge-m3",
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
+    # 질문 임베딩 캐시 (같은 질문은 다시 인코딩하지 않음)
+    if embedding_cache_path is None:
+        embedding_cache_path = default_embedding_cache_path(vectorstore_path)
     
-    # 벡터스토어 로드
-    vectorstore = Chroma(
-        persist_directory=vectorstore_path,
-        collection_name=collection_name,
-        embedding_function=embeddings
-    )
-    print("벡터스토어가 성공적으로 로드되었습니다!")
+    # 벡터스토어 로드 (임베딩 모델 / Chroma 클라이언트는 프로세스 전체에서 1개만 생성해 공유)
+    vectorstore = get_vectorstore(vectorstore_path, collection_name, embedding_cache_path or None)
+    embeddings = vectorstore.embeddings
         
     # LLM 초기화
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+    llm = get_llm()
     
     # 앙상블 Retriever 생성 (앙상블)
-    retriever = get_retriever(vectorstore, k=5)
+    retriever = None
+    if use_shards:
+        try:
+            retriever = load_sharded_retriever(vectorstore_path, collection_name, embeddings, k=5,
+                                               client=vectorstore._client, cutoff=cutoff)
+            print(f"샤드 리트리버 로드 완료: {list(retriever.shards)}")
+        except ValueError as e:
+            print(f"샤드를 사용할 수 없어 단일 인덱스를 사용합니다: {e}")
+    if retriever is None:
+        retriever = get_retriever(vectorstore, k=5, cutoff=cutoff)
+
+    # 질병명 fast-path (인덱스 버전이 바뀌었거나 저장된 인덱스가 없으면 코퍼스 메타데이터로 다시 생성)
+    entity_index = None
+    if entity_fast_path:
+        entity_index = load_entity_index(entity_index_path(vectorstore_path, collection_name),
+                                         get_index_version(vectorstore),
+                                         lambda: load_documents_from_vectorstore(vectorstore))
+        retriever = EntityFastPathRetriever(retriever, entity_index, mode=entity_fast_path)
+        print(f"질병명 fast-path ({entity_fast_path}): {entity_index.stats()}")
     
     return {
         'vectorstore': vectorstore,
         'llm': llm,
         'retriever': retriever,
-        'embeddings': embeddings
+        'embeddings': embeddings,
+        'index_version': get_index_version(vectorstore),
+        'entity_index': entity_index
     }
 
 
+# 증분 갱신(index_updater.py) 횟수를 저장하는 컬렉션 메타데이터 키
+INDEX_REVISION_KEY = "index_revision"
+
+
+def get_index_version(vectorstore, revision=None):
+    """
+    인덱스 버전 (컬렉션 이름 + 문서 수 + 증분 갱신 리비전) - 답변 캐시 / 질병명 인덱스 / FAQ 답변 무효화 기준
+    revision: 다른 프로세스가 갱신한 리비전을 직접 넘길 때 (None이면 컬렉션 메타데이터)
+    """
+    collection = vectorstore._collection
+    if revision is None:
+        revision = (collection.metadata or {}).get(INDEX_REVISION_KEY)
+    version = f"{collection.name}:{collection.count()}"
+    return f"{version}:r{revision}" if revision else version
+
+
 
 # ---------------------------
 # 프롬프트 정의
@@ -231,31 +240,131 @@ def self_check_prompt():
 
 
 
-# Self_check_retriver 함수 (LLM이 각 문서를 보고 KEEP/DROP 판단)
-def self_check_retriver(found_docs, question, llm):
+def self_check_batch_prompt():
     '''
-    이 함수는 사용자의 질문을 받아 검색된 문서들을 LLM이 검토하게 합니다. 
-    LLM은 각 문서가 질문에 도움이 되는지 판단해 KEEP/DROP을 결정합니다. 
-    결과적으로 KEEP인 문서만 반환합니다.
+    문서 필터링 프롬프트 (검색된 문서 전체를 한 번에 판단)
     '''
-    #0. mini chain : 문서 keep or drop ?
+    return PromptTemplate.from_template("""
+당신은 검색된 문서들이 사용자 질문과 실제로 관련이 있는지 판단하는 AI 필터입니다.
+
+사용자 질문: {question}
+
+검색된 문서 목록 (대괄호 안의 숫자가 문서 번호):
+{docs}
+
+[판단 기준]
+1. 단순히 키워드만 일치하는 것이 아니라 맥락적으로도 연관성이 있는가?
+2. 문서가 질문에 대한 구체적인 답변이나 도움이 되는 정보를 포함하고 있는가?
+3. 문서가 질문의 핵심 주제와 관련됐는가?
+
+[Keep 조건]
+- 질문에 대한 직접적인 답변을 제공하는 경우
+- 질문과 관련된 증상, 원인, 치료법 등이 포함된 경우
+- 질문의 주제와 동일한 질병이나 상황을 다루는 경우
+
+[Drop 조건] 
+- 질문과 완전히 다른 주제를 다루는 경우
+- 키워드만 일치하고 실제 내용은 무관한 경우
+- 너무 일반적이거나 모호해서 도움이 되지 않는 경우
+
+각 문서를 위 기준에 따라 독립적으로 판단하고, Keep할 문서 번호만 아래 JSON 형식으로 출력하세요.
+Keep할 문서가 없으면 빈 리스트를 출력하세요.
+{{"keep": [0, 2]}}
+
+판단:""")
+
+
+def _numbered_docs(found_docs):
+    """배치 판단용 문서 목록 문자열 ([번호] 내용)"""
+    return "\n\n".join(f'[{i}] """{doc.page_content}"""' for i, doc in enumerate(found_docs))
+
+
+def _self_check_single_call(found_docs, question, llm, timeout):
+    """문서 전체를 LLM 1회 호출로 판단 -> 문서별 Keep 여부 리스트 (실패/타임아웃 시 예외)"""
+    chain = self_check_batch_prompt() | llm | JsonOutputParser()
+    # 타임아웃이 나도 응답을 기다리지 않도록 executor는 wait=False로 종료
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        # 계측(현재 질문 trace / 단계) / LLM 우선순위 컨텍스트를 작업 스레드로 복사
+        future = executor.submit(contextvars.copy_context().run, chain.invoke,
+                                 {'question': question, 'docs': _numbered_docs(found_docs)})
+        result = future.result(timeout=timeout)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if not isinstance(result, dict) or not isinstance(result.get('keep'), list):
+        raise ValueError(f'self-check 응답 형식 오류: {result}')
+    keep_indices = set()
+    for i in result['keep']:
+        try:
+            keep_indices.add(int(i))
+        except (TypeError, ValueError):
+            continue
+    return [i in keep_indices for i in range(len(found_docs))]
+
+
+def _self_check_concurrent(found_docs, question, llm, timeout, max_concurrency):
+    """문서별 Keep/Drop 호출을 동시에 실행 -> 문서별 Keep 여부 리스트 (실패/타임아웃 문서는 Keep)"""
+    if timeout is not None and timeout <= 0:
+        return [True] * len(found_docs)
+
     mini_chain = self_check_prompt() | llm | StrOutputParser()
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(found_docs))))
+    try:
+        futures = [
+            # 계측(현재 질문 trace / 단계) 컨텍스트를 작업 스레드로 복사
+            executor.submit(contextvars.copy_context().run, mini_chain.invoke,
+                            {'question': question, 'doc': doc.page_content})
+            for doc in found_docs
+        ]
+        done, _ = wait(futures, timeout=timeout)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    decisions = []
+    for future in futures:
+        if future not in done or future.exception() is not None:
+            # 판단을 받지 못한 문서는 버리지 않고 남겨둠
+            decisions.append(True)
+        else:
+            decisions.append(future.result().strip().lower() == 'keep')
+    return decisions
 
-    # 2. 문서별로 KEEP/DROP 판단
-    kept_docs = []
 
-    for doc in found_docs:
-        decision = mini_chain.invoke({'question': question, 'doc': doc.page_content})
-        print(f'\n문서 내용: {doc.page_content}\n판단: {decision}')
+# Self_check_retriver 함수 (LLM이 검색된 문서들을 보고 KEEP/DROP 판단)
+def self_check_retriver(found_docs, question, llm, mode="single_call", timeout=20, max_concurrency=5):
+    '''
+    이 함수는 사용자의 질문을 받아 검색된 문서들을 LLM이 검토하게 합니다. 
+    LLM은 각 문서가 질문에 도움이 되는지 판단해 KEEP/DROP을 결정합니다. 
+    결과적으로 KEEP인 문서만 반환합니다.
 
-        if decision.strip().lower() == 'keep':
-            kept_docs.append(doc)
+    mode="single_call": 문서 전체를 한 번의 호출로 판단 (JSON으로 Keep할 문서 번호 반환)
+                        실패/타임아웃/형식 오류 시 "concurrent" 방식으로 다시 판단
+    mode="concurrent": 문서별 호출을 최대 max_concurrency개씩 동시에 실행 (타임아웃/오류 난 문서는 Keep)
+    timeout: 판단 단계 전체 제한 시간(초) - 일괄 판단 실패 후 문서별 판단은 남은 시간 안에서만 수행
+    '''
+    if not found_docs:
+        return found_docs
+
+    deadline = time.monotonic() + timeout
+    decisions = None
+    if mode == "single_call":
+        try:
+            decisions = _self_check_single_call(found_docs, question, llm, timeout)
+        except Exception as e:
+            print(f'일괄 판단 실패 ({type(e).__name__}), 문서별 판단으로 전환합니다.')
+    if decisions is None:
+        # 남은 시간 안에서만 문서별 판단 (시간이 다 됐으면 모든 문서 Keep)
+        decisions = _self_check_concurrent(found_docs, question, llm, max(0.0, deadline - time.monotonic()),
+                                           max_concurrency)
+
+    kept_docs = [doc for doc, keep in zip(found_docs, decisions) if keep]
 
     if len(kept_docs) == 0:
         print('모든 문서가 Drop되었습니다. 원래 검색된 문서들을 반환합니다.')
         kept_docs = found_docs  # 모든 문서가 Drop되면 원래 검색된 문서 반환
 
-    print(f'\n최종 선택된 문서 개수: {len(kept_docs)}')
+    print(f'\n최종 선택된 문서 개수: {len(kept_docs)} / {len(found_docs)}')
 
     return kept_docs
 
@@ -267,25 +376,27 @@ def self_check_retriver(found_docs, question, llm):
 # ---------------------------
 # 문서 포맷팅 함수
 # ---------------------------
+def source_info(metadata):
+    """데이터 유형에 따라 출처 정보 구성"""
+    if metadata.get("source_type") == "qa_data":
+        return f"상담기록 - {metadata.get('lifeCycle', '')}/{metadata.get('department', '')}/{metadata.get('disease', '')}"
+    info = f"서적 - {metadata.get('title', '')}"
+    if metadata.get('author'):
+        info += f" (저자: {metadata['author']})"
+    if metadata.get('page'):
+        info += f" p.{metadata['page']+1}"
+    return info
+
+
 def format_docs(kept_docs):
     """kEEP인 문서를 출처 정보와 함께 포맷팅"""
     formatted_docs = []
     for doc in kept_docs:
         metadata = doc.metadata
         
-        # 데이터 유형에 따라 출처 정보 구성
-        if metadata.get("source_type") == "qa_data":
-            source_info = f"상담기록 - {metadata.get('lifeCycle', '')}/{metadata.get('department', '')}/{metadata.get('disease', '')}"
-        else:
-            source_info = f"서적 - {metadata.get('title', '')}"
-            if metadata.get('author'):
-                source_info += f" (저자: {metadata['author']})"
-            if metadata.get('page'):
-                source_info += f" p.{metadata['page']+1}"
-        
         formatted_doc = f"""<document>
 <content>{doc.page_content}</content>
-<source_info>{source_info}</source_info>
+<source_info>{source_info(metadata)}</source_info>
 <data_type>{metadata.get('source_type', 'unknown')}</data_type>
 </document>"""
         
@@ -294,6 +405,19 @@ def format_docs(kept_docs):
     return "\n\n".join(formatted_docs)
 
 
+def retrieval_only_answer(docs, max_docs=3, max_chars=300):
+    """LLM 답변을 만들 시간이 없을 때 검색 문서 앞부분을 출처와 함께 보여주는 대체 답변"""
+    lines = ["답변 생성이 지연되어, 검색된 문서의 관련 내용을 먼저 안내해 드립니다.", ""]
+    for doc in docs[:max_docs]:
+        content = " ".join(doc.page_content.split())
+        if len(content) > max_chars:
+            content = content[:max_chars].rstrip() + "..."
+        lines.append(f"- {content}")
+        lines.append(f"  (출처: {source_info(doc.metadata)})")
+    lines += ["", "증상이 심하거나 계속되면 가까운 동물병원에 방문해 주세요."]
+    return "\n".join(lines)
+
+
 def filter_docs_by_response(docs, ai_response):
     """LLM 응답에서 실제로 사용된 문서만 필터링"""
     if not docs:
@@ -342,57 +466,20 @@ def filter_docs_by_response(docs, ai_response):
 # ---------------------------
 # 테스트 실행 (직접 실행 시에만)
 # ---------------------------
-'''
-벡터 DB 불러오기
-불러올때 생성시 임베딩 모델/컬렉션 이름과 동일해야 합니다!
-'''
-
-
-# embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-# bge_m3 임베딩 모델 로드
-embeddings = HuggingFaceEmbeddings(
-    model_name="BAAI/bge-m3",
-    model_kwargs={'device': 'cpu'},  # GPU 사용시 'cuda'로 변경
-    encode_kwargs={'normalize_embeddings': True}  # bge-m3는 정규화 권장
-)
-#벡터스토어 로드
-vectorstore = Chroma(
-# persist_directory=r"..\data\ChromaDB_openai", #DB 저장한 경로
-# collection_name="pet_health_qa_system",
-persist_directory=r"..\data\ChromaDB_bge_m3", #DB 저장한 경로
-collection_name="pet_health_qa_system_bge_m3",
-embedding_function=embeddings)
-print("벡터스토어가 성공적으로 로드되었습니다!")
-
-#컬렉션 확인
-client = chromadb.PersistentClient(path=r"..\data\ChromaDB_bge_m3")
-collections = client.list_collections()
-print("사용 가능한 컬렉션:", [c.name for c in collections])
-
-
-#문서 포맷팅 함수
-def format_docs(docs):
-    formatted_docs = []
-    for doc in docs:
-        metadata = doc.metadata
-        
-        # 데이터 유형에 따라 출처 정보 구성
-        if metadata.get("source_type") == "qa_data":
-            source_info = f"상담기록 - {metadata.get('lifeCycle', '')}/{metadata.get('department', '')}/{metadata.get('disease', '')}"
-        else:
-            # 수의학 서적의 경우
-            source_info = f"서적 - {metadata.get('title', '')}"
-            if metadata.get('author'):
-                source_info += f" (저자: {metadata['author']})"
-            if metadata.get('page'):
-                source_info += f" p.{metadata['page']+1}"
-        
-        formatted_doc = f"""<document>
-                            <content>{doc.page_content}</content>
-                            <source_info>{source_info}</source_info>
-                            <data_type>{metadata.get('source_type', 'unknown')}</data_type>
-                            </document>"""
-        
-        formatted_docs.append(formatted_doc)
-    
-    return "\n\n".join(formatted_docs)
+if __name__ == "__main__":
+    from rag_graph import build_rag_graph, run_rag_graph, format_timings
+
+    setup_langsmith()
+
+    # 벡터 DB 불러오기 (생성시 임베딩 모델/컬렉션 이름과 동일해야 합니다!)
+    rag_system = initialize_rag_system(vectorstore_path=r"..\data\ChromaDB_bge_m3",
+                                       collection_name="pet_health_qa_system_bge_m3")
+    warm_up(rag_system)
+
+    rag_graph = build_rag_graph(
+        rag_system['retriever'], rag_system['llm'], get_rag_prompt(), get_rewrite_prompt(), format_docs,
+        self_check=lambda docs, question: self_check_retriver(docs, question, rag_system['llm'])
+    )
+    result = run_rag_graph(rag_graph, "강아지 파보바이러스 증상은 무엇인가요?")
+    print(f"답변: {result['answer']}\n")
+    print(f"[파이프라인] {format_timings(result['timings'])}")
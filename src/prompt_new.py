@@ -5,26 +5,14 @@ import warnings
 warnings.filterwarnings("ignore")
 
 # LangChain 임포트
-from langchain_openai import ChatOpenAI
-from langchain_community.vectorstores import Chroma 
-import chromadb
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.documents import Document
-from langchain_community.retrievers import BM25Retriever
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from ensemble import EnsembleRetriever
+from retrievers import DenseRetriever, BM25BatchRetriever, load_documents_from_vectorstore
+# 임베딩 모델 / Chroma 클라이언트 / LLM은 prompt_module과 같은 공유 객체 사용
+from rag_components import get_chroma_client, get_llm, get_vectorstore, setup_langsmith
 
 load_dotenv()
-if not os.environ.get('OPENAI_API_KEY'):
-    raise ValueError('OPENAI_API_KEY 없음. .env 확인하세요')
-if not os.environ.get('LANGSMITH_API_KEY'):
-    raise ValueError('LANGSMITH_API_KEY 없음. env 확인하세요')
-
-os.environ["LANGSMITH_TRACING_V2"] = "true"
-os.environ["LANGSMITH_ENDPOINT"] = "https://api.smith.langchain.com"
-os.environ["LANGSMITH_PROJECT"] = "pet_rag"
-print("LangSmith 연결 완료")
 
 
 # ---------------------------
@@ -33,28 +21,16 @@ print("LangSmith 연결 완료")
 def initialize_rag_system(vectorstore_path=r"..\data\ChromaDB_bge_m3", collection_name="pet_health_qa_system_bge_m3"):
     """RAG 시스템 초기화 (벡터스토어, LLM, Retriever)"""
     
-    # 임베딩 모델 로드
-    embeddings = HuggingFaceEmbeddings(
-        model_name="BAAI/bge-m3",
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
-    
-    # 벡터스토어 로드
-    vectorstore = Chroma(
-        persist_directory=vectorstore_path,
-        collection_name=collection_name,
-        embedding_function=embeddings
-    )
-    print("벡터스토어가 성공적으로 로드되었습니다!")
+    # 벡터스토어 로드 (임베딩 모델 / Chroma 클라이언트는 프로세스 전체에서 1개만 생성해 공유)
+    vectorstore = get_vectorstore(vectorstore_path, collection_name)
+    embeddings = vectorstore.embeddings
     
     # 컬렉션 확인
-    client = chromadb.PersistentClient(path=vectorstore_path)
-    collections = client.list_collections()
+    collections = get_chroma_client(vectorstore_path).list_collections()
     print("사용 가능한 컬렉션:", [c.name for c in collections])
     
     # LLM 초기화
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+    llm = get_llm()
     
     # Retriever 생성 (유사도 + BM25 앙상블)
     retriever = get_retriever(vectorstore, k=5)
@@ -76,32 +52,11 @@ def get_retriever(vectorstore, k=5):
     # 기본 리트리버
     retriever = vectorstore.as_retriever(search_kwargs={"k": k}, search_type="similarity")
     
-    # BM25 리트리버 생성
-    collection = vectorstore._collection
-    doc_count = collection.count()
-    
-    if doc_count == 0:
-        raise ValueError("벡터스토어가 비어있습니다.")
-    
-    # ChromaDB에서 모든 문서 가져오기
-    all_data = collection.get(limit=doc_count)
-    
-    # Document 객체로 변환
-    bm25_docs = []
-    if all_data and 'ids' in all_data and len(all_data['ids']) > 0:
-        documents = all_data.get('documents', [])
-        metadatas = all_data.get('metadatas', [])
-        
-        for i, doc_id in enumerate(all_data['ids']):
-            page_content = documents[i] if i < len(documents) else ""
-            metadata = metadatas[i] if i < len(metadatas) else {}
-            bm25_docs.append(Document(page_content=page_content, metadata=metadata))
-    
-    if len(bm25_docs) == 0:
-        raise ValueError("벡터스토어에서 문서를 가져올 수 없습니다.")
+    # BM25 리트리버 생성 (ChromaDB에 저장된 모든 문서)
+    bm25_docs = load_documents_from_vectorstore(vectorstore)
     
     print(f"BM25 리트리버용 문서 {len(bm25_docs)}개 로드 완료")
-    retriever_bm25 = BM25Retriever.from_documents(bm25_docs)
+    retriever_bm25 = BM25BatchRetriever.from_documents(bm25_docs)
     
     # 앙상블 리트리버
     retriever_ensemble = EnsembleRetriever(
@@ -256,32 +211,6 @@ def filter_docs_by_response(docs, ai_response):
 
 
 
-'''
-벡터 DB 불러오기
-불러올때 생성시 임베딩 모델/컬렉션 이름과 동일해야 합니다!
-'''
-
-
-# embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-# bge_m3 임베딩 모델 로드
-embeddings = HuggingFaceEmbeddings(
-    model_name="BAAI/bge-m3",
-    model_kwargs={'device': 'cpu'},  # GPU 사용시 'cuda'로 변경
-    encode_kwargs={'normalize_embeddings': True}  # bge-m3는 정규화 권장
-)
-#벡터스토어 로드
-vectorstore = Chroma(
-# persist_directory=r"..\data\ChromaDB_openai", #DB 저장한 경로
-# collection_name="pet_health_qa_system",
-persist_directory=r"..\data\ChromaDB_bge_m3", #DB 저장한 경로
-collection_name="pet_health_qa_system_bge_m3",
-embedding_function=embeddings)
-print("벡터스토어가 성공적으로 로드되었습니다!")
-
-#컬렉션 확인
-client = chromadb.PersistentClient(path=r"..\data\ChromaDB_bge_m3")
-collections = client.list_collections()
-print("사용 가능한 컬렉션:", [c.name for c in collections])
 
 
 #프롬포트 템플릿 생성
@@ -378,90 +307,95 @@ def format_docs(docs):
 
 
 
-# 예시 질문으로 프롬포트 성능 테스트
-# 1. 무조건 대답해야만 하는거 , 애매한거, 대답 절대 못해야되는거
-query = [
-    "강아지 파보바이러스 증상은 무엇인가요?",
-    "자견 시기 예방접종 스케줄을 알려주세요",
-    # "강아지 슬개골 탈구 치료 방법은 무엇인가요?",
-    "노령견이 신부전 진단을 받았는데, 식이관리와 약물치료를 병행해야 하나요?",
-    "성견의 피부 알레르기와 외이염이 동시에 있을 때 치료 순서는 어떻게 되나요?",
-    # "자견이 설사와 구토를 동시에 하는데 응급상황인지 알려주세요",
-    # "10살 된 노령견이 갑자기 밥을 안 먹고 기력이 없는데, 어떤 질환을 의심해야 하나요?",
-    "중성화 수술 후 체중이 늘어난 성견의 적절한 운동량과 식이량은 어떻게 조절해야 하나요?",
-    "강아지 암 예방을 위한 백신이 있나요?",
-    "강아지가 초콜릿을 먹었을 때 어떤 약을 먹이면 되나요?"
-]
-
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-#기본 리트리버 
-# retriever = vectorstore.as_retriever(search_kwargs={"k": 5}, search_type="similarity") #리트리버 변경 가능
-
-#리트리버 성능 test
-retriever = vectorstore.as_retriever(search_kwargs={"k": 5}, search_type="similarity") #리트리버 변경 가능
-# retriever_mmr = vectorstore.as_retriever(
-#     search_type="mmr",
-#     search_kwargs={
-#         "k": 5,              # 최종 반환 문서 수
-#         "fetch_k": 20,       # 초기 검색 문서 수 (많을수록 다양한 후보 확보)
-#         "lambda_mult": 0.7   # 0~1 사이 값 (1에 가까울수록 유사도 우선, 0에 가까울수록 다양성 우선)
-#     }
-# )
-# BM25 리트리버 생성 (벡터스토어에서 문서 추출 필요)
-# ChromaDB에서 모든 문서를 직접 가져오기
-collection = vectorstore._collection
-doc_count = collection.count()
-print(f"벡터스토어 총 문서 수: {doc_count}개")
-
-if doc_count == 0:
-    raise ValueError("벡터스토어가 비어있습니다. 먼저 문서를 추가해주세요.")
-
-# ChromaDB의 get() 메서드를 사용하여 모든 문서 가져오기
-all_data = collection.get(limit=doc_count)
-
-# Document 객체로 변환
-bm25_docs = []
-if all_data and 'ids' in all_data and len(all_data['ids']) > 0:
-    documents = all_data.get('documents', [])
-    metadatas = all_data.get('metadatas', [])
-    
-    for i, doc_id in enumerate(all_data['ids']):
-        page_content = documents[i] if i < len(documents) else ""
-        metadata = metadatas[i] if i < len(metadatas) else {}
-        bm25_docs.append(Document(page_content=page_content, metadata=metadata))
-
-if len(bm25_docs) == 0:
-    raise ValueError("벡터스토어에서 문서를 가져올 수 없습니다.")
-
-print(f"BM25 리트리버용 문서 {len(bm25_docs)}개 로드 완료")
-retriever_bm25 = BM25Retriever.from_documents(bm25_docs) 
-# 앙상블 리트리버
-retriever_ensemble = EnsembleRetriever(
-    retrievers=[retriever, retriever_bm25],
-    weights=[0.5, 0.5]  # 가중치 합은 1이어야 합니다.
-) 
-retriever_dict = {
-    # "유사도 검색(Similarity Search)": retriever,
-    # "MMR 검색(MMR Search)": retriever_mmr,
-    # "BM25 검색(BM25 Search)": retriever_bm25,
-    "앙상블 검색(Ensemble Search)": retriever_ensemble
-}
-
-
-rewrite_chain =  rewrite_prompt | llm | StrOutputParser()
-rag_chain = prompt | llm | StrOutputParser()
-
-for name, retriever in retriever_dict.items():
-    print(f"=== {name} 결과 ===")
-
-    for q in query:
-        docs = retriever.invoke(q)
-        context = format_docs(docs)
-        transformed = rewrite_chain.invoke({'question' : q}) #rewrite_chain의 출력(question 키워드)을 transformed에 저장
-        generation = rag_chain.invoke({"context": context, "question": transformed})
-        print("-"*30)
-        print(f'원본 query : {q}\n')
-        print(f'transformed query (핵심 키워드 추출) : {transformed}\n')
-        print(f"답변: {generation}\n")
-
-# 
\ No newline at end of file
+# 직접 실행할 때만 모델/벡터스토어를 로드하고 테스트 질문을 실행 (import 시에는 아무것도 실행하지 않음)
+if __name__ == "__main__":
+    if not os.environ.get('OPENAI_API_KEY'):
+        raise ValueError('OPENAI_API_KEY 없음. .env 확인하세요')
+    setup_langsmith()
+
+    # 벡터 DB 불러오기
+    # 불러올때 생성시 임베딩 모델/컬렉션 이름과 동일해야 합니다!
+
+
+    # 벡터스토어 로드 (공유 임베딩 모델 + 공유 Chroma 클라이언트)
+    VECTORSTORE_PATH, COLLECTION_NAME = r"..\data\ChromaDB_bge_m3", "pet_health_qa_system_bge_m3"
+    vectorstore = get_vectorstore(VECTORSTORE_PATH, COLLECTION_NAME)
+
+    #컬렉션 확인
+    collections = get_chroma_client(VECTORSTORE_PATH).list_collections()
+    print("사용 가능한 컬렉션:", [c.name for c in collections])
+
+
+    # 예시 질문으로 프롬포트 성능 테스트
+    # 1. 무조건 대답해야만 하는거 , 애매한거, 대답 절대 못해야되는거
+    query = [
+        "강아지 파보바이러스 증상은 무엇인가요?",
+        "자견 시기 예방접종 스케줄을 알려주세요",
+        # "강아지 슬개골 탈구 치료 방법은 무엇인가요?",
+        "노령견이 신부전 진단을 받았는데, 식이관리와 약물치료를 병행해야 하나요?",
+        "성견의 피부 알레르기와 외이염이 동시에 있을 때 치료 순서는 어떻게 되나요?",
+        # "자견이 설사와 구토를 동시에 하는데 응급상황인지 알려주세요",
+        # "10살 된 노령견이 갑자기 밥을 안 먹고 기력이 없는데, 어떤 질환을 의심해야 하나요?",
+        "중성화 수술 후 체중이 늘어난 성견의 적절한 운동량과 식이량은 어떻게 조절해야 하나요?",
+        "강아지 암 예방을 위한 백신이 있나요?",
+        "강아지가 초콜릿을 먹었을 때 어떤 약을 먹이면 되나요?"
+    ]
+
+    llm = get_llm()
+    #기본 리트리버 
+    # retriever = vectorstore.as_retriever(search_kwargs={"k": 5}, search_type="similarity") #리트리버 변경 가능
+
+    #리트리버 성능 test
+    retriever = DenseRetriever(vectorstore, k=5) #리트리버 변경 가능 (batch 검색 지원)
+    # retriever_mmr = vectorstore.as_retriever(
+    #     search_type="mmr",
+    #     search_kwargs={
+    #         "k": 5,              # 최종 반환 문서 수
+    #         "fetch_k": 20,       # 초기 검색 문서 수 (많을수록 다양한 후보 확보)
+    #         "lambda_mult": 0.7   # 0~1 사이 값 (1에 가까울수록 유사도 우선, 0에 가까울수록 다양성 우선)
+    #     }
+    # )
+    # BM25 리트리버 생성 (벡터스토어에서 문서 추출 필요)
+    # ChromaDB에서 모든 문서를 직접 가져오기
+    doc_count = vectorstore._collection.count()
+    print(f"벡터스토어 총 문서 수: {doc_count}개")
+
+    if doc_count == 0:
+        raise ValueError("벡터스토어가 비어있습니다. 먼저 문서를 추가해주세요.")
+
+    bm25_docs = load_documents_from_vectorstore(vectorstore)
+
+    print(f"BM25 리트리버용 문서 {len(bm25_docs)}개 로드 완료")
+    retriever_bm25 = BM25BatchRetriever.from_documents(bm25_docs) 
+    # 앙상블 리트리버
+    retriever_ensemble = EnsembleRetriever(
+        retrievers=[retriever, retriever_bm25],
+        weights=[0.5, 0.5]  # 가중치 합은 1이어야 합니다.
+    ) 
+    retriever_dict = {
+        # "유사도 검색(Similarity Search)": retriever,
+        # "MMR 검색(MMR Search)": retriever_mmr,
+        # "BM25 검색(BM25 Search)": retriever_bm25,
+        "앙상블 검색(Ensemble Search)": retriever_ensemble
+    }
+
+
+    rewrite_chain =  rewrite_prompt | llm | StrOutputParser()
+    rag_chain = prompt | llm | StrOutputParser()
+
+    for name, retriever in retriever_dict.items():
+        print(f"=== {name} 결과 ===")
+
+        # 질문 전체를 한 번에 검색 (임베딩 1회 + 검색 1회)
+        docs_list = retriever.batch(query)
+
+        for q, docs in zip(query, docs_list):
+            context = format_docs(docs)
+            transformed = rewrite_chain.invoke({'question' : q}) #rewrite_chain의 출력(question 키워드)을 transformed에 저장
+            generation = rag_chain.invoke({"context": context, "question": transformed})
+            print("-"*30)
+            print(f'원본 query : {q}\n')
+            print(f'transformed query (핵심 키워드 추출) : {transformed}\n')
+            print(f"답변: {generation}\n")
+
+    # 
\ No newline at end of file
@@ -0,0 +1,169 @@
+'''
+질문 임베딩 마이크로 배칭 (서빙 프로세스용)
+동시에 들어온 질문을 요청마다 따로 BGE-M3 1개짜리 배치로 인코딩하지 않고,
+몇 ms 안에 도착한 질문들을 모아 한 번의 forward로 인코딩한 뒤 요청별 Future로 돌려줍니다.
+- max_batch_size: 한 번에 인코딩할 최대 질문 수
+- max_wait_ms: 첫 질문이 도착한 뒤 다른 질문을 기다리는 최대 시간 (요청당 추가 대기 상한)
+- 같은 배치 안의 같은 질문은 1번만 인코딩
+- 계측(instrumentation.py): query_batch_wait(대기 시간) / query_batch_encode(배치 인코딩 시간) 히스토그램,
+  query_batch_queries / query_batches 카운터 -> /metrics 에서 처리량과 평균 배치 크기 계산 가능
+
+CachedEmbeddings 안쪽 모델을 감싸므로 캐시에 없는 질문만 배칭됩니다. (enable_query_batching)
+'''
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from cache_utils import CacheStats
+from instrumentation import METRICS
+
+
+class _Pending:
+    __slots__ = ("text", "future", "submitted")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.future: Future = Future()
+        self.submitted = time.perf_counter()
+
+
+class MicroBatchEncoder(Embeddings):
+    """질문 인코딩 요청을 모아서 배치로 처리하는 Embeddings 래퍼 (워커 스레드 1개)"""
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = CacheStats("batches", "queries", "encoded")
+        self._queue: "queue.Queue[Optional[_Pending]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._encode_seconds = 0.0
+        self._wait_seconds = 0.0
+
+    # ---------------------------
+    # 요청 쪽 (여러 스레드에서 호출)
+    # ---------------------------
+    def submit(self, texts: List[str]) -> List[Future]:
+        """질문들을 큐에 넣고 질문별 Future 반환 (결과: 임베딩 벡터)"""
+        self._ensure_worker()
+        pending = [_Pending(text) for text in texts]
+        for item in pending:
+            self._queue.put(item)
+        return [item.future for item in pending]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return [future.result() for future in self.submit(texts)]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # 문서 인코딩(인덱싱, 압축용 문장)은 이미 배치이므로 그대로 전달
+        return self.embeddings.embed_documents(texts)
+
+    # ---------------------------
+    # 워커 스레드
+    # ---------------------------
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect(self, first: _Pending) -> List[_Pending]:
+        """첫 질문 도착 후 max_wait 안에 들어온 질문을 max_batch_size개까지 모음"""
+        batch = [first]
+        deadline = first.submitted + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # 종료 신호는 이번 배치를 처리한 뒤 다시 받도록 되돌려 놓음
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            self._encode(self._collect(first))
+
+    def _encode(self, batch: List[_Pending]):
+        started = time.perf_counter()
+        texts = list(dict.fromkeys(item.text for item in batch))
+        try:
+            if len(texts) == 1:
+                vectors = [self.embeddings.embed_query(texts[0])]
+            else:
+                vectors = self.embeddings.embed_documents(texts)
+        except Exception as e:
+            for item in batch:
+                item.future.set_exception(e)
+            return
+        encode_seconds = time.perf_counter() - started
+
+        by_text = {text: list(vector) for text, vector in zip(texts, vectors)}
+        wait_total = 0.0
+        for item in batch:
+            wait = started - item.submitted
+            wait_total += wait
+            METRICS.observe("query_batch_wait", wait)
+            item.future.set_result(by_text[item.text])
+
+        METRICS.observe("query_batch_encode", encode_seconds)
+        METRICS.incr("query_batches")
+        METRICS.incr("query_batch_queries", len(batch))
+        self.stats.incr("batches")
+        self.stats.incr("queries", len(batch))
+        self.stats.incr("encoded", len(texts))
+        with self._lock:
+            self._encode_seconds += encode_seconds
+            self._wait_seconds += wait_total
+
+    def close(self):
+        """워커 종료 (큐에 남은 질문은 처리한 뒤 종료)"""
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+
+    def metrics(self) -> dict:
+        """배치 수 / 평균 배치 크기 / 인코딩 처리량(질문/초) / 평균 추가 대기(ms)"""
+        counts = self.stats.as_dict()
+        with self._lock:
+            encode_seconds, wait_seconds = self._encode_seconds, self._wait_seconds
+        return {
+            **counts,
+            "mean_batch_size": counts["queries"] / counts["batches"] if counts["batches"] else 0.0,
+            "queries_per_second": counts["queries"] / encode_seconds if encode_seconds else 0.0,
+            "mean_wait_ms": wait_seconds / counts["queries"] * 1000 if counts["queries"] else 0.0,
+        }
+
+
+def enable_query_batching(embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0) -> MicroBatchEncoder:
+    """
+    initialize_rag_system()의 embeddings(CachedEmbeddings)의 안쪽 모델을 MicroBatchEncoder로 교체
+    (벡터스토어/리트리버가 같은 객체를 공유하므로 모든 검색 경로에 적용, 이미 적용되어 있으면 그대로 반환)
+    """
+    inner = getattr(embeddings, "embeddings", None)
+    if isinstance(inner, MicroBatchEncoder):
+        return inner
+    if inner is None:
+        raise ValueError("질문 임베딩 캐시(CachedEmbeddings)로 감싼 embeddings가 필요합니다.")
+    encoder = MicroBatchEncoder(inner, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    embeddings.embeddings = encoder
+    return encoder
@@ -0,0 +1,134 @@
+'''
+RAG 구성 요소 지연 로딩 팩토리
+- import만으로는 모델/DB/환경변수를 건드리지 않습니다. (무거운 라이브러리도 함수 안에서 import)
+- 같은 인자로 다시 호출하면 처음 만든 객체를 그대로 반환합니다.
+  (BGE-M3 임베딩 모델 1개, 벡터스토어 경로별 Chroma 클라이언트 1개를 프로세스 전체에서 공유)
+- LangSmith 추적은 setup_langsmith()를 명시적으로 호출했을 때만 켜집니다.
+- get_llm()은 LLM 응답 영구 캐시(llm_cache.py)를 함께 등록합니다.
+- warm_up(): 앱 시작 시 모델 로드/첫 인코딩/첫 검색을 미리 실행해 첫 질문 지연을 줄입니다.
+'''
+
+import os
+import time
+from functools import lru_cache
+from typing import Dict, Optional
+
+EMBEDDING_MODEL_NAME = "BAAI/bge-m3"
+LLM_MODEL_NAME = "gpt-4o-mini"
+
+
+def setup_langsmith(project: str = "pet_rag") -> bool:
+    """LangSmith 추적 켜기 (LANGSMITH_API_KEY가 있을 때만). 켜졌으면 True"""
+    if not os.environ.get('LANGSMITH_API_KEY'):
+        print("LANGSMITH_API_KEY가 없어 LangSmith 추적 없이 실행합니다.")
+        return False
+
+    os.environ["LANGSMITH_TRACING_V2"] = "true"
+    os.environ["LANGSMITH_ENDPOINT"] = "https://api.smith.langchain.com"
+    os.environ["LANGSMITH_PROJECT"] = project
+    print("LangSmith 연결 완료")
+    return True
+
+
+def default_embedding_cache_path(vectorstore_path: str) -> str:
+    """질문 임베딩 영구 캐시 기본 경로 (벡터스토어 옆 cache 폴더)"""
+    return os.path.join(os.path.dirname(os.path.abspath(vectorstore_path)), "cache", "query_embeddings.sqlite")
+
+
+def default_rewrite_cache_path(vectorstore_path: str) -> str:
+    """질문 변환 결과 영구 캐시 기본 경로 (평가 스크립트와 같은 파일 공유)"""
+    return os.path.join(os.path.dirname(os.path.abspath(vectorstore_path)), "cache", "rewrites.sqlite")
+
+
+@lru_cache(maxsize=None)
+def get_base_embeddings(model_name: str = EMBEDDING_MODEL_NAME):
+    """임베딩 모델 (프로세스 전체에서 1개만 로드)"""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+
+
+@lru_cache(maxsize=None)
+def get_embeddings(persist_path: Optional[str] = None, model_name: str = EMBEDDING_MODEL_NAME):
+    """질문 임베딩 캐시를 씌운 임베딩 (persist_path가 None이면 메모리 캐시만)"""
+    from embedding_cache import CachedEmbeddings
+
+    return CachedEmbeddings(get_base_embeddings(model_name), persist_path=persist_path)
+
+
+@lru_cache(maxsize=None)
+def _chroma_client(path: str):
+    import chromadb
+
+    return chromadb.PersistentClient(path=path)
+
+
+def get_chroma_client(vectorstore_path: str):
+    """벡터스토어 경로별 Chroma 클라이언트 (같은 경로는 1개만 생성)"""
+    return _chroma_client(os.path.abspath(vectorstore_path))
+
+
+@lru_cache(maxsize=None)
+def _vectorstore(path: str, collection_name: str, embedding_cache_path: Optional[str]):
+    from langchain_community.vectorstores import Chroma
+
+    vectorstore = Chroma(
+        client=get_chroma_client(path),
+        collection_name=collection_name,
+        embedding_function=get_embeddings(embedding_cache_path)
+    )
+    print("벡터스토어가 성공적으로 로드되었습니다!")
+    return vectorstore
+
+
+def get_vectorstore(vectorstore_path: str, collection_name: str, embedding_cache_path: Optional[str] = None):
+    """벡터스토어 (공유 Chroma 클라이언트 + 공유 임베딩 모델 사용)"""
+    return _vectorstore(os.path.abspath(vectorstore_path), collection_name, embedding_cache_path)
+
+
+@lru_cache(maxsize=None)
+def get_llm(model: str = LLM_MODEL_NAME, temperature: float = 0):
+    """ChatOpenAI (처음 사용할 때 API 키 확인, LLM 응답 영구 캐시 등록, 프로세스 공용 호출 조절기 적용)"""
+    if not os.environ.get('OPENAI_API_KEY'):
+        raise ValueError('OPENAI_API_KEY 없음. .env 확인하세요')
+    from instrumentation import TOKEN_USAGE_HANDLER
+    from llm_cache import enable_llm_cache
+    from llm_governor import GovernedChatOpenAI
+
+    enable_llm_cache()
+
+    # 토큰 사용량은 로컬 계측(instrumentation.py)에 기록 (스트리밍 호출도 usage 포함)
+    # 동시 호출 수 / 분당 예산 / 429 재시도는 llm_governor.py (답변 생성은 self-check / rewrite보다 먼저)
+    return GovernedChatOpenAI(model=model, temperature=temperature, stream_usage=True,
+                              callbacks=[TOKEN_USAGE_HANDLER])
+
+
+def warm_up(rag_system: dict, question: str = "강아지가 구토를 해요") -> Dict[str, float]:
+    """
+    첫 질문 전에 임베딩 모델 첫 인코딩 / Chroma 인덱스 로드 / BM25 검색을 미리 실행
+    반환: 단계별 소요 시간(초)
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    # 캐시를 거치지 않고 모델을 직접 호출해야 실제 첫 인코딩 비용을 치를 수 있음
+    embeddings = rag_system['embeddings']
+    getattr(embeddings, "embeddings", embeddings).embed_query(question)
+    timings["embedding"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rag_system['retriever'].invoke(question)
+    timings["retrieval"] = time.perf_counter() - start
+
+    print("워밍업 완료: " + " / ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    return timings
+
+
+def clear_components():
+    """팩토리 캐시 초기화 (테스트/벤치마크에서 콜드 스타트를 다시 측정할 때)"""
+    for factory in (get_base_embeddings, get_embeddings, _chroma_client, _vectorstore, get_llm):
+        factory.cache_clear()
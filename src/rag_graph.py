@@ -0,0 +1,278 @@
+'''
+질문 처리 파이프라인 (LangGraph)
+
+    START ─┬─> retrieve (검색 + self-check) ─┬─> generate ─> END
+           └─> rewrite  (질문 변환) ──────────┘
+
+- rewrite는 원본 질문만 필요하므로 retrieve(검색 + self-check)와 동시에 실행됩니다.
+- 조건부 생략: 입력에 docs가 있으면 검색 생략, skip_rewrite면 질문 변환 생략(원본 질문 사용),
+  skip_self_check이거나 self_check 함수가 없으면 문서 검증 생략. 생략된 단계는 state["skipped"]에 기록됩니다.
+- skip_generate면 context까지만 만들고 답변 생성은 생략합니다. (Streamlit에서 토큰 스트리밍으로 직접 생성할 때)
+- 단계별 소요 시간(초)은 state["timings"]에 기록되고, instrumentation.py 히스토그램에도 집계됩니다.
+  (retrieve / self_check / stitch / compress / rewrite / generate / total)
+- stitch를 주면 self-check 뒤에 같은 레코드의 인접 청크를 합칩니다. (chunk_stitching.py, 겹친 내용 제거)
+- compress를 주면 그 뒤에 문장 단위 추출 압축을 하고 압축률 등을 state["compression_stats"]에 기록합니다.
+- rewrite_cache를 주면 같은 질문의 변환 결과를 재사용합니다. (rewrite_cache.py)
+- context_builder를 주면 토큰 예산 안에서 context를 만들고, 사용한 토큰 수 등은 state["context_stats"]에 기록됩니다.
+- 입력에 deadline(deadline.Deadline)을 주면 남은 시간에 따라 단계를 줄입니다. (deadline.DegradationPolicy)
+  self-check / rewrite 생략 또는 제한 시간 초과 시 결과 없이 진행, context 축소, 생성 생략/초과 시 fallback_answer
+  (캐시 답변 / 검색 문서 답변). 적용한 항목은 state["degraded"]와 계측(record_degradation)에 기록됩니다.
+
+프롬프트, 문서 포맷팅, 문서 검증 함수는 호출하는 쪽(Streamlit 앱, 평가 스크립트)에서 주입합니다.
+'''
+
+import operator
+import time
+from typing import Annotated, Callable, List, Optional, TypedDict
+
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+from langgraph.graph import StateGraph, START, END
+
+from deadline import Deadline, DeadlineExceeded, DegradationPolicy, call_with_timeout
+from instrumentation import record_degradation, stage, trace_request
+
+NO_DOCS_ANSWER = "죄송합니다. 관련된 정보를 찾을 수 없습니다. 더 구체적으로 설명해주시겠어요?"
+
+
+class RAGState(TypedDict, total=False):
+    # 입력
+    question: str
+    filters: Optional[dict]
+    skip_self_check: bool
+    skip_rewrite: bool
+    skip_generate: bool
+    deadline: Optional[float]  # 마감 시각 (time.monotonic 기준, Deadline.expires_at)
+    # 중간 결과 / 출력 (docs를 입력으로 주면 검색 생략)
+    docs: List[Document]
+    transformed: str
+    context: str
+    context_stats: dict
+    compression_stats: dict
+    answer: str
+    # 병렬 노드가 동시에 기록하므로 reducer로 합침
+    timings: Annotated[dict, operator.or_]
+    skipped: Annotated[list, operator.add]
+    degraded: Annotated[list, operator.add]
+
+
+def _deadline_of(state: RAGState) -> Optional[Deadline]:
+    expires_at = state.get("deadline")
+    return Deadline.at(expires_at) if expires_at is not None else None
+
+
+def _degrade(degraded: list, name: str):
+    degraded.append(name)
+    record_degradation(name)
+
+
+def build_rag_graph(retriever, llm, rag_prompt, rewrite_prompt, format_docs: Callable[[List[Document]], str],
+                    self_check: Optional[Callable[[List[Document], str], List[Document]]] = None,
+                    stitch: Optional[Callable[[List[Document]], List[Document]]] = None,
+                    compress: Optional[Callable[[List[Document], str], tuple]] = None,
+                    context_builder=None, rewrite_cache=None, policy: Optional[DegradationPolicy] = None,
+                    fallback_answer: Optional[Callable[[str, List[Document]], tuple]] = None):
+    """
+    질문 처리 그래프 생성 (compile된 그래프 반환, invoke/batch/stream 사용 가능)
+    self_check: (docs, question) -> 남길 문서. None이면 문서 검증 없이 검색 결과 그대로 사용
+    stitch: docs -> 인접 청크를 합친 docs (예: chunk_stitching.stitch_chunks). None이면 생략
+    compress: (docs, question) -> (압축된 docs, 통계) (예: SentenceCompressor.compress). None이면 생략
+    context_builder: ContextBuilder (context_builder.py). None이면 format_docs로 모든 문서를 그대로 사용
+    rewrite_cache: RewriteCache (rewrite_cache.py). None이면 매번 rewrite 호출
+    policy: 마감 시간이 있을 때의 단계 생략 기준 (None이면 DegradationPolicy 기본값)
+    fallback_answer: (question, docs) -> (대체 답변, 종류) - 생성할 시간이 없을 때 사용.
+                     None이면 DeadlineExceeded를 그대로 전달
+    """
+    policy = policy or DegradationPolicy()
+    rewrite_chain = rewrite_prompt | llm | StrOutputParser()
+    rag_chain = rag_prompt | llm | StrOutputParser()
+
+    def fallback(question: str, docs: List[Document], degraded: list) -> str:
+        if fallback_answer is None:
+            raise DeadlineExceeded("답변을 생성할 시간이 없습니다.")
+        answer, kind = fallback_answer(question, docs)
+        _degrade(degraded, kind)
+        return answer
+
+    def retrieve(state: RAGState) -> dict:
+        timings, skipped, degraded = {}, [], []
+        deadline = _deadline_of(state)
+        docs = state.get("docs")
+
+        if docs is None:
+            filters = state.get("filters")
+            with stage("retrieve") as timer:
+                # 필터가 없을 때는 filters 인자를 받지 않는 LangChain 리트리버도 쓸 수 있도록 그대로 invoke
+                docs = retriever.invoke(state["question"], filters=filters) if filters else retriever.invoke(state["question"])
+            timings["retrieve"] = timer.seconds
+        else:
+            skipped.append("retrieve")
+
+        if self_check is None or state.get("skip_self_check") or not docs:
+            skipped.append("self_check")
+        elif deadline is not None and policy.optional_budget(deadline) < policy.self_check_min:
+            # 생성에 쓸 시간을 남기기 위해 문서 검증 생략
+            skipped.append("self_check")
+            _degrade(degraded, "self_check_skipped")
+        else:
+            with stage("self_check") as timer:
+                if deadline is None:
+                    docs = self_check(docs, state["question"])
+                else:
+                    try:
+                        docs = call_with_timeout(self_check, policy.optional_budget(deadline), docs, state["question"])
+                    except DeadlineExceeded:
+                        # 검증하지 않은 검색 결과를 그대로 사용
+                        _degrade(degraded, "self_check_timeout")
+            timings["self_check"] = timer.seconds
+
+        if stitch is not None and docs:
+            with stage("stitch") as timer:
+                docs = stitch(docs)
+            timings["stitch"] = timer.seconds
+
+        update = {}
+        if compress is not None and docs:
+            with stage("compress") as timer:
+                docs, update["compression_stats"] = compress(docs, state["question"])
+            timings["compress"] = timer.seconds
+
+        return {**update, "docs": docs, "timings": timings, "skipped": skipped, "degraded": degraded}
+
+    def rewrite(state: RAGState) -> dict:
+        question = state["question"]
+        deadline = _deadline_of(state)
+        degraded = []
+        with stage("rewrite") as timer:
+            transformed = rewrite_cache.get(question) if rewrite_cache is not None else None
+            if transformed is None:
+                if deadline is None:
+                    transformed = rewrite_chain.invoke({"question": question})
+                elif policy.optional_budget(deadline) < policy.rewrite_min:
+                    _degrade(degraded, "rewrite_skipped")
+                else:
+                    try:
+                        transformed = call_with_timeout(rewrite_chain.invoke, policy.optional_budget(deadline),
+                                                        {"question": question})
+                    except DeadlineExceeded:
+                        _degrade(degraded, "rewrite_timeout")
+                if transformed is not None and rewrite_cache is not None:
+                    rewrite_cache.put(question, transformed)
+
+        update = {"timings": {"rewrite": timer.seconds}, "degraded": degraded}
+        if transformed is None:
+            # 원본 질문으로 생성
+            return {**update, "skipped": ["rewrite"]}
+        return {**update, "transformed": transformed}
+
+    def generate(state: RAGState) -> dict:
+        docs = state.get("docs") or []
+        if not docs:
+            return {"context": "", "answer": NO_DOCS_ANSWER, "skipped": ["generate"]}
+
+        start = time.perf_counter()
+        deadline = _deadline_of(state)
+        degraded = []
+        update = {"degraded": degraded}
+
+        # 남은 시간이 적으면 context를 줄여 생성 시간 단축
+        reduce = deadline is not None and deadline.remaining() < policy.reduce_context_below
+        if reduce:
+            _degrade(degraded, "context_reduced")
+        if context_builder is None:
+            context = format_docs(docs[:max(1, int(len(docs) * policy.reduced_context_ratio))] if reduce else docs)
+        else:
+            budget = int(context_builder.max_tokens * policy.reduced_context_ratio) if reduce else None
+            context, _, update["context_stats"] = context_builder.build(docs, max_tokens=budget)
+        update["context"] = context
+
+        if deadline is not None and deadline.remaining() < policy.generate_min:
+            # LLM을 부를 시간이 없으면 대체 답변
+            answer = fallback(state["question"], docs, degraded)
+            return {**update, "answer": answer, "skipped": ["generate"]}
+        if state.get("skip_generate"):
+            return {**update, "skipped": ["generate"]}
+
+        question = state.get("transformed") or state["question"]
+        inputs = {"context": context, "question": question}
+        with stage("generate"):
+            if deadline is None:
+                answer = rag_chain.invoke(inputs)
+            else:
+                try:
+                    answer = call_with_timeout(rag_chain.invoke, deadline.remaining(), inputs)
+                except DeadlineExceeded:
+                    _degrade(degraded, "generate_timeout")
+                    answer = fallback(state["question"], docs, degraded)
+        return {**update, "answer": answer, "timings": {"generate": time.perf_counter() - start}}
+
+    def route_start(state: RAGState) -> List[str]:
+        """START에서 동시에 실행할 노드 (생략할 단계는 빼고 라우팅)"""
+        # retrieve는 검색/검증 생략 여부를 직접 기록하므로 항상 실행
+        if state.get("skip_rewrite"):
+            return ["retrieve"]
+        return ["retrieve", "rewrite"]
+
+    graph = StateGraph(RAGState)
+    graph.add_node("retrieve", retrieve)
+    graph.add_node("rewrite", rewrite)
+    graph.add_node("generate", generate)
+
+    graph.add_conditional_edges(START, route_start, ["retrieve", "rewrite"])
+    # retrieve/rewrite는 같은 단계에서 실행되므로 generate는 두 노드가 모두 끝난 뒤 한 번만 실행됨
+    graph.add_edge("retrieve", "generate")
+    graph.add_edge("rewrite", "generate")
+    graph.add_edge("generate", END)
+    return graph.compile()
+
+
+def _initial_state(question: str, filters=None, docs=None, skip_self_check=False, skip_rewrite=False,
+                   skip_generate=False, deadline: Optional[Deadline] = None) -> RAGState:
+    state: RAGState = {
+        "question": question,
+        "filters": filters,
+        "skip_self_check": skip_self_check,
+        "skip_rewrite": skip_rewrite,
+        "skip_generate": skip_generate,
+        "deadline": deadline.expires_at if deadline is not None else None,
+        "timings": {},
+        "skipped": [],
+        "degraded": [],
+    }
+    if docs is not None:
+        state["docs"] = docs
+    if skip_rewrite:
+        state["skipped"] = ["rewrite"]
+    return state
+
+
+def run_rag_graph(graph, question: str, filters: Optional[dict] = None, docs: Optional[List[Document]] = None,
+                  skip_self_check: bool = False, skip_rewrite: bool = False, skip_generate: bool = False,
+                  deadline: Optional[Deadline] = None) -> RAGState:
+    """
+    질문 하나 실행 -> 최종 state (answer, docs, transformed, context, timings, skipped, degraded)
+    deadline: 요청 마감 시간 (주면 남은 시간에 따라 단계 생략 / 대체 답변)
+    """
+    start = time.perf_counter()
+    # 바깥에서 trace_request로 감싸지 않았으면 여기서 질문 1개 단위로 계측
+    with trace_request(question):
+        result = graph.invoke(_initial_state(question, filters, docs, skip_self_check, skip_rewrite, skip_generate,
+                                             deadline))
+    result["timings"]["total"] = time.perf_counter() - start
+    return result
+
+
+def run_rag_graph_batch(graph, questions: List[str], docs_list: Optional[List[List[Document]]] = None,
+                        max_concurrency: int = 4, **kwargs) -> List[RAGState]:
+    """
+    여러 질문을 최대 max_concurrency개씩 동시에 실행 (평가 스크립트용)
+    docs_list: 질문별로 미리 검색한 문서 (retriever.batch 결과) - 주면 검색 단계 생략
+    """
+    docs_list = docs_list if docs_list is not None else [None] * len(questions)
+    inputs = [_initial_state(q, docs=docs, **kwargs) for q, docs in zip(questions, docs_list)]
+    return graph.batch(inputs, config={"max_concurrency": max_concurrency})
+
+
+def format_timings(timings: dict) -> str:
+    """단계별 소요 시간 로그 문자열"""
+    return " / ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
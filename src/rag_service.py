@@ -0,0 +1,206 @@
+'''
+서비스용 질문 처리 그래프 구성 (Streamlit 앱과 HTTP API가 같은 설정을 공유)
+.env 설정:
+- SELF_CHECK_BACKEND: 문서 검증 방식 "llm" (gpt-4o-mini Keep/Drop) 또는 "reranker" (로컬 cross-encoder)
+- RERANKER_ONNX: 1이면 리랭커 ONNX 백엔드
+- CONTEXT_TOKEN_BUDGET: LLM에 넣는 context 토큰 예산 (0이면 제한 없이 모든 문서 사용)
+- STITCH_CHUNKS: 같은 레코드의 인접 청크 합치기 (겹친 내용 제거, 사이에 빠진 청크 1개까지 채움)
+- COMPRESS_CONTEXT / COMPRESS_TOP_K: 문장 단위 추출 압축 (문서마다 질문과 가장 가까운 문장 top_k개만 사용)
+- RAG_DEADLINE_S: 질문 1개 지연시간 예산(초, 기본 0 = 제한 없음, 예: 20) - 남은 시간에 따라 self-check / rewrite 생략, context 축소,
+  대체 답변 (DEADLINE_* 로 기준 조정, deadline.py)
+- DEGRADED_CACHE_THRESHOLD: 생성할 시간이 없을 때 대체로 쓸 캐시 답변의 유사도 기준 (평소 기준보다 낮게)
+- ADAPTIVE_CUTOFF: 1이면 앙상블 결합 결과를 점수 분포(큰 점수 차이 / 1위 대비 비율)에 따라 잘라 self-check / 생성에 넘김
+  (CUTOFF_* 로 기준 조정, ensemble.AdaptiveCutoff - 재현율/지연시간 비교: bench_adaptive_cutoff.py)
+- ENTITY_FAST_PATH: 질문에 질병명이 있으면 그 질병 청크로 검색을 restrict(제한) / boost(상향), 비워 두면 사용 안 함
+  (entity_index.py - 지연시간/정밀도 비교: bench_entity_fast_path.py)
+- FAQ_ANSWERS: 1이면 자주 묻는 질문의 미리 만든 답변 사용 (build_faq_answers.py로 먼저 생성, faq_answers.py)
+  FAQ_THRESHOLD: 질문과 군집 중심의 유사도 기준 / 인덱스 버전이 바뀌면 백그라운드에서 다시 생성
+- INDEX_SYNC_INTERVAL: 다른 프로세스(ingest_records.py)가 추가한 상담기록을 확인하는 간격(초, 0이면 질문마다)
+  (index_updater.py - 증분 갱신 후 답변 캐시 무효화, FAQ 답변 다시 생성)
+'''
+
+import os
+from functools import lru_cache
+
+from chunk_stitching import chroma_neighbor_fetcher, stitch_chunks
+from context_builder import ContextBuilder
+from context_compression import SentenceCompressor
+from deadline import Deadline, DeadlineExceeded, DegradationPolicy, stream_with_deadline
+from ensemble import AdaptiveCutoff
+from faq_answers import FAQAnswers, faq_answers_path
+from index_updater import IndexUpdater
+from instrumentation import record_degradation
+from llm_governor import BACKGROUND, llm_priority
+from prompt_module import (filter_docs_by_response, format_docs, get_rag_prompt, get_rewrite_prompt,
+                           retrieval_only_answer, self_check_retriver)
+from rag_components import default_rewrite_cache_path
+from rag_graph import NO_DOCS_ANSWER, build_rag_graph, run_rag_graph
+from rewrite_cache import RewriteCache
+
+SELF_CHECK_BACKEND = os.getenv("SELF_CHECK_BACKEND", "llm")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+STITCH_CHUNKS = os.getenv("STITCH_CHUNKS", "1") == "1"
+COMPRESS_CONTEXT = os.getenv("COMPRESS_CONTEXT", "0") == "1"
+COMPRESS_TOP_K = int(os.getenv("COMPRESS_TOP_K", "3"))
+REQUEST_BUDGET = float(os.getenv("RAG_DEADLINE_S", "0"))
+DEGRADED_CACHE_THRESHOLD = float(os.getenv("DEGRADED_CACHE_THRESHOLD", "0.85"))
+ADAPTIVE_CUTOFF = os.getenv("ADAPTIVE_CUTOFF", "0") == "1"
+ENTITY_FAST_PATH = os.getenv("ENTITY_FAST_PATH", "") or None
+FAQ_ANSWERS = os.getenv("FAQ_ANSWERS", "0") == "1"
+FAQ_THRESHOLD = float(os.getenv("FAQ_THRESHOLD", "0.9"))
+INDEX_SYNC_INTERVAL = float(os.getenv("INDEX_SYNC_INTERVAL", "30"))
+TRUNCATED_NOTICE = "\n\n(응답 시간이 초과되어 답변이 중간에 끊겼습니다.)"
+
+
+@lru_cache(maxsize=None)
+def get_reranker():
+    """로컬 cross-encoder 리랭커 (SELF_CHECK_BACKEND=reranker일 때만 로드)"""
+    from reranker import CrossEncoderReranker
+
+    return CrossEncoderReranker(use_onnx=os.getenv("RERANKER_ONNX", "0") == "1")
+
+
+def retrieval_options() -> dict:
+    """initialize_rag_system()에 넘길 검색 설정 (결합 결과 자르기 기준, 질병명 fast-path)"""
+    return {"cutoff": AdaptiveCutoff.from_env() if ADAPTIVE_CUTOFF else None,
+            "entity_fast_path": ENTITY_FAST_PATH}
+
+
+def new_deadline(budget: float = REQUEST_BUDGET):
+    """요청 1개의 마감 시간 (예산이 0 이하면 None = 제한 없음)"""
+    return Deadline(budget) if budget > 0 else None
+
+
+def make_fallback_answer(answer_cache=None):
+    """생성할 시간이 없을 때: 비슷한 질문의 캐시 답변 -> 없으면 검색 문서로 만든 답변"""
+    def fallback_answer(question, docs):
+        if answer_cache is not None:
+            cached = answer_cache.lookup(question, threshold=DEGRADED_CACHE_THRESHOLD)
+            if cached:
+                return cached['answer'], "cached_answer"
+        return retrieval_only_answer(docs), "retrieval_only"
+
+    return fallback_answer
+
+
+def stream_generation(rag_chain, result: dict, deadline=None, fallback_answer=None, degraded=None):
+    """
+    생성 직전 state(run_rag_graph(..., skip_generate=True) 결과)로 답변을 토큰 단위 생성
+    deadline이 지나면 중단: 첫 토큰 전이면 대체 답변 전체, 생성 중이면 안내 문구를 마지막 청크로 보냄
+    적용한 항목은 degraded 리스트에 추가 (계측에도 기록)
+    """
+    inputs = {"context": result["context"], "question": result.get("transformed") or result["question"]}
+    if deadline is None:
+        yield from rag_chain.stream(inputs)
+        return
+
+    emitted = False
+    try:
+        for chunk in stream_with_deadline(lambda: rag_chain.stream(inputs), deadline):
+            emitted = True
+            yield chunk
+    except DeadlineExceeded:
+        names = ["generate_timeout"]
+        if emitted:
+            names.append("answer_truncated")
+            tail = TRUNCATED_NOTICE
+        else:
+            tail, kind = (fallback_answer or make_fallback_answer())(result["question"], result["docs"])
+            names.append(kind)
+        for name in names:
+            record_degradation(name)
+            if degraded is not None:
+                degraded.append(name)
+        yield tail
+
+
+def build_service_graph(rag_system: dict, vectorstore_path: str, use_rewrite_cache: bool = True, answer_cache=None):
+    """
+    initialize_rag_system() 결과 -> 서비스용 질문 처리 그래프 (검색+self-check / rewrite 병렬 -> 생성)
+    use_rewrite_cache=False: 매 질문 rewrite LLM 호출 (부하 테스트에서 rewrite 단계 지연 측정용)
+    answer_cache: 마감 시간이 지나 생성할 수 없을 때 대체 답변을 찾을 SemanticAnswerCache
+    """
+    llm = rag_system['llm']
+    if SELF_CHECK_BACKEND == "reranker":
+        from reranker import rerank_self_check
+
+        reranker = get_reranker()
+        self_check = lambda docs, question: rerank_self_check(docs, question, reranker)
+    else:
+        self_check = lambda docs, question: self_check_retriver(docs, question, llm)
+
+    stitch = None
+    if STITCH_CHUNKS:
+        fetch_neighbors = chroma_neighbor_fetcher(rag_system['vectorstore'])
+        stitch = lambda docs: stitch_chunks(docs, fetch_neighbors=fetch_neighbors)
+
+    rewrite_prompt = get_rewrite_prompt()
+    rewrite_cache = None
+    if use_rewrite_cache:
+        rewrite_cache = RewriteCache(rewrite_prompt, llm, persist_path=default_rewrite_cache_path(vectorstore_path))
+
+    return build_rag_graph(
+        retriever=rag_system['retriever'],
+        llm=llm,
+        rag_prompt=get_rag_prompt(),
+        rewrite_prompt=rewrite_prompt,
+        format_docs=format_docs,
+        self_check=self_check,
+        stitch=stitch,
+        compress=SentenceCompressor(rag_system['embeddings'], top_k=COMPRESS_TOP_K).compress if COMPRESS_CONTEXT else None,
+        context_builder=ContextBuilder(format_docs, max_tokens=CONTEXT_TOKEN_BUDGET) if CONTEXT_TOKEN_BUDGET > 0 else None,
+        rewrite_cache=rewrite_cache,
+        policy=DegradationPolicy.from_env(),
+        fallback_answer=make_fallback_answer(answer_cache),
+    )
+
+
+def faq_generator(graph):
+    """미리 만든 답변 생성 함수: 질문 -> (답변, 답변에 인용된 문서, 적용한 단계 생략 항목)
+    (마감 시간 없이 전체 파이프라인 실행, 사용자 질문보다 낮은 BACKGROUND 우선순위)"""
+    def generate(question):
+        with llm_priority(BACKGROUND):
+            result = run_rag_graph(graph, question)
+        answer = result.get("answer", NO_DOCS_ANSWER)
+        return answer, filter_docs_by_response(result.get("docs") or [], answer), list(result.get("degraded") or [])
+
+    return generate
+
+
+def load_faq_answers(rag_system: dict, vectorstore_path: str, collection_name: str, graph):
+    """
+    FAQ_ANSWERS=1이면 미리 만든 답변 로드 (없으면 None)
+    인덱스 버전이 바뀌었으면 그래프로 백그라운드에서 다시 생성 (그동안은 사용하지 않음)
+    """
+    if not FAQ_ANSWERS:
+        return None
+    path = faq_answers_path(vectorstore_path, collection_name)
+    if not os.path.exists(path):
+        print(f"미리 만든 FAQ 답변이 없습니다 (python build_faq_answers.py로 생성): {path}")
+        return None
+    faq = FAQAnswers.load(path, rag_system['embeddings'], threshold=FAQ_THRESHOLD)
+    faq.set_index_version(rag_system['index_version'], generate=faq_generator(graph), path=path)
+    print(f"FAQ 답변 {faq.metrics()['approved']}개 로드 (인덱스 버전 {faq.version})")
+    return faq
+
+
+def attach_index_updater(rag_system: dict, graph=None, answer_cache=None, faq_answers=None):
+    """
+    서비스 리트리버의 증분 갱신기 (샤드 인덱스 등 지원하지 않는 구성이면 None)
+    인덱스가 교체되면 rag_system['index_version'] 갱신, 답변 캐시 무효화, FAQ 답변 백그라운드 재생성
+    """
+    try:
+        updater = IndexUpdater(rag_system['vectorstore'], rag_system['retriever'])
+    except ValueError as e:
+        print(f"증분 인덱스 갱신을 사용하지 않습니다: {e}")
+        return None
+
+    def on_update(version):
+        rag_system['index_version'] = version
+        if answer_cache is not None:
+            answer_cache.set_index_version(version)
+        if faq_answers is not None:
+            faq_answers.set_index_version(version, generate=faq_generator(graph) if graph is not None else None)
+
+    updater.add_listener(on_update)
+    return updater
@@ -0,0 +1,75 @@
+'''
+로컬 Cross-Encoder 리랭커 (LLM self-check 대체용)
+- (질문, 문서) 쌍 전체를 한 번의 배치 forward로 점수 계산 (CPU)
+- 점수가 threshold 이상인 문서만 남기고, top_n이 있으면 상위 top_n개까지
+- self_check_retriver와 같은 계약: (found_docs, question, ...) -> 남길 문서 리스트, 모두 Drop이면 원래 문서 반환
+
+기본 모델은 BAAI/bge-reranker-v2-m3 (다국어, 한국어 지원, 점수는 sigmoid 적용된 0~1)
+use_onnx=True면 sentence-transformers ONNX 백엔드 사용 (optimum[onnxruntime] 필요, 양자화 모델은 onnx_file로 지정)
+'''
+
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+DEFAULT_RERANKER_MODEL = "BAAI/bge-reranker-v2-m3"
+
+
+class CrossEncoderReranker:
+    """sentence-transformers CrossEncoder 기반 리랭커"""
+
+    def __init__(self, model_name: str = DEFAULT_RERANKER_MODEL, threshold: float = 0.3,
+                 top_n: Optional[int] = None, use_onnx: bool = False, onnx_file: Optional[str] = None,
+                 device: str = "cpu", batch_size: int = 16, max_length: int = 512):
+        from sentence_transformers import CrossEncoder
+
+        kwargs = {"max_length": max_length, "device": device}
+        if use_onnx:
+            kwargs["backend"] = "onnx"
+            if onnx_file:
+                # 예: "onnx/model_qint8_avx512_vnni.onnx" (양자화 모델)
+                kwargs["model_kwargs"] = {"file_name": onnx_file}
+
+        self.model = CrossEncoder(model_name, **kwargs)
+        self.model_name = model_name
+        self.threshold = threshold
+        self.top_n = top_n
+        self.batch_size = batch_size
+
+    def score(self, question: str, docs: List[Document]) -> List[float]:
+        """(질문, 문서) 쌍 전체를 한 번에 점수 계산"""
+        if not docs:
+            return []
+        scores = self.model.predict(
+            [(question, doc.page_content) for doc in docs],
+            batch_size=self.batch_size,
+            show_progress_bar=False,
+        )
+        return [float(score) for score in scores]
+
+    def rerank(self, question: str, docs: List[Document]) -> List[Tuple[Document, float]]:
+        """점수 내림차순 [(문서, 점수)]"""
+        return sorted(zip(docs, self.score(question, docs)), key=lambda x: x[1], reverse=True)
+
+    def select(self, question: str, docs: List[Document]) -> List[Document]:
+        """threshold 이상 + 상위 top_n 문서 (점수 순), 남는 문서가 없으면 빈 리스트"""
+        kept = [doc for doc, score in self.rerank(question, docs) if score >= self.threshold]
+        if self.top_n is not None:
+            kept = kept[:self.top_n]
+        return kept
+
+
+def rerank_self_check(found_docs: List[Document], question: str, reranker: CrossEncoderReranker) -> List[Document]:
+    '''
+    self_check_retriver와 같은 역할을 리랭커로 수행합니다.
+    관련 있는 문서만 점수 순으로 반환하고, 모든 문서가 Drop되면 원래 검색된 문서를 반환합니다.
+    '''
+    kept_docs = reranker.select(question, found_docs)
+
+    if len(kept_docs) == 0:
+        print('모든 문서가 Drop되었습니다. 원래 검색된 문서들을 반환합니다.')
+        kept_docs = found_docs
+
+    print(f'\n최종 선택된 문서 개수: {len(kept_docs)}')
+
+    return kept_docs
@@ -0,0 +1,403 @@
+'''
+배치 검색이 가능한 리트리버 모음
+- DenseRetriever: 질문 여러 개를 임베딩 1회 호출 + Chroma 쿼리 1회로 검색
+- BM25BatchRetriever: 역색인(postings) 기반 BM25, 질문 간 공통 단어 점수를 재사용
+
+두 리트리버 모두 filters 인자(metadata_filter.py 형식)를 받으면 검색 단계에서 후보를 줄입니다.
+- Dense: Chroma where 절 (청크 id 필터는 query(ids=...))
+- BM25: 진료과(department)별로 나눠 둔 postings 구간만 점수 계산 + 나머지 필드(청크 id 포함)는 후보 마스크
+
+BM25BatchRetriever.updated(): 새 청크를 반영한 새 리트리버를 만듭니다. (기존 객체는 그대로 -> 진행 중인 검색에 영향 없음)
+새 청크의 단어 postings만 이어 붙이고 idf / 문서 길이 정규화만 다시 계산합니다. (index_updater.py)
+'''
+
+import copy
+import math
+from collections import defaultdict
+from typing import Callable, List, Optional, Tuple, Union
+
+import numpy as np
+from langchain_core.documents import Document
+
+from instrumentation import stage
+from metadata_filter import ID_FIELD, filter_ids, filter_key, normalize_filters, to_chroma_where
+
+
+def default_preprocessing_func(text: str) -> List[str]:
+    """BM25 토크나이저 (langchain BM25Retriever 기본값과 동일: 공백 분리)"""
+    return text.split()
+
+
+def load_documents_from_vectorstore(vectorstore) -> List[Document]:
+    """ChromaDB에 저장된 모든 문서를 Document 리스트로 변환 (BM25 인덱스 구축용)"""
+    collection = vectorstore._collection
+    doc_count = collection.count()
+
+    if doc_count == 0:
+        raise ValueError("벡터스토어가 비어있습니다.")
+
+    # ChromaDB에서 모든 문서 가져오기
+    all_data = collection.get(limit=doc_count)
+
+    # Document 객체로 변환 (Chroma id를 함께 보존)
+    docs = []
+    if all_data and 'ids' in all_data and len(all_data['ids']) > 0:
+        documents = all_data.get('documents', [])
+        metadatas = all_data.get('metadatas', [])
+
+        for i, doc_id in enumerate(all_data['ids']):
+            page_content = documents[i] if i < len(documents) else ""
+            metadata = metadatas[i] if i < len(metadatas) else {}
+            docs.append(Document(page_content=page_content, metadata=metadata or {}, id=doc_id))
+
+    if len(docs) == 0:
+        raise ValueError("벡터스토어에서 문서를 가져올 수 없습니다.")
+
+    return docs
+
+
+def _okapi_idf(doc_counts: dict, corpus_size: int, epsilon: float) -> dict:
+    """rank_bm25 BM25Okapi와 같은 idf (문서 절반 이상에 나온 단어는 epsilon * 평균 idf)"""
+    idf = {term: math.log(corpus_size - count + 0.5) - math.log(count + 0.5) for term, count in doc_counts.items()}
+    floor = epsilon * (sum(idf.values()) / len(idf)) if idf else 0.0
+    return {term: value if value >= 0 else floor for term, value in idf.items()}
+
+
+def _per_query_filters(filters: Union[None, dict, List[Optional[dict]]], n: int) -> List[Optional[dict]]:
+    """batch()의 filters 인자를 질문별 리스트로 변환 (dict 하나면 모든 질문에 동일 적용)"""
+    if filters is None or isinstance(filters, dict):
+        return [filters] * n
+    filters = list(filters)
+    if len(filters) != n:
+        raise ValueError("filters 리스트 길이는 질문 수와 같아야 합니다.")
+    return filters
+
+
+# ---------------------------
+# Dense (벡터 유사도) 리트리버
+# ---------------------------
+class DenseRetriever:
+    """Chroma 유사도 검색 리트리버 (vectorstore.as_retriever(search_type="similarity")와 동일한 결과)"""
+
+    def __init__(self, vectorstore, k: int = 5):
+        self.vectorstore = vectorstore
+        self.k = k
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """질문들을 한 번의 임베딩 호출로 인코딩"""
+        embeddings = self.vectorstore.embeddings
+        with stage("query_embedding"):
+            # 질문 임베딩 캐시(CachedEmbeddings)는 캐시에 없는 질문만 모아서 인코딩
+            if hasattr(embeddings, "embed_queries"):
+                return embeddings.embed_queries(queries)
+            if len(queries) == 1:
+                return [embeddings.embed_query(queries[0])]
+            return embeddings.embed_documents(queries)
+
+    def _search_with_scores(self, query_embeddings: List[List[float]],
+                            filters: Optional[dict] = None) -> List[List[Tuple[Document, float]]]:
+        """임베딩 여러 개를 Chroma 쿼리 1회로 검색 -> 질문별 [(문서, 거리)] (filters가 있으면 where 절로 전달)"""
+        query_kwargs = {}
+        where = to_chroma_where(filters)
+        if where:
+            query_kwargs["where"] = where
+        ids = filter_ids(filters)
+        if ids:
+            query_kwargs["ids"] = ids
+
+        with stage("dense_search"):
+            result = self.vectorstore._collection.query(
+                query_embeddings=query_embeddings,
+                n_results=self.k,
+                include=["documents", "metadatas", "distances"],
+                **query_kwargs,
+            )
+
+        results = []
+        for ids, documents, metadatas, distances in zip(result["ids"], result["documents"],
+                                                        result["metadatas"], result["distances"]):
+            results.append([
+                (Document(page_content=text, metadata=metadata or {}, id=doc_id), distance)
+                for doc_id, text, metadata, distance in zip(ids, documents, metadatas, distances)
+            ])
+        return results
+
+    def _search(self, query_embeddings: List[List[float]], filters: Optional[dict] = None) -> List[List[Document]]:
+        """임베딩 여러 개를 Chroma 쿼리 1회로 검색 (filters가 있으면 where 절로 전달)"""
+        return [[doc for doc, _ in pairs] for pairs in self._search_with_scores(query_embeddings, filters)]
+
+    def invoke(self, query: str, filters: Optional[dict] = None) -> List[Document]:
+        return self.batch([query], filters=filters)[0]
+
+    def batch(self, queries: List[str], filters=None) -> List[List[Document]]:
+        """
+        여러 질문을 한 번에 검색 (임베딩 1회 + 벡터 검색 1회)
+        filters: 모든 질문 공통 dict 또는 질문별 dict 리스트 (같은 필터끼리 묶어서 검색)
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        return self.search_by_embeddings(self._embed_queries(queries), filters=filters)
+
+    def search_by_embeddings(self, query_embeddings: List[List[float]], filters=None,
+                             with_scores: bool = False) -> list:
+        """
+        이미 계산된 질문 임베딩으로 검색 (샤드 라우터처럼 임베딩을 여러 곳에서 재사용할 때)
+        with_scores=True면 질문별 [(문서, 거리)]를 반환합니다. (거리는 작을수록 유사)
+        """
+        per_query = _per_query_filters(filters, len(query_embeddings))
+
+        # where 절은 Chroma 쿼리 단위이므로 같은 필터를 쓰는 질문끼리 묶어서 검색
+        groups = defaultdict(list)
+        for i, query_filters in enumerate(per_query):
+            groups[filter_key(query_filters)].append(i)
+
+        search = self._search_with_scores if with_scores else self._search
+        results = [None] * len(query_embeddings)
+        for indices in groups.values():
+            group_results = search([query_embeddings[i] for i in indices], per_query[indices[0]])
+            for i, docs in zip(indices, group_results):
+                results[i] = docs
+        return results
+
+
+# ---------------------------
+# BM25 리트리버 (역색인 기반)
+# ---------------------------
+class BM25BatchRetriever:
+    """
+    BM25Okapi 점수를 역색인으로 계산하는 리트리버.
+    langchain BM25Retriever와 같은 점수/순위를 내지만, 질문 단어가 등장한 문서만 계산하고
+    batch() 호출 시 여러 질문에 공통으로 나온 단어의 점수 벡터는 한 번만 계산합니다.
+
+    단어별 postings는 partition_field(기본: 진료과) 순서로 정렬해 두고 파티션별 구간 경계를 저장하므로,
+    해당 필드로 필터링하면 선택된 파티션 구간만 잘라서 점수를 계산합니다.
+    """
+
+    def __init__(self, docs: List[Document], k: int = 4,
+                 preprocess_func: Callable[[str], List[str]] = default_preprocessing_func,
+                 k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25,
+                 partition_field: str = "department"):
+        from rank_bm25 import BM25Okapi
+
+        self.docs = list(docs)
+        self.k = k
+        self.preprocess_func = preprocess_func
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.partition_field = partition_field
+
+        # idf, 문서 길이 계산은 rank_bm25와 동일하게 맞추기 위해 그대로 사용
+        bm25 = BM25Okapi([preprocess_func(doc.page_content) for doc in self.docs], k1=k1, b=b, epsilon=epsilon)
+        self.idf = bm25.idf
+        self._doc_len = np.asarray(bm25.doc_len, dtype=np.float64)
+        self._length_norm = k1 * (1 - b + b * self._doc_len / bm25.avgdl)
+
+        # 파티션(진료과) 번호: 문서 -> 파티션 인덱스
+        self.partitions = sorted({str(doc.metadata.get(partition_field) or "") for doc in self.docs})
+        partition_index = {name: i for i, name in enumerate(self.partitions)}
+        self._doc_partition = np.asarray(
+            [partition_index[str(doc.metadata.get(partition_field) or "")] for doc in self.docs], dtype=np.int64
+        )
+        self._partition_docs = [np.flatnonzero(self._doc_partition == i) for i in range(len(self.partitions))]
+
+        # 단어 -> (문서 인덱스 배열, 단어 빈도 배열, 파티션 구간 경계)
+        postings = defaultdict(lambda: ([], []))
+        for doc_idx, frequencies in enumerate(bm25.doc_freqs):
+            for term, freq in frequencies.items():
+                postings[term][0].append(doc_idx)
+                postings[term][1].append(freq)
+
+        self.postings = {}
+        for term, (ids, freqs) in postings.items():
+            self.postings[term] = self._sorted_postings(np.asarray(ids, dtype=np.int64),
+                                                        np.asarray(freqs, dtype=np.float64))
+
+        # 파티션 외 필드 필터용: (필드, 값) -> 문서 인덱스 배열
+        self._field_docs = defaultdict(lambda: defaultdict(list))
+        for doc_idx, doc in enumerate(self.docs):
+            for field, value in doc.metadata.items():
+                if isinstance(value, (str, int, float, bool)):
+                    self._field_docs[field][value].append(doc_idx)
+            if doc.id is not None:
+                self._field_docs[ID_FIELD][doc.id].append(doc_idx)
+
+    def _sorted_postings(self, ids: np.ndarray, freqs: np.ndarray):
+        """postings를 파티션 순서로 정렬 + 파티션별 구간 경계"""
+        order = np.argsort(self._doc_partition[ids], kind="stable")
+        ids, freqs = ids[order], freqs[order]
+        bounds = np.searchsorted(self._doc_partition[ids], np.arange(len(self.partitions) + 1))
+        return ids, freqs, bounds
+
+    @classmethod
+    def from_documents(cls, docs: List[Document], **kwargs) -> "BM25BatchRetriever":
+        return cls(docs, **kwargs)
+
+    # ---------------------------
+    # 증분 갱신
+    # ---------------------------
+    def updated(self, docs: List[Document], remove_ids=()) -> "BM25BatchRetriever":
+        """
+        docs를 추가하고 remove_ids 청크를 뺀 새 리트리버 (self는 바뀌지 않음)
+        이미 있는 청크 id를 덮어쓰거나 지우는 경우는 남은 문서로 전체 재구성,
+        새 청크만 추가하는 경우는 새 청크의 postings만 이어 붙이고 idf / 길이 정규화를 다시 계산합니다.
+        """
+        docs = list(docs)
+        existing = self._field_docs[ID_FIELD] if ID_FIELD in self._field_docs else {}
+        replaced = {doc.id for doc in docs if doc.id in existing} | {doc_id for doc_id in remove_ids if doc_id in existing}
+        if replaced:
+            kept = [doc for doc in self.docs if doc.id not in replaced]
+            return type(self)(kept + docs, k=self.k, preprocess_func=self.preprocess_func, k1=self.k1, b=self.b,
+                              epsilon=self.epsilon, partition_field=self.partition_field)
+        if not docs:
+            return self
+
+        new = copy.copy(self)
+        offset = len(self.docs)
+        new.docs = self.docs + docs
+
+        # 문서 빈도 / 문서 길이 (rank_bm25와 같은 방식)
+        doc_freqs = []
+        for doc in docs:
+            frequencies = defaultdict(int)
+            for term in self.preprocess_func(doc.page_content):
+                frequencies[term] += 1
+            doc_freqs.append(frequencies)
+        new._doc_len = np.concatenate([self._doc_len,
+                                       np.asarray([sum(f.values()) for f in doc_freqs], dtype=np.float64)])
+        new._length_norm = self.k1 * (1 - self.b + self.b * new._doc_len / new._doc_len.mean())
+
+        # 새 파티션은 뒤에 추가 (기존 postings의 파티션 번호 유지)
+        names = [str(doc.metadata.get(self.partition_field) or "") for doc in docs]
+        new.partitions = self.partitions + [name for name in dict.fromkeys(names) if name not in self.partitions]
+        partition_index = {name: i for i, name in enumerate(new.partitions)}
+        new._doc_partition = np.concatenate([self._doc_partition,
+                                             np.asarray([partition_index[name] for name in names], dtype=np.int64)])
+        new._partition_docs = [np.flatnonzero(new._doc_partition == i) for i in range(len(new.partitions))]
+
+        # 새 청크에 나온 단어만 postings 이어 붙이기
+        added = defaultdict(lambda: ([], []))
+        for i, frequencies in enumerate(doc_freqs):
+            for term, freq in frequencies.items():
+                added[term][0].append(offset + i)
+                added[term][1].append(freq)
+        new.postings = dict(self.postings)
+        extra_partitions = len(new.partitions) - len(self.partitions)
+        if extra_partitions:
+            for term, (ids, freqs, bounds) in self.postings.items():
+                new.postings[term] = (ids, freqs, np.concatenate([bounds, np.full(extra_partitions, len(ids))]))
+        for term, (ids, freqs) in added.items():
+            old_ids, old_freqs, _ = self.postings.get(term, (np.zeros(0, dtype=np.int64), np.zeros(0), None))
+            new.postings[term] = new._sorted_postings(np.concatenate([old_ids, np.asarray(ids, dtype=np.int64)]),
+                                                      np.concatenate([old_freqs, np.asarray(freqs, dtype=np.float64)]))
+        new.idf = _okapi_idf({term: len(ids) for term, (ids, _, _) in new.postings.items()}, len(new.docs),
+                             self.epsilon)
+
+        # 필드 필터: 바뀐 (필드, 값) 목록만 새 리스트로 (기존 리트리버와 공유하지 않음)
+        new._field_docs = defaultdict(lambda: defaultdict(list))
+        for field, values in self._field_docs.items():
+            new._field_docs[field] = defaultdict(list, values)
+        for i, doc in enumerate(docs):
+            fields = [(field, value) for field, value in doc.metadata.items()
+                      if isinstance(value, (str, int, float, bool))]
+            if doc.id is not None:
+                fields.append((ID_FIELD, doc.id))
+            for field, value in fields:
+                new._field_docs[field][value] = new._field_docs[field][value] + [offset + i]
+        return new
+
+    # ---------------------------
+    # 필터 -> 후보 문서
+    # ---------------------------
+    def _resolve_filters(self, filters: Optional[dict]):
+        """
+        필터 -> (선택된 파티션 번호 tuple 또는 None, 후보 마스크 또는 None, 후보 문서 인덱스 배열 또는 None)
+        None은 '제한 없음'을 의미합니다.
+        """
+        filters = normalize_filters(filters)
+        if not filters:
+            return None, None, None
+
+        partitions = None
+        if self.partition_field in filters:
+            wanted = set(filters.pop(self.partition_field))
+            partitions = tuple(i for i, name in enumerate(self.partitions) if name in wanted)
+            candidates = (np.concatenate([self._partition_docs[i] for i in partitions])
+                          if partitions else np.zeros(0, dtype=np.int64))
+        else:
+            candidates = np.arange(len(self.docs))
+
+        mask = None
+        if filters:
+            mask = np.ones(len(self.docs), dtype=bool)
+            for field, values in filters.items():
+                field_mask = np.zeros(len(self.docs), dtype=bool)
+                for value in values:
+                    field_mask[self._field_docs[field].get(value, [])] = True
+                mask &= field_mask
+            candidates = candidates[mask[candidates]]
+
+        return partitions, mask, np.sort(candidates)
+
+    def _term_scores(self, term: str, cache: dict, partitions=None, mask=None):
+        """단어 하나의 (문서 인덱스, BM25 점수) - 같은 batch 안에서는 캐시 재사용"""
+        cache_key = (term, partitions, None if mask is None else id(mask))
+        if cache_key not in cache:
+            ids, freqs, bounds = self.postings[term]
+            if partitions is not None:
+                # 선택된 파티션 구간만 잘라서 계산 (후보 밖 문서는 아예 보지 않음)
+                slices = [slice(bounds[p], bounds[p + 1]) for p in partitions]
+                ids = np.concatenate([ids[s] for s in slices]) if slices else ids[:0]
+                freqs = np.concatenate([freqs[s] for s in slices]) if slices else freqs[:0]
+            if mask is not None:
+                keep = mask[ids]
+                ids, freqs = ids[keep], freqs[keep]
+            cache[cache_key] = (ids, self.idf[term] * (freqs * (self.k1 + 1) / (freqs + self._length_norm[ids])))
+        return cache[cache_key]
+
+    def _score(self, tokens: List[str], cache: dict, partitions=None, mask=None) -> np.ndarray:
+        scores = np.zeros(len(self.docs))
+        for term in tokens:
+            # 코퍼스에 없는 단어는 점수 0 (rank_bm25와 동일)
+            if term not in self.postings:
+                continue
+            ids, term_scores = self._term_scores(term, cache, partitions, mask)
+            scores[ids] += term_scores
+        return scores
+
+    def invoke(self, query: str, filters: Optional[dict] = None) -> List[Document]:
+        return self.batch([query], filters=filters)[0]
+
+    def batch(self, queries: List[str], filters=None) -> List[List[Document]]:
+        """
+        여러 질문을 한 번에 점수 계산
+        filters: 모든 질문 공통 dict 또는 질문별 dict 리스트
+        """
+        return [[doc for doc, _ in pairs] for pairs in self.batch_with_scores(queries, filters=filters)]
+
+    def batch_with_scores(self, queries: List[str], filters=None) -> List[List[Tuple[Document, float]]]:
+        """batch()와 같지만 질문별 [(문서, BM25 점수)]를 반환"""
+        with stage("bm25"):
+            return self._batch_with_scores(queries, filters)
+
+    def _batch_with_scores(self, queries: List[str], filters=None) -> List[List[Tuple[Document, float]]]:
+        queries = list(queries)
+        per_query = _per_query_filters(filters, len(queries))
+        cache = {}
+        resolved = {}
+        results = []
+        for query, query_filters in zip(queries, per_query):
+            key = filter_key(query_filters)
+            if key not in resolved:
+                resolved[key] = self._resolve_filters(query_filters)
+            partitions, mask, candidates = resolved[key]
+
+            scores = self._score(self.preprocess_func(query), cache, partitions, mask)
+            if candidates is None:
+                top_n = np.argsort(scores)[::-1][:self.k]
+            else:
+                # 후보 문서 안에서만 순위 결정
+                top_n = candidates[np.argsort(scores[candidates])[::-1][:self.k]]
+            results.append([(self.docs[i], float(scores[i])) for i in top_n])
+        return results
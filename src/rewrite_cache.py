@@ -0,0 +1,85 @@
+'''
+질문 변환(rewrite) 결과 캐시
+rewrite 결과는 원본 질문에만 의존하므로, 같은 질문은 LLM을 다시 호출하지 않습니다.
+(평가 스크립트에서 리트리버 4종마다 같은 질문을 다시 변환하던 부분, Streamlit에서 반복 질문)
+- 키: 정규화한 질문 (공백/대소문자/끝 문장부호 차이 무시)
+- namespace: rewrite 모델명 + 프롬프트 버전(프롬프트 템플릿 해시) -> 프롬프트를 고치면 자동으로 새 캐시 사용
+- 1단계: 프로세스 내 LRU (메모리, 최대 개수 제한)
+- 2단계(선택): SQLite 영구 캐시 (Streamlit 앱과 평가 스크립트가 같은 파일 공유: data/cache/rewrites.sqlite)
+'''
+
+from typing import Callable, Optional
+
+from cache_utils import CacheStats, LRUCache, SQLiteCache, make_key, normalize_query
+
+
+def llm_model_name(llm) -> str:
+    """LLM 식별자 (캐시 namespace용)"""
+    for attr in ("model_name", "model"):
+        name = getattr(llm, attr, None)
+        if isinstance(name, str) and name:
+            return name
+    return type(llm).__name__
+
+
+def prompt_version(prompt) -> str:
+    """프롬프트 템플릿 내용 해시 (앞 12자리)"""
+    template = getattr(prompt, "template", None) or repr(prompt)
+    return make_key(template)[:12]
+
+
+class RewriteCache:
+    """질문 -> 변환된 질문 캐시 (스레드 안전, 여러 그래프/스크립트에서 공유 가능)"""
+
+    def __init__(self, rewrite_prompt, llm, persist_path: Optional[str] = None,
+                 max_memory_entries: int = 1024, max_disk_entries: int = 100_000, ttl: Optional[float] = None):
+        self.namespace = f"rewrite:{llm_model_name(llm)}:{prompt_version(rewrite_prompt)}"
+        self.memory = LRUCache(max_size=max_memory_entries, ttl=ttl)
+        self.disk = SQLiteCache(persist_path, namespace=self.namespace, max_entries=max_disk_entries,
+                                ttl=ttl) if persist_path else None
+        self.stats = CacheStats("memory_hits", "disk_hits", "misses")
+
+    def get(self, question: str) -> Optional[str]:
+        key = make_key(normalize_query(question))
+        transformed = self.memory.get(key)
+        if transformed is not None:
+            self.stats.incr("memory_hits")
+            return transformed
+
+        if self.disk is not None:
+            blob = self.disk.get(key)
+            if blob is not None:
+                transformed = blob.decode("utf-8")
+                self.memory.put(key, transformed)
+                self.stats.incr("disk_hits")
+                return transformed
+
+        self.stats.incr("misses")
+        return None
+
+    def put(self, question: str, transformed: str):
+        key = make_key(normalize_query(question))
+        self.memory.put(key, transformed)
+        if self.disk is not None:
+            self.disk.put(key, transformed.encode("utf-8"))
+
+    def get_or_compute(self, question: str, compute: Callable[[], str]) -> str:
+        """캐시에 있으면 반환, 없으면 compute() 결과를 저장 후 반환"""
+        transformed = self.get(question)
+        if transformed is None:
+            transformed = compute()
+            self.put(question, transformed)
+        return transformed
+
+    def cache_metrics(self) -> dict:
+        """적중률 지표"""
+        counts = self.stats.as_dict()
+        lookups = counts["memory_hits"] + counts["disk_hits"] + counts["misses"]
+        hits = counts["memory_hits"] + counts["disk_hits"]
+        return {
+            **counts,
+            "lookups": lookups,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_size": len(self.memory),
+            "disk_size": len(self.disk) if self.disk is not None else 0,
+        }
@@ -0,0 +1,314 @@
+'''
+진료과(department)별 샤드 인덱스 + 질문 라우터
+- 샤드: 진료과별 Chroma 컬렉션 + 샤드별 BM25 인덱스 (진료과가 없는 문서는 common 샤드)
+- 라우터: 질문 키워드(metadata_filter.DEPARTMENT_KEYWORDS) -> 샤드 centroid 유사도 -> 확신이 낮으면 전체 샤드
+- ShardedRetriever: 라우팅된 샤드만 검색한 뒤 Dense/BM25 결과를 합쳐 EnsembleRetriever와 같은 방식으로 결합
+
+샤드는 원본 컬렉션의 문서/임베딩을 그대로 복사해 만들기 때문에 재임베딩이 필요 없고,
+진료과 하나만 다시 만들거나(build_shards(..., shards=["eye"])) 하나만 로드할 수 있습니다.
+Chroma 컬렉션 이름은 영문만 가능하므로 진료과는 SHARD_SLUGS의 영문 이름으로 저장합니다.
+'''
+
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from ensemble import AdaptiveCutoff, fuse_results
+from instrumentation import stage
+from metadata_filter import detect_filters, normalize_filters
+from retrievers import BM25BatchRetriever, DenseRetriever, load_documents_from_vectorstore
+
+SHARD_SLUGS = {"내과": "internal", "안과": "eye", "외과": "surgery", "치과": "dental", "피부과": "skin"}
+# 진료과 정보가 없는 문서용 샤드 (라우팅 결과와 관계없이 항상 검색)
+COMMON_SHARD = "common"
+SHARD_NAMES = list(SHARD_SLUGS.values()) + [COMMON_SHARD]
+
+
+def shard_of(metadata: dict) -> str:
+    """문서 메타데이터 -> 샤드 이름"""
+    return SHARD_SLUGS.get(metadata.get("department"), COMMON_SHARD)
+
+
+def shard_collection_name(collection_name: str, shard: str) -> str:
+    return f"{collection_name}_{shard}"
+
+
+def centroid_path(vectorstore_path: str, collection_name: str, shard: str) -> str:
+    """샤드 centroid(라우팅용 평균 임베딩) 저장 경로"""
+    return os.path.join(vectorstore_path, "shard_centroids", f"{shard_collection_name(collection_name, shard)}.npy")
+
+
+# ---------------------------
+# 샤드 구축 (원본 컬렉션 -> 진료과별 컬렉션)
+# ---------------------------
+def build_shards(vectorstore, vectorstore_path: str, shards: Optional[List[str]] = None, page_size: int = 2000) -> Dict[str, int]:
+    """
+    원본 컬렉션의 문서/임베딩을 진료과별 샤드 컬렉션으로 복사하고 centroid를 저장
+    shards: 다시 만들 샤드 이름 리스트 (None이면 전체). 지정한 샤드만 삭제 후 재생성합니다.
+    반환: 샤드별 문서 수
+    """
+    shards = list(shards or SHARD_NAMES)
+    unknown = [shard for shard in shards if shard not in SHARD_NAMES]
+    if unknown:
+        raise ValueError(f"알 수 없는 샤드: {unknown} (가능한 값: {SHARD_NAMES})")
+
+    source = vectorstore._collection
+    client = vectorstore._client
+    total = source.count()
+    if total == 0:
+        raise ValueError("벡터스토어가 비어있습니다.")
+
+    # 대상 샤드 컬렉션 초기화 (거리 함수 등 컬렉션 설정은 원본과 동일하게)
+    targets = {}
+    for shard in shards:
+        name = shard_collection_name(source.name, shard)
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass
+        targets[shard] = client.create_collection(name=name, metadata=source.metadata or None)
+
+    counts = {shard: 0 for shard in shards}
+    centroid_sums = {}
+
+    # 원본을 페이지 단위로 읽으면서 샤드별로 나눠 추가 (전체를 메모리에 올리지 않음)
+    for offset in range(0, total, page_size):
+        page = source.get(limit=page_size, offset=offset, include=["documents", "metadatas", "embeddings"])
+        grouped = defaultdict(lambda: {"ids": [], "documents": [], "metadatas": [], "embeddings": []})
+        for doc_id, text, metadata, embedding in zip(page["ids"], page["documents"], page["metadatas"], page["embeddings"]):
+            shard = shard_of(metadata or {})
+            if shard not in targets:
+                continue
+            grouped[shard]["ids"].append(doc_id)
+            grouped[shard]["documents"].append(text)
+            grouped[shard]["metadatas"].append(metadata)
+            grouped[shard]["embeddings"].append(embedding)
+
+        for shard, batch in grouped.items():
+            targets[shard].add(**batch)
+            counts[shard] += len(batch["ids"])
+
+            vectors = np.asarray(batch["embeddings"], dtype=np.float64)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+            centroid_sums[shard] = centroid_sums.get(shard, 0) + vectors.sum(axis=0)
+
+    for shard in shards:
+        path = centroid_path(vectorstore_path, source.name, shard)
+        if shard in centroid_sums:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            centroid = centroid_sums[shard] / counts[shard]
+            np.save(path, (centroid / (np.linalg.norm(centroid) + 1e-12)).astype(np.float32))
+        elif os.path.exists(path):
+            os.remove(path)
+        print(f"✓ 샤드 {shard}: {counts[shard]}개 문서")
+
+    return counts
+
+
+# ---------------------------
+# 샤드 로드
+# ---------------------------
+class Shard:
+    """샤드 하나 (Chroma 컬렉션 + BM25 인덱스 + 라우팅용 centroid)"""
+
+    def __init__(self, name: str, vectorstore, centroid: Optional[np.ndarray] = None, k: int = 5, bm25_k: int = 4):
+        self.name = name
+        self.vectorstore = vectorstore
+        self.centroid = centroid
+        self.dense = DenseRetriever(vectorstore, k=k)
+        self.bm25 = BM25BatchRetriever.from_documents(load_documents_from_vectorstore(vectorstore), k=bm25_k)
+
+    def __len__(self):
+        return len(self.bm25.docs)
+
+
+def load_shard(vectorstore_path: str, collection_name: str, shard: str, embeddings, client=None,
+               k: int = 5, bm25_k: int = 4) -> Shard:
+    """샤드 하나만 로드 (샤드를 다시 만든 뒤 교체할 때도 사용)"""
+    from langchain_community.vectorstores import Chroma
+
+    vectorstore = Chroma(
+        client=client,
+        persist_directory=None if client is not None else vectorstore_path,
+        collection_name=shard_collection_name(collection_name, shard),
+        embedding_function=embeddings
+    )
+    path = centroid_path(vectorstore_path, collection_name, shard)
+    centroid = np.load(path) if os.path.exists(path) else None
+    return Shard(shard, vectorstore, centroid=centroid, k=k, bm25_k=bm25_k)
+
+
+def load_shards(vectorstore_path: str, collection_name: str, embeddings, shards: Optional[List[str]] = None,
+                client=None, k: int = 5, bm25_k: int = 4) -> Dict[str, Shard]:
+    """샤드 여러 개 로드 (비어있거나 아직 만들지 않은 샤드는 건너뜀)"""
+    import chromadb
+
+    if client is None:
+        client = chromadb.PersistentClient(path=vectorstore_path)
+    existing = {collection.name if hasattr(collection, "name") else collection for collection in client.list_collections()}
+
+    loaded = {}
+    for shard in shards or SHARD_NAMES:
+        if shard_collection_name(collection_name, shard) not in existing:
+            print(f"✗ 샤드 {shard}가 없습니다. build_shards.py로 먼저 생성하세요.")
+            continue
+        try:
+            loaded[shard] = load_shard(vectorstore_path, collection_name, shard, embeddings, client=client, k=k, bm25_k=bm25_k)
+        except ValueError as e:
+            print(f"✗ 샤드 {shard} 로드 건너뜀: {e}")
+    return loaded
+
+
+# ---------------------------
+# 라우터
+# ---------------------------
+class QueryRouter:
+    """
+    질문 -> 검색할 샤드 목록
+    1) 질문에 진료과 키워드가 한 과만 등장하면 그 과 (method="keyword")
+    2) 질문 임베딩과 샤드 centroid의 유사도 softmax에서 상위 샤드 확률이 min_confidence 이상이면
+       상위 max_shards개 안에서 누적 확률이 min_confidence를 넘을 때까지 (method="centroid")
+    3) 그래도 확신이 낮으면 전체 샤드 (method="fallback")
+    common 샤드는 항상 포함합니다.
+    """
+
+    def __init__(self, centroids: Dict[str, np.ndarray], min_confidence: float = 0.6,
+                 max_shards: int = 2, temperature: float = 0.02):
+        self.names = [name for name, centroid in centroids.items() if centroid is not None and name != COMMON_SHARD]
+        self.matrix = np.stack([centroids[name] for name in self.names]) if self.names else None
+        self.min_confidence = min_confidence
+        self.max_shards = max_shards
+        self.temperature = temperature
+
+    def route(self, question: str, query_embedding=None) -> dict:
+        """반환: {"shards": [...], "method": ..., "confidence": float}"""
+        department = detect_filters(question).get("department")
+        if department in SHARD_SLUGS:
+            return {"shards": [SHARD_SLUGS[department]], "method": "keyword", "confidence": 1.0}
+
+        if self.matrix is None or query_embedding is None:
+            return {"shards": list(self.names), "method": "fallback", "confidence": 0.0}
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        similarities = self.matrix @ (query / (np.linalg.norm(query) + 1e-12))
+        logits = (similarities - similarities.max()) / self.temperature
+        probs = np.exp(logits) / np.exp(logits).sum()
+        order = np.argsort(probs)[::-1]
+
+        selected, cumulative = [], 0.0
+        for i in order[:self.max_shards]:
+            selected.append(self.names[i])
+            cumulative += float(probs[i])
+            if cumulative >= self.min_confidence:
+                return {"shards": selected, "method": "centroid", "confidence": cumulative}
+        return {"shards": list(self.names), "method": "fallback", "confidence": float(probs[order[0]])}
+
+
+# ---------------------------
+# 샤드 리트리버
+# ---------------------------
+class ShardedRetriever:
+    """
+    라우팅된 샤드만 검색하는 앙상블 리트리버 (EnsembleRetriever와 같은 invoke/batch 인터페이스)
+    질문 임베딩은 한 번만 계산해서 라우팅과 모든 샤드의 Dense 검색에 재사용합니다.
+    샤드별 결과는 Dense는 거리, BM25는 점수로 합쳐 상위 k개를 고른 뒤 순위 기반으로 결합합니다.
+    (BM25 idf는 샤드마다 다르므로 여러 샤드에 걸친 BM25 점수 비교는 근사입니다)
+    """
+
+    def __init__(self, shards: Dict[str, Shard], router: QueryRouter, embeddings,
+                 weights: Optional[List[float]] = None, k: int = 5, bm25_k: int = 4,
+                 cutoff: Optional[AdaptiveCutoff] = None):
+        if not shards:
+            raise ValueError("로드된 샤드가 없습니다.")
+        self.shards = shards
+        self.router = router
+        self.embeddings = embeddings
+        self.weights = weights or [0.5, 0.5]
+        self.k = k
+        self.bm25_k = bm25_k
+        self.cutoff = cutoff
+        self.last_routes: List[dict] = []
+
+    def reload_shard(self, shard: Shard):
+        """다시 만든 샤드로 교체 (다른 샤드는 그대로)"""
+        self.shards[shard.name] = shard
+        if shard.centroid is not None and shard.name != COMMON_SHARD:
+            centroids = {name: s.centroid for name, s in self.shards.items()}
+            self.router = QueryRouter(centroids, self.router.min_confidence, self.router.max_shards, self.router.temperature)
+
+    def _embed_queries(self, queries: List[str]):
+        with stage("query_embedding"):
+            if hasattr(self.embeddings, "embed_queries"):
+                return self.embeddings.embed_queries(queries)
+            if len(queries) == 1:
+                return [self.embeddings.embed_query(queries[0])]
+            return self.embeddings.embed_documents(queries)
+
+    def _route(self, query: str, query_embedding, query_filters: Optional[dict]) -> dict:
+        # 진료과 필터가 명시되어 있으면 라우터보다 필터 우선
+        departments = normalize_filters(query_filters).get("department")
+        if departments:
+            route = {"shards": [SHARD_SLUGS[d] for d in departments if d in SHARD_SLUGS],
+                     "method": "filter", "confidence": 1.0}
+        else:
+            route = self.router.route(query, query_embedding)
+            route["shards"] = route["shards"] + [COMMON_SHARD]
+        route["shards"] = [shard for shard in route["shards"] if shard in self.shards]
+        return route
+
+    def invoke(self, query: str, filters: Optional[dict] = None) -> List[Document]:
+        return self.batch([query], filters=filters)[0]
+
+    def batch(self, queries: List[str], filters=None) -> List[List[Document]]:
+        """
+        여러 질문을 한 번에 검색 (샤드별로 해당 샤드에 라우팅된 질문만 모아서 batch 검색)
+        filters: 모든 질문 공통 dict 또는 질문별 dict 리스트
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        if filters is None or isinstance(filters, dict):
+            per_query = [filters] * len(queries)
+        else:
+            per_query = list(filters)
+
+        query_embeddings = self._embed_queries(queries)
+        routes = [self._route(q, emb, f) for q, emb, f in zip(queries, query_embeddings, per_query)]
+        self.last_routes = routes
+
+        # 샤드 -> 그 샤드로 라우팅된 질문 인덱스
+        by_shard = defaultdict(list)
+        for i, route in enumerate(routes):
+            for shard in route["shards"]:
+                by_shard[shard].append(i)
+
+        dense_hits = [[] for _ in queries]
+        bm25_hits = [[] for _ in queries]
+        for shard_name, indices in by_shard.items():
+            shard = self.shards[shard_name]
+            shard_filters = [per_query[i] for i in indices]
+            dense = shard.dense.search_by_embeddings([query_embeddings[i] for i in indices],
+                                                     filters=shard_filters, with_scores=True)
+            bm25 = shard.bm25.batch_with_scores([queries[i] for i in indices], filters=shard_filters)
+            for i, dense_pairs, bm25_pairs in zip(indices, dense, bm25):
+                dense_hits[i].extend(dense_pairs)
+                bm25_hits[i].extend(bm25_pairs)
+
+        results = []
+        for dense_pairs, bm25_pairs in zip(dense_hits, bm25_hits):
+            dense_docs = [doc for doc, _ in sorted(dense_pairs, key=lambda x: x[1])[:self.k]]
+            bm25_docs = [doc for doc, _ in sorted(bm25_pairs, key=lambda x: x[1], reverse=True)[:self.bm25_k]]
+            results.append(fuse_results([dense_docs, bm25_docs], self.weights, cutoff=self.cutoff))
+        return results
+
+
+def load_sharded_retriever(vectorstore_path: str, collection_name: str, embeddings,
+                           shards: Optional[List[str]] = None, k: int = 5, client=None,
+                           cutoff: Optional[AdaptiveCutoff] = None, **router_kwargs) -> ShardedRetriever:
+    """샤드 로드 + 라우터 생성 -> ShardedRetriever (cutoff: 결합 결과 적응형 자르기)"""
+    loaded = load_shards(vectorstore_path, collection_name, embeddings, shards=shards, client=client, k=k)
+    router = QueryRouter({name: shard.centroid for name, shard in loaded.items()}, **router_kwargs)
+    return ShardedRetriever(loaded, router, embeddings, k=k, cutoff=cutoff)
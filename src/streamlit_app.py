@@ -1,4 +1,5 @@
 import os
+import time
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -9,11 +10,17 @@ from dotenv import load_dotenv
 from prompt_module import (
     initialize_rag_system,
     get_rag_prompt,
-    get_rewrite_prompt,
-    format_docs,
-    self_check_retriver
+    get_rewrite_prompt
 )
-
+from rag_components import setup_langsmith, warm_up
+from rag_service import (INDEX_SYNC_INTERVAL, attach_index_updater, build_service_graph, load_faq_answers,
+                         make_fallback_answer, new_deadline, retrieval_options, stream_generation)
+from instrumentation import configure_metrics, stage, trace_request
+from llm_governor import is_rate_limit_error
+
+from answer_cache import SemanticAnswerCache
+from metadata_filter import DEPARTMENTS, LIFE_CYCLES, detect_filters
+from rag_graph import NO_DOCS_ANSWER, run_rag_graph, format_timings
 from langchain_core.output_parsers import StrOutputParser
 
 
@@ -81,6 +88,7 @@ if not OPENAI_API_KEY:
 
 VECTORSTORE_PATH = r"..\data\ChromaDB_bge_m3"
 COLLECTION_NAME = "pet_health_qa_system_bge_m3"
+# 문서 검증 방식 / context 예산 / 청크 합치기 / 압축 설정은 rag_service.py 참고 (.env)
 
 st.set_page_config(
     page_title="반려견 질병 Q&A",
@@ -94,15 +102,51 @@ st.set_page_config(
 # ---------------------------
 @st.cache_resource
 def load_rag_system():
-    """RAG 시스템 한 번만 로드"""
-    return initialize_rag_system(
+    """RAG 시스템 한 번만 로드 (로드 직후 워밍업으로 첫 질문 지연 제거)"""
+    setup_langsmith()
+    # 로컬 계측: 질문별 JSONL 로그 + (RAG_METRICS_PORT가 있으면) Prometheus /metrics 엔드포인트
+    configure_metrics(log_path=os.getenv("RAG_METRICS_LOG", r"..\output\request_metrics.jsonl"),
+                      port=int(os.getenv("RAG_METRICS_PORT", "0")) or None)
+    rag_system = initialize_rag_system(
         vectorstore_path=VECTORSTORE_PATH,
-        collection_name=COLLECTION_NAME
+        collection_name=COLLECTION_NAME,
+        **retrieval_options()
     )
+    warm_up(rag_system)
+    return rag_system
+
+
+@st.cache_resource
+def load_answer_cache(_embeddings):
+    """시맨틱 답변 캐시 (세션 간 공유)"""
+    return SemanticAnswerCache(_embeddings, threshold=0.95, max_entries=500, ttl=24 * 3600)
+
+
+@st.cache_resource
+def load_rag_graph():
+    """질문 처리 그래프 (검색+self-check / rewrite 병렬 -> 생성, HTTP API와 같은 구성)"""
+    return build_service_graph(rag_system, VECTORSTORE_PATH, answer_cache=answer_cache)
+
+
+@st.cache_resource
+def load_faq():
+    """자주 묻는 질문의 미리 만든 답변 (FAQ_ANSWERS=1, 인덱스가 바뀌었으면 백그라운드에서 다시 생성)"""
+    return load_faq_answers(rag_system, VECTORSTORE_PATH, COLLECTION_NAME, load_rag_graph())
+
+
+@st.cache_resource
+def load_index_updater():
+    """증분 인덱스 갱신기 (ingest_records.py로 추가한 상담기록을 재시작 없이 BM25 / 질병명 인덱스에 반영)"""
+    return attach_index_updater(rag_system, load_rag_graph(), answer_cache, faq_answers)
 
 
 # RAG 시스템 로드
 rag_system = load_rag_system()
+answer_cache = load_answer_cache(rag_system['embeddings'])
+# 인덱스가 바뀌었으면 이전 답변 전체 무효화
+answer_cache.set_index_version(rag_system['index_version'])
+faq_answers = load_faq()
+index_updater = load_index_updater()
 
 if "retriever" not in st.session_state:
     st.session_state.retriever = rag_system['retriever']
@@ -120,6 +164,75 @@ if "message_docs" not in st.session_state:
     st.session_state.message_docs = {}
 
 
+# ---------------------------
+# 질문 처리 파이프라인
+# ---------------------------
+def prepare_answer(q, filters=None, deadline=None):
+    """
+    검색(+self-check)과 rewrite를 동시에 실행하고 생성 직전(context)까지 준비
+    filters: 메타데이터 필터 (진료과/생애주기) - 검색 단계에서 후보 문서를 줄임
+    deadline: 요청 마감 시간 - 시간이 부족하면 self-check / rewrite 생략, context 축소, 대체 답변(result["answer"])
+    """
+    result = run_rag_graph(load_rag_graph(), q, filters=filters, skip_generate=True, deadline=deadline)
+    print(f"[파이프라인] {format_timings(result['timings'])}")
+    if result.get("degraded"):
+        print(f"[마감 시간] 적용: {', '.join(result['degraded'])}")
+    compression = result.get("compression_stats")
+    if compression:
+        print(f"[압축] {compression['chars_after']}/{compression['chars_before']}자 ({compression['ratio']:.0%}) / "
+              f"문장 {compression['sentences_after']}/{compression['sentences_before']}개 / {compression['seconds']:.2f}s")
+    stats = result.get("context_stats")
+    if stats:
+        print(f"[context] {stats['tokens']}/{stats['budget']} 토큰 (예산 적용 전 {stats['tokens_before']}) / "
+              f"문서 {stats['docs_used']}/{stats['docs_in']}개 사용, {stats['docs_trimmed']}개 잘림")
+    return result
+
+
+def stream_answer(result, placeholder, start_time, deadline=None):
+    """
+    답변을 토큰 단위로 생성하면서 채팅 말풍선에 바로 표시
+    deadline이 지나면 생성을 멈춤 (첫 토큰 전이면 대체 답변, 생성 중이면 그때까지의 답변 + 안내)
+    반환: (답변, 첫 토큰까지 걸린 시간(초) - 질문 전송 시점 기준, 마감 시간 때문에 적용한 항목)
+    """
+    rag_chain = st.session_state.rag_prompt | st.session_state.llm | StrOutputParser()
+
+    ai_response = ""
+    time_to_first_token = None
+    degraded = []
+    with stage("generate"):
+        for chunk in stream_generation(rag_chain, result, deadline, make_fallback_answer(answer_cache), degraded):
+            if time_to_first_token is None:
+                time_to_first_token = time.perf_counter() - start_time
+            ai_response += chunk
+            placeholder.markdown(render_ai_message(ai_response + "▌"), unsafe_allow_html=True)
+
+    placeholder.markdown(render_ai_message(ai_response), unsafe_allow_html=True)
+    return ai_response, time_to_first_token, degraded
+
+
+def render_user_message(content):
+    """사용자 메시지 말풍선 (오른쪽, 노란색)"""
+    return f"""
+                        <div style="display: flex; justify-content: flex-end; margin-bottom: 16px;">
+                            <div style="background-color: #FFF9E6; padding: 14px 18px; border-radius: 16px; max-width: 80%; word-wrap: break-word;">
+                                <span style="color: #333; font-size: 15px; line-height: 1.5;">{content}</span>
+                            </div>
+                        </div>
+                        """
+
+
+def render_ai_message(content):
+    """AI 메시지 말풍선 (왼쪽, 흰색)"""
+    return f"""
+                        <div style="display: flex; justify-content: flex-start; margin-bottom: 16px;">
+                            <div style="background-color: #F0F4F8; padding: 14px 18px; border-radius: 16px; max-width: 80%; word-wrap: break-word;">
+                                <strong style="color: #1e40af; font-size: 13px;">🐶 수의사 AI</strong><br>
+                                <span style="color: #333; font-size: 14px; line-height: 1.6; margin-top: 6px; display: block;">{content}</span>
+                            </div>
+                        </div>
+                        """
+
+
 # ---------------------------
 # 채팅 페이지
 # ---------------------------
@@ -151,32 +264,21 @@ def show_chat():
             for idx, message in enumerate(st.session_state.chat_messages):
                 if message["role"] == "user":
                     # 사용자 메시지 (오른쪽, 노란색)
-                    st.markdown(
-                        f"""
-                        <div style="display: flex; justify-content: flex-end; margin-bottom: 16px;">
-                            <div style="background-color: #FFF9E6; padding: 14px 18px; border-radius: 16px; max-width: 80%; word-wrap: break-word;">
-                                <span style="color: #333; font-size: 15px; line-height: 1.5;">{message['content']}</span>
-                            </div>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
+                    st.markdown(render_user_message(message['content']), unsafe_allow_html=True)
                 else:
                     # AI 메시지 (왼쪽, 흰색)
-                    st.markdown(
-                        f"""
-                        <div style="display: flex; justify-content: flex-start; margin-bottom: 16px;">
-                            <div style="background-color: #F0F4F8; padding: 14px 18px; border-radius: 16px; max-width: 80%; word-wrap: break-word;">
-                                <strong style="color: #1e40af; font-size: 13px;">🐶 수의사 AI</strong><br>
-                                <span style="color: #333; font-size: 14px; line-height: 1.6; margin-top: 6px; display: block;">{message['content']}</span>
-                            </div>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
+                    st.markdown(render_ai_message(message['content']), unsafe_allow_html=True)
         
-        # 입력 폼
+        # 검색 필터 (자동 감지 또는 직접 선택)
         st.markdown("---")
+        with st.expander("🔎 검색 필터", expanded=False):
+            col_dept, col_life = st.columns(2)
+            with col_dept:
+                department_option = st.selectbox("진료과", ["자동 감지", "전체"] + DEPARTMENTS, key="filter_department")
+            with col_life:
+                life_cycle_option = st.selectbox("생애주기 (상담기록만 검색)", ["전체"] + LIFE_CYCLES, key="filter_life_cycle")
+        
+        # 입력 폼
         with st.form(key=f"chat_form_{st.session_state.submit_count}", border=True):
             col1, col2 = st.columns([5, 1], gap="small")
             with col1:
@@ -196,49 +298,92 @@ def show_chat():
                 "content": user_input.strip()
             })
 
-            with st.spinner("답변을 준비 중입니다..."):
-                try:
-                    q = user_input.strip()
-                    
-                    # 1. 벡터스토어에서 문서 검색
-                    docs = st.session_state.retriever.invoke(q)
-                    
-                    # 1-1. self_check_retriver로 문서 검증 (질문과 관련 있는 문서만 필터링)
-                    docs = self_check_retriver(docs, q, st.session_state.llm)
+            try:
+                q = user_input.strip()
+                # 다른 프로세스가 추가한 상담기록 반영 (INDEX_SYNC_INTERVAL초마다 확인, 반영되면 답변 캐시 무효화)
+                if index_updater is not None:
+                    index_updater.sync(min_interval=INDEX_SYNC_INTERVAL)
+                start_time = time.perf_counter()
+                # 질문 1개 지연시간 예산 (.env RAG_DEADLINE_S, 설정하지 않으면 제한 없음)
+                deadline = new_deadline()
+                
+                # 검색 필터 구성
+                manual_filters = {}
+                if department_option not in ("자동 감지", "전체"):
+                    manual_filters["department"] = department_option
+                if life_cycle_option != "전체":
+                    manual_filters["lifeCycle"] = life_cycle_option
+                if manual_filters:
+                    filters = manual_filters
+                elif department_option == "자동 감지":
+                    filters = detect_filters(q)
+                else:
+                    filters = {}
+                
+                # 0. 미리 만든 FAQ 답변 -> 시맨틱 답변 캐시 확인 (거의 같은 질문이면 저장된 답변 사용)
+                #    직접 고른 필터가 있으면 결과가 달라지므로 캐시를 사용하지 않음
+                cached = None
+                if not manual_filters:
+                    cached = (faq_answers.lookup(q) if faq_answers else None) or answer_cache.lookup(q)
+                time_to_first_token = None
+                
+                if cached:
+                    ai_response = cached['answer']
+                    docs_to_save = cached['docs']
+                else:
+                    # 질문 1개 단위 계측 (단계별 시간 / 토큰 -> 히스토그램, JSONL 로그)
+                    with trace_request(q):
+                        # 1. 검색 + self-check / rewrite (생성 직전까지)
+                        with st.spinner("관련 문서를 찾는 중입니다..."):
+                            result = prepare_answer(q, filters=filters, deadline=deadline)
+                        degraded = list(result.get("degraded") or [])
                     
-                    if not docs:
-                        ai_response = "죄송합니다. 관련된 정보를 찾을 수 없습니다. 더 구체적으로 설명해주시겠어요?"
-                        docs_to_save = []
-                    else:
-                        # 2. 문서 포맷팅
-                        context = format_docs(docs)
+                        if not result.get("docs"):
+                            ai_response, docs_to_save = NO_DOCS_ANSWER, []
+                        elif result.get("answer"):
+                            # 생성할 시간이 없어 대체 답변(캐시 / 검색 문서)을 사용한 경우
+                            ai_response = result["answer"]
+                            docs_to_save = filter_used_documents(result["docs"], ai_response)
+                        else:
+                            # 2. 답변을 토큰 단위로 스트리밍 (방금 보낸 질문과 함께 채팅창에 바로 표시)
+                            with chat_container:
+                                st.markdown(render_user_message(q), unsafe_allow_html=True)
+                                placeholder = st.empty()
+                            ai_response, time_to_first_token, stream_degraded = stream_answer(
+                                result, placeholder, start_time, deadline)
+                            degraded += stream_degraded
                         
-                        # 3. 질문 변환 (rewrite chain)
-                        rewrite_chain = st.session_state.rewrite_prompt | st.session_state.llm | StrOutputParser()
-                        transformed = rewrite_chain.invoke({"question": q})
-                        
-                        # 4. RAG 체인 실행
-                        rag_chain = st.session_state.rag_prompt | st.session_state.llm | StrOutputParser()
-                        ai_response = rag_chain.invoke({"context": context, "question": transformed})
-                        
-                        # 5. 응답에 실제로 사용된 문서만 필터링
-                        docs_to_save = filter_used_documents(docs, ai_response)
-                    
-                    # AI 응답 추가
-                    message_idx = len(st.session_state.chat_messages)
-                    st.session_state.chat_messages.append({
-                        "role": "assistant",
-                        "content": ai_response
-                    })
+                            # 3. 생성이 끝난 뒤 실제로 사용된 문서만 참고 문서 패널에 표시
+                            docs_to_save = filter_used_documents(result["docs"], ai_response)
                     
-                    # 해당 메시지의 문서 저장 (문서가 있을 때만)
-                    if docs_to_save:
-                        st.session_state.message_docs[message_idx] = docs_to_save
-                    
-                    # submit_count 증가하여 form key 변경 -> 입력창 초기화
-                    st.session_state.submit_count += 1
-                    st.rerun()
-                except Exception as e:
+                        # 문서 기반으로 생성된 답변만 캐시에 저장 (마감 시간 때문에 단계를 줄인 답변은 제외)
+                        if docs_to_save and not manual_filters and not degraded:
+                            answer_cache.put(q, ai_response, docs_to_save, latency=time.perf_counter() - start_time)
+
+                total_latency = time.perf_counter() - start_time
+                st.session_state.last_latency = (time_to_first_token, total_latency)
+                print(f"[지연시간] 첫 토큰 {time_to_first_token:.2f}s / 전체 {total_latency:.2f}s" if time_to_first_token is not None
+                      else f"[지연시간] 전체 {total_latency:.2f}s (스트리밍 없음)")
+
+                # AI 응답 추가
+                message_idx = len(st.session_state.chat_messages)
+                st.session_state.chat_messages.append({
+                    "role": "assistant",
+                    "content": ai_response
+                })
+                
+                # 해당 메시지의 문서 저장 (문서가 있을 때만)
+                if docs_to_save:
+                    st.session_state.message_docs[message_idx] = docs_to_save
+                
+                # submit_count 증가하여 form key 변경 -> 입력창 초기화
+                st.session_state.submit_count += 1
+                st.rerun()
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    # 공용 조절기(llm_governor.py)가 백오프 후 재시도했는데도 한도에 걸린 경우
+                    st.warning("지금 질문이 많아 OpenAI 사용량 한도에 걸렸습니다. 잠시 후 다시 질문해주세요.")
+                else:
                     st.error(f"오류가 발생했습니다: {str(e)}")
         
         # 초기화 버튼
@@ -246,7 +391,21 @@ def show_chat():
             st.session_state.chat_messages = []
             st.session_state.message_docs = {}
             st.rerun()
-    
+
+        # 답변 캐시 지표
+        cache_metrics = answer_cache.metrics()
+        st.caption(
+            f"답변 캐시 적중률 {cache_metrics['hit_rate']:.0%} "
+            f"({cache_metrics['hits']}/{cache_metrics['hits'] + cache_metrics['misses']}) · "
+            f"절약한 시간 {cache_metrics['saved_seconds']:.1f}초"
+        )
+        if st.session_state.get("last_latency"):
+            time_to_first_token, total_latency = st.session_state.last_latency
+            st.caption(
+                (f"마지막 답변: 첫 토큰 {time_to_first_token:.1f}초 · " if time_to_first_token is not None else "마지막 답변: ")
+                + f"전체 {total_latency:.1f}초"
+            )
+
     # 왼쪽 열: 참고 문서 표시
     with col_docs:
         st.markdown("### 📚 참고 문서")
@@ -0,0 +1,60 @@
+'''
+chunk_stitching.py 테스트 (같은 서적의 다른 레코드 청크가 섞이지 않는지)
+
+실행: python -m pytest test_chunk_stitching.py
+'''
+
+from langchain_core.documents import Document
+
+from chunk_stitching import _where, record_key, stitch_chunks
+
+# preprocessing.py의 의학지식 청크 메타데이터 (같은 서적 / 진료과 / 폴더)
+BOOK_META = {"title": "반려견 내과학", "author": "저자", "publisher": "출판사", "department": "내과",
+             "source_type": "medical data", "source_path": r"..\data\말뭉치\TS_말뭉치데이터_내과"}
+
+
+def chunk(record_id, chunk_index, text, total_chunks=2):
+    metadata = {**BOOK_META, "chunk_index": chunk_index, "total_chunks": total_chunks, "chunk_method": "medical data"}
+    if record_id is not None:
+        metadata["record_id"] = record_id
+    return Document(page_content=text, metadata=metadata, id=f"{record_id}-{chunk_index}")
+
+
+def test_same_book_records_are_not_merged():
+    docs = [chunk("A.json", 0, "파보 장염 설명"), chunk("B.json", 0, "심장사상충 설명"), chunk("C.json", 1, "슬개골 탈구 치료")]
+
+    stitched = stitch_chunks(docs)
+
+    assert [doc.page_content for doc in stitched] == [doc.page_content for doc in docs]
+
+
+def test_same_record_chunks_are_merged_without_overlap():
+    docs = [chunk("A.json", 1, "구토가 계속되면 병원에 내원합니다."), chunk("B.json", 0, "심장사상충 설명"),
+            chunk("A.json", 0, "파보 장염은 구토가 계속되면")]
+
+    stitched = stitch_chunks(docs)
+
+    assert [doc.page_content for doc in stitched] == ["파보 장염은 구토가 계속되면 병원에 내원합니다.", "심장사상충 설명"]
+    assert stitched[0].metadata["chunk_indices"] == [0, 1]
+
+
+def test_chunks_without_record_id_are_left_alone():
+    docs = [chunk(None, 0, "파보 장염 설명"), chunk(None, 1, "슬개골 탈구 치료")]
+
+    assert record_key(docs[0].metadata) is None
+    assert stitch_chunks(docs) == docs
+
+
+def test_gap_is_filled_only_from_same_record():
+    docs = [chunk("A.json", 0, "첫 문단", total_chunks=3), chunk("A.json", 2, "셋째 문단", total_chunks=3)]
+    requests = []
+
+    def fetch(metadata, chunk_indices):
+        requests.append(_where(metadata, chunk_indices))
+        # 같은 서적의 다른 레코드 청크가 섞여 와도 사용하지 않음
+        return [chunk("B.json", 1, "다른 질병 문단", total_chunks=3), chunk("A.json", 1, "둘째 문단", total_chunks=3)]
+
+    stitched = stitch_chunks(docs, fetch_neighbors=fetch)
+
+    assert [doc.page_content for doc in stitched] == ["첫 문단\n둘째 문단\n셋째 문단"]
+    assert {"record_id": "A.json"} in requests[0]["$and"]
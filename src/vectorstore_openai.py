@@ -6,7 +6,7 @@ api_key = os.environ.get('OPENAI_API_KEY')
 if not api_key:
     raise ValueError('OPENAI_API_KEY not set')
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+from llm_governor import BACKGROUND, GovernedOpenAIEmbeddings
 import pickle
 import time
 
@@ -16,7 +16,8 @@ with open(r"..\data\chunked_docs.pkl", "rb") as f:
     final_docs = pickle.load(f)
 
 
-embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
+# 인덱싱은 낮은 우선순위, 429는 공용 조절기가 백오프 후 재시도
+embedding_model = GovernedOpenAIEmbeddings(model="text-embedding-3-small", priority=BACKGROUND)
 
 # 배치 크기 설정 (토큰 제한 고려)
 BATCH_SIZE = 100  # 한 번에 처리할 문서 수